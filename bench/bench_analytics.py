@@ -0,0 +1,49 @@
+"""
+A benchmark of computing epidemic curves over many events.
+
+Times adding synthetic events to the columns analytics are computed over (as
+rows are loaded by Database), then computing the epidemic curve from them
+with NumPy.
+
+usage: python -m bench.bench_analytics [number_of_events ...]
+"""
+
+_EVENT_TYPES = ["new_patient", "patient_infected", "treatment", "recovered"]
+_LOCATIONS = [f"location {i}" for i in range(50)]
+
+def _sample_rows(n):
+    import random
+    from datetime import datetime, timedelta
+    start = datetime(2022, 1, 1)
+    rng = random.Random(0)
+
+    for _ in range(n):
+        yield {
+            "event_type": rng.choice(_EVENT_TYPES),
+            "location": rng.choice(_LOCATIONS),
+            "_timestamp": start + timedelta(seconds=rng.randrange(365 * 24 * 60 * 60)),
+        }
+
+def main(*sizes):
+    import timeit
+    from src.Analytics import Event_Columns, epicurve
+
+    for n in sizes or (1000000, 10000000):
+        columns = Event_Columns()
+
+        rows = list( _sample_rows(n) )
+        start = timeit.default_timer()
+        for row in rows:
+            columns.add(row)
+        elapsed = timeit.default_timer() - start
+        del rows
+        print(f"{n:>10} events: {elapsed / n * 1e6:.2f} us/event to add")
+
+        #take the best of several runs, to discount noise
+        #see: https://docs.python.org/3/library/timeit.html#timeit.Timer.repeat
+        best = min( timeit.repeat(lambda: epicurve(columns), number=1, repeat=5) )
+        print(f"{n:>10} events: {best * 1e3:.1f} ms per epicurve")
+
+if __name__ == '__main__':
+    import sys
+    main(*[int(arg) for arg in sys.argv[1:]])
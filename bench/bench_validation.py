@@ -0,0 +1,42 @@
+"""
+A micro-benchmark of the per-row cost of validating and standardizing input.
+
+Compares constructing a Validation_and_Standardization for each row (as the
+module-level entrypoints once did) against the compiled schema.
+
+usage: python -m bench.bench_validation [number_of_rows]
+"""
+
+def _sample_row():
+    return {
+        "doctor": "Dr. Smith",
+        "patient": "Albus Dumbledor",
+        "event_type": "treatment",
+        "location": "Calgary, AB",
+        "notes": "beginning Watusi-treatment.",
+        "_user": "smith",
+    }
+
+def _per_call_construction(row):
+    from src.Validation_and_Standardization_Handler import Validation_and_Standardization
+    Validation_and_Standardization().validate(row)
+    return Validation_and_Standardization().standardize(row)
+
+def _compiled(row):
+    from src.Validation_and_Standardization_Handler import validate_and_standardize
+    return validate_and_standardize( dict(row) )
+
+def main(n=100000):
+    import timeit
+    row = _sample_row()
+
+    for name, func in [("per-call construction", _per_call_construction),
+            ("compiled schema", _compiled)]:
+        #take the best of several runs, to discount noise
+        #see: https://docs.python.org/3/library/timeit.html#timeit.Timer.repeat
+        best = min( timeit.repeat(lambda: func(row), number=n, repeat=5) )
+        print(f"{name:>24}: {best / n * 1e6:.2f} us/row")
+
+if __name__ == '__main__':
+    import sys
+    main(*[int(arg) for arg in sys.argv[1:]])
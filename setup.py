@@ -14,6 +14,14 @@ setup(
         'tinydb',
         'tinydb-serialization',
     ],
+    extras_require={
+        #faster JSON decoding of requests, used when installed
+        'fast': ['orjson'],
+        #vectorized analytics, see the Analytics module
+        'analytics': ['numpy'],
+        #zstd compression of responses, alongside gzip
+        'zstd': ['zstandard'],
+    },
     entry_points={
         "console_scripts": [
             "zombie_dance_disease_tracker = src.__main__:main"
@@ -0,0 +1,251 @@
+"""
+Analytics module
+
+Epidemic curves, computed with vectorized operations over columns of the
+rows held by Database; Rather than looping over the rows themselves.
+
+Columns are kept in compact arrays of the standard library, added to as rows
+are loaded, and only read as NumPy arrays when analysed. So NumPy is only
+needed for analytics, see the `analytics` extra of setup.py.
+    see:
+    https://numpy.org/doc/stable/reference/generated/numpy.frombuffer.html
+
+Event_Columns
+The main class of the module. Columns of the day of the `_timestamp`, the
+`event_type` and the `location` of each row.
+
+epicurve()
+Daily incidence, growth rate and doubling time, by location.
+"""
+
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+_DAY = timedelta(days=1)
+
+#the most days a range of days given to `epicurve()` may span; As the arrays
+#of an epidemic curve are sized by the number of days times the number of
+#locations
+MAX_DAYS = 3660
+
+class Event_Columns:
+    """
+    The Event_Columns class.
+
+    Holds the day of the `_timestamp` of each row, as days since the epoch
+    (taken as a time in local time, as timestamps are stored); And the
+    `event_type` and `location` of each row as integer codes, with the value
+    of each code held once. Each column is of 4 byte integers, as the
+    columns are copied whenever they are analysed.
+    """
+    def __init__(self):
+        import threading
+        from array import array
+
+        self._days = array("i")
+        self._event_types = array("i")
+        self._locations = array("i")
+
+        #the value of each code, and the code of each value
+        self.event_types = list()
+        self.locations = list()
+        self._event_type_codes = dict()
+        self._location_codes = dict()
+
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._days)
+
+    def __getstate__(self):
+        #locks can't be pickled, see `Database.compact()`
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        import threading
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, row):
+        """
+        Add a row to the columns.
+
+        :param row: dictionary
+        :return: None
+        """
+        with self._lock:
+            self._days.append( _day(row["_timestamp"]) )
+            self._event_types.append( _code(
+                self._event_type_codes, self.event_types, row.get("event_type")
+                ) )
+            self._locations.append( _code(
+                self._location_codes, self.locations, row.get("location")
+                ) )
+
+    def code_of(self, field, value):
+        """
+        :param field: string, `event_type` or `location`
+        :param value: string
+        :return: integer, the code of `value`; Or None if no row holds it
+        """
+        codes = {
+            "event_type": self._event_type_codes,
+            "location": self._location_codes,
+        }[field]
+
+        return codes.get(value)
+
+    def arrays(self):
+        """
+        Copy the columns into NumPy arrays. The columns are copied, as the
+        arrays of the standard library can't grow while NumPy reads them.
+
+        :return: tuple, of the days, event type codes, and location codes;
+        Each a NumPy array
+        """
+        import numpy as np
+
+        with self._lock:
+            return tuple(
+                np.frombuffer(column[:], dtype=np.int32)
+                for column in [self._days, self._event_types, self._locations]
+                )
+
+def _code(codes, values, value):
+    """
+    The integer code of a value, giving it the next code if new.
+
+    :param codes: dictionary, mapping values to their codes
+    :param values: list, the value of each code
+    :param value: the value
+    :return: integer
+    """
+    code = codes.get(value)
+
+    if code is None:
+        code = len(values)
+        codes[value] = code
+        values.append(value)
+
+    return code
+
+def epicurve(columns, event_type="patient_infected", window=7, since=None,
+        until=None, location=None):
+    """
+    The daily incidence of an event type, by location; Alongside the rolling
+    growth rate of incidence, and the doubling time that rate implies.
+
+    Over each day, the growth rate is the rate of exponential growth between
+    the incidence of the `window` days ending that day, and of the `window`
+    days before those (so is first given on day `2 * window - 1`):
+        growth_rate = ln(this window / last window) / window
+        doubling_time = ln(2) / growth_rate
+    Left as NaN where either window is empty, and the doubling time left as
+    infinite where incidence isn't growing.
+    see: https://en.wikipedia.org/wiki/Doubling_time
+
+    Raises ValueError where `since` or `until` are given, and the days counted
+    would span more than `MAX_DAYS`.
+
+    :param columns: Event_Columns
+    :param event_type: string, the event type counted as an incident case
+    :param window: integer, the number of days of each window
+    :param since: datetime, the first day counted, or None from the first
+    day holding a case
+    :param until: datetime, the day after the last day counted, or None to
+    the last day holding a case
+    :param location: string, the only location counted, or None for every
+    location
+    :return: dictionary, with `days` the first datetime of each day counted,
+    `locations` the location of each row of the arrays that follow, and the
+    `incidence`, `growth_rate` and `doubling_time` of each location on each
+    day; As 2 dimensional NumPy arrays
+    """
+    import numpy as np
+
+    days, event_types, locations = columns.arrays()
+
+    code = columns.code_of("event_type", event_type)
+    if code is None:
+        selected = np.zeros(len(event_types), dtype=bool)
+    else:
+        selected = (event_types == code)
+
+    #a single location is selected before counting, so the arrays that follow
+    #are sized for it alone
+    names = list(columns.locations)
+    if not location is None:
+        location_code = columns.code_of("location", location)
+        if location_code is None:
+            names = []
+            selected[:] = False
+        else:
+            names = [location]
+            selected &= (locations == location_code)
+            locations = np.zeros(len(locations), dtype=locations.dtype)
+
+    days = days[selected]
+    locations = locations[selected].astype(np.int64)
+
+    #an open end of the range of days is taken from the days holding cases;
+    #Or, with none, from the other end of the range, so no days are counted
+    first = _day(since) if not since is None else None
+    last = _day(until) if not until is None else None
+    if first is None:
+        first = int(days.min()) if len(days) else (last if not last is None else 0)
+    if last is None:
+        last = int(days.max()) + 1 if len(days) else first
+    n_days = max(int(last - first), 0)
+
+    if ((not since is None) or (not until is None)) and (n_days > MAX_DAYS):
+        raise ValueError(f"The range of days should span at most {MAX_DAYS} days.")
+
+    in_range = (days >= first) & (days < last)
+    days = days[in_range] - first
+    locations = locations[in_range]
+
+    #count the cases of each location on each day with a single histogram
+    #see: https://numpy.org/doc/stable/reference/generated/numpy.bincount.html
+    n_locations = len(names)
+    incidence = np.bincount(
+        locations * n_days + days, minlength=n_locations * n_days
+        ).reshape(n_locations, n_days)
+
+    #the cases of the `window` days ending each day, from a running total
+    totals = np.zeros((n_locations, n_days + 1), dtype=np.int64)
+    np.cumsum(incidence, axis=1, out=totals[:, 1:])
+    ends = np.arange(1, n_days + 1)
+    starts = np.maximum(ends - window, 0)
+    windows = (totals[:, ends] - totals[:, starts]).astype(np.float64)
+
+    #each full window, against the full window before it
+    growth_rate = np.full((n_locations, n_days), np.nan)
+    if n_days >= 2 * window:
+        current = windows[:, 2 * window - 1:]
+        previous = windows[:, window - 1:n_days - window]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.log(current / previous) / window
+        growth_rate[:, 2 * window - 1:] = np.where(
+            (current > 0) & (previous > 0), rate, np.nan
+            )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        doubling_time = np.where(growth_rate > 0, np.log(2) / growth_rate, np.inf)
+    doubling_time[np.isnan(growth_rate)] = np.nan
+
+    return {
+        "days": [_EPOCH + timedelta(days=int(first) + i) for i in range(n_days)],
+        "locations": names,
+        "incidence": incidence,
+        "growth_rate": growth_rate,
+        "doubling_time": doubling_time,
+    }
+
+def _day(time):
+    """
+    :param time: datetime
+    :return: integer, the day holding `time`, counted from the epoch
+    """
+    return (time - _EPOCH) // _DAY
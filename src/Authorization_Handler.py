@@ -5,11 +5,20 @@ Defines classes and exceptions related to authenticaiton for the app.
 
 Missing_Username_Or_Password
 Bad_Username_Or_Password
+Bad_Token
 Custom exception classes
 
 Authorization_Handler
 The main class of this module. Exposes functions to authenticate users against
 a Database.
+
+Credential_Cache
+A bounded cache of recently verified credentials, so that repeat requests
+need not hash their password again.
+
+Token_Signer
+Issues signed, expiring bearer tokens in exchange for verified credentials;
+Verified with a single HMAC, rather than hashing a password.
 """
 
 '''
@@ -22,6 +31,7 @@ this requires a plugin for Flask
 
 class Missing_Username_Or_Password(Exception): pass
 class Bad_Username_Or_Password(Exception): pass
+class Bad_Token(Exception): pass
 
 class Authorization_Handler:
     """
@@ -31,8 +41,17 @@ class Authorization_Handler:
     the Database.
     Checks for and verifies authentication information.
     """
-    def __init__(self, database):
+    def __init__(self, database, credential_cache=None, token_signer=None):
         self._db = database
+
+        if credential_cache is None:
+            credential_cache = Credential_Cache()
+        self._credential_cache = credential_cache
+
+        if token_signer is None:
+            token_signer = Token_Signer()
+        self._token_signer = token_signer
+
         self._not_authorized_msg = "Incorrect username or password."
         self.not_authorized_msg = self._not_authorized_msg
 
@@ -69,7 +88,258 @@ class Authorization_Handler:
         _u = request_authorization['username']
         _p = request_authorization['password']
 
+        #skip checking the password hash for recently verified credentials
+        if self._credential_cache.contains(_u, _p):
+            return True
+
         if not self._db.username_exists(_u):
             raise Bad_Username_Or_Password(self._not_authorized_msg)
 
-        return self._db.username_has_password(_u, _p)
\ No newline at end of file
+        authorized = self._db.username_has_password(_u, _p)
+
+        if authorized:
+            self._credential_cache.add(_u, _p)
+
+        return authorized
+
+    def issue_token(self, username):
+        """
+        Issue a bearer token to an authorized user.
+
+        :param username: string, a username already authorized, see
+        `is_authorized()`
+        :return: tuple, of the token (a string) and the seconds until it
+        expires
+        """
+        return self._token_signer.issue(username)
+
+    def token_username(self, token):
+        """
+        Verify a bearer token; Raising `Bad_Token` if it is forged, expired,
+        or revoked.
+
+        :param token: string
+        :return: string, the username the token was issued to
+        """
+        return self._token_signer.verify(token)
+
+    def revoke_token(self, token):
+        """
+        Revoke a bearer token, so that it is no longer authorized.
+
+        :param token: string
+        :return: None
+        """
+        self._token_signer.revoke(token)
+
+class Credential_Cache:
+    """
+    Credential_Cache class
+
+    Holds recently verified (username, password) pairs, so that repeat
+    requests skip the deliberately slow password hash check.
+    Passwords are not held as given, but as a keyed digest; With a key that
+    is random to each instance.
+    Entries expire `ttl` seconds after being added, and once `max_size`
+    entries are held the oldest entry is evicted.
+    """
+    def __init__(self, max_size=1024, ttl=300):
+        import os
+        import threading
+        from collections import OrderedDict
+
+        self._max_size = max_size
+        self._ttl = ttl
+        self._key = os.urandom(32)
+
+        #maps (username, digest) to the time the entry expires, oldest first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _digest(self, password):
+        """
+        A keyed digest of a password.
+        see: https://docs.python.org/3/library/hmac.html
+
+        :param password: string
+        :return: bytes
+        """
+        import hmac
+        return hmac.digest(self._key, password.encode("utf-8"), "sha256")
+
+    def contains(self, username, password):
+        """
+        Determine if a username and password have been recently verified.
+
+        :param username: string
+        :param password: string
+        :return: boolean
+        """
+        import time
+        _key = (username, self._digest(password))
+
+        with self._lock:
+            expires = self._entries.get(_key)
+
+            if expires is None:
+                return False
+
+            if expires <= time.monotonic():
+                del self._entries[_key]
+                return False
+
+            return True
+
+    def add(self, username, password):
+        """
+        Add a verified username and password to the cache.
+
+        :param username: string
+        :param password: string
+        :return: None
+        """
+        import time
+        _key = (username, self._digest(password))
+
+        with self._lock:
+            self._entries.pop(_key, None)
+            self._entries[_key] = time.monotonic() + self._ttl
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+class Token_Signer:
+    """
+    Token_Signer class
+
+    Issues bearer tokens of the form `<payload>.<signature>`; Where the
+    payload is the username, expiry time and a random id of the token, as
+    base64 encoded JSON, and the signature is an HMAC of the payload. So a
+    token is verified by computing a single HMAC, rather than by hashing a
+    password.
+        see:
+        https://datatracker.ietf.org/doc/html/rfc6750
+        https://docs.python.org/3/library/hmac.html
+
+    Tokens expire `ttl` seconds after being issued. Revoked tokens are held in
+    a deny list in memory, until they would have expired anyway. The key is
+    random to each instance unless given; Processes verifying each other's
+    tokens must share a key.
+    """
+    def __init__(self, key=None, ttl=3600):
+        import os
+        import threading
+
+        if key is None:
+            key = os.urandom(32)
+        self._key = key
+        self.ttl = ttl
+
+        #the ids of revoked tokens, and a heap of (expiry time, id) pairs to
+        #drop them from the deny list once expired
+        self._denied = set()
+        self._denied_expiries = list()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        #the number of tokens held in the deny list
+        return len(self._denied)
+
+    def _sign(self, payload):
+        """
+        :param payload: bytes
+        :return: bytes, the signature of `payload`
+        """
+        import hmac
+        return hmac.digest(self._key, payload, "sha256")
+
+    def issue(self, username):
+        """
+        Issue a token.
+
+        :param username: string
+        :return: tuple, of the token (a string) and the seconds until it
+        expires
+        """
+        import base64
+        import json
+        import secrets
+        import time
+
+        payload = base64.urlsafe_b64encode( json.dumps({
+            "sub": username,
+            "exp": int(time.time()) + self.ttl,
+            "jti": secrets.token_hex(16),
+            }).encode("utf-8") )
+
+        signature = base64.urlsafe_b64encode( self._sign(payload) )
+
+        return (payload + b"." + signature).decode("ascii"), self.ttl
+
+    def _claims(self, token):
+        """
+        Verify a token, and read back its payload.
+
+        :param token: string
+        :return: dictionary, the payload of the token
+        """
+        import base64
+        import binascii
+        import hmac
+        import json
+        import time
+
+        try:
+            payload, signature = token.encode("ascii").split(b".")
+            signature = base64.urlsafe_b64decode(signature)
+        except (UnicodeEncodeError, ValueError, binascii.Error):
+            raise Bad_Token("Malformed token.")
+
+        #compare in constant time, so as not to leak the signature
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise Bad_Token("Invalid token.")
+
+        claims = json.loads( base64.urlsafe_b64decode(payload) )
+
+        if claims["exp"] <= time.time():
+            raise Bad_Token("Expired token.")
+
+        if claims["jti"] in self._denied:
+            raise Bad_Token("Revoked token.")
+
+        return claims
+
+    def verify(self, token):
+        """
+        Verify a token; Raising `Bad_Token` if it is forged, expired, or
+        revoked.
+
+        :param token: string
+        :return: string, the username the token was issued to
+        """
+        return self._claims(token)["sub"]
+
+    def revoke(self, token):
+        """
+        Revoke a token; Raising `Bad_Token` if it is not a valid token.
+
+        :param token: string
+        :return: None
+        """
+        import heapq
+        import time
+
+        claims = self._claims(token)
+
+        with self._lock:
+            now = time.time()
+            while (len(self._denied_expiries) > 0) and \
+                    (self._denied_expiries[0][0] <= now):
+                _, jti = heapq.heappop(self._denied_expiries)
+                self._denied.discard(jti)
+
+            self._denied.add(claims["jti"])
+            heapq.heappush(self._denied_expiries, (claims["exp"], claims["jti"]))
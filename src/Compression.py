@@ -0,0 +1,174 @@
+"""
+Compression module
+
+Compression of HTTP responses, negotiated with the `Accept-Encoding` header of
+each request. Rows are highly repetitive (the same doctors, locations, event
+types and users), so JSON responses compress several times over.
+    see:
+    https://developer.mozilla.org/en-US/docs/Web/HTTP/Compression
+
+Responses are compressed with gzip, or with zstd where the optional
+`zstandard` package is installed; See the `zstd` extra of setup.py.
+    see:
+    https://facebook.github.io/zstd/
+
+negotiate()
+Choose the encoding of a response.
+
+compress()
+Compress a response body in full.
+
+compress_stream()
+Compress a streamed response body, a chunk at a time.
+
+Compressed_Cache
+A memory-bounded cache of compressed response bodies.
+"""
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#the encodings responses may be compressed with, most preferred first
+ENCODINGS = (["zstd"] if not zstandard is None else []) + ["gzip"]
+
+#responses smaller than this are sent as is, as compressing them saves too
+#little to be worth the time
+MIN_COMPRESS_BYTES = 1024
+
+#a streamed response is flushed from the compressor each time this much of it
+#has been compressed; Flushing more often costs compression
+STREAM_FLUSH_BYTES = 64 * 1024
+
+def negotiate(accept_encodings):
+    """
+    Choose the encoding of a response, from the encodings a client accepts.
+
+    :param accept_encodings: the request.accept_encodings of a Flask request
+    :return: string, one of `ENCODINGS`; Or None to send the response as is
+    """
+    return accept_encodings.best_match(ENCODINGS)
+
+def _compressor(encoding):
+    """
+    :param encoding: string, one of `ENCODINGS`
+    :return: an object with `compress(data)` and `flush()` methods, each
+    returning compressed bytes
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor().compressobj()
+
+    import zlib
+    #see: https://docs.python.org/3/library/zlib.html#zlib.compressobj
+    return zlib.compressobj(wbits=16 + zlib.MAX_WBITS) #a gzip header and trailer
+
+def _sync_flush(compressor, encoding):
+    """
+    Flush the bytes held by a compressor, without ending the stream; So the
+    client can decompress everything compressed so far.
+
+    :param compressor: as returned by `_compressor()`
+    :param encoding: string, one of `ENCODINGS`
+    :return: bytes
+    """
+    if encoding == "zstd":
+        #see: https://python-zstandard.readthedocs.io/en/latest/compressor.html#zstdcompressionobj
+        return compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    import zlib
+    return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+def compress(data, encoding):
+    """
+    :param data: bytes
+    :param encoding: string, one of `ENCODINGS`
+    :return: bytes
+    """
+    compressor = _compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+def compress_stream(chunks, encoding):
+    """
+    Compress a stream of chunks, yielding compressed bytes as the compressor
+    produces them; And flushing the compressor each `STREAM_FLUSH_BYTES` of
+    chunks, as it would otherwise hold back what it has compressed until its
+    buffers fill. So a streamed response is still sent as it is encoded,
+    rather than once the last chunk is compressed.
+
+    :param chunks: iterable of bytes
+    :param encoding: string, one of `ENCODINGS`
+    :return: generator of bytes
+    """
+    compressor = _compressor(encoding)
+
+    pending = 0 #the bytes compressed since the last flush
+    for chunk in chunks:
+        res = compressor.compress(chunk)
+
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_BYTES:
+            res += _sync_flush(compressor, encoding)
+            pending = 0
+
+        if len(res) > 0:
+            yield res
+
+    yield compressor.flush()
+
+class Compressed_Cache:
+    """
+    The Compressed_Cache class.
+
+    Maps the entity tag and encoding of a response to its compressed body; So
+    that a response unchanged since it was last sent (the same query of the
+    same version of the database) is only compressed once. Once the bodies
+    held total more than `max_bytes`, the least recently used are evicted.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        import threading
+        from collections import OrderedDict
+
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, etag, encoding):
+        """
+        :param etag: string, the entity tag of the response
+        :param encoding: string
+        :return: bytes, or None if not cached
+        """
+        with self._lock:
+            res = self._entries.get( (etag, encoding) )
+
+            if not res is None:
+                self._entries.move_to_end( (etag, encoding) )
+
+            return res
+
+    def put(self, etag, encoding, compressed):
+        """
+        :param etag: string, the entity tag of the response
+        :param encoding: string
+        :param compressed: bytes, the compressed body of the response
+        :return: None
+        """
+        #a body larger than the cache would only evict everything else
+        if len(compressed) > self._max_bytes:
+            return
+
+        with self._lock:
+            if (etag, encoding) in self._entries:
+                return
+
+            self._entries[ (etag, encoding) ] = compressed
+            self._bytes += len(compressed)
+
+            while self._bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
@@ -4,14 +4,22 @@ The Database module
 Handles database access, insertion, and search. As well as configuring the
 database for optimally querying.
 
+Usernames and passwords are held in a TinyDB database, while rows of data are
+held in an append-only Segmented_Log; See the Segmented_Log module. The log is
+periodically compacted into a snapshot, see the Snapshot module.
+
 Custom exception classes:
 Malformed_Input
 Bad_Username_Or_Password
 No_Such_User
+Bad_Cursor
 
 Database
 The main class of the module. Provides acess to the database, as well as
 verifying usernames and passwords.
+
+Encoded_Row_Cache
+A memory-bounded cache of rows encoded as JSON.
 """
 
 '''
@@ -26,22 +34,63 @@ Redis makes async operations easy, as it comes bundled in their python library
     https://medium.com/swlh/building-rest-api-backed-by-redis-ae8ff4818460
 '''
 
+#decode and encode JSON with orjson where it is installed, as it is several
+#times faster than the standard library; Also used by Flask_app
+#see: https://github.com/ijl/orjson
+#escaped keys are `Markup` rather than `str`, which orjson only accepts as
+#keys with OPT_NON_STR_KEYS
+try:
+    import orjson
+    from orjson import loads as _json_loads
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    from json import loads as _json_loads
+
+    def _json_dumps(obj):
+        import json
+        return json.dumps(obj).encode("utf-8")
+
+#the attributes of Database saved to snapshots; The rows held in memory, and
+#the indexes over them, see `Database.compact()`
+_SNAPSHOT_ATTRIBUTES = [
+    "_rows",
+    "_ordered",
+    "_ordered_keys",
+    "_date_time_keys",
+    "_timelines",
+    "_indexes",
+    "_stats",
+    "_text_index",
+    "_graph",
+    "_columns",
+]
+
+#how often those waiting on new rows check the log for rows appended by other
+#processes, in seconds; See `Database.wait_for_rows()`
+_FEED_POLL_SECONDS = 1.0
+
 class Bad_Username_Or_Password(Exception): pass
 class No_Such_User(Exception): pass
+class Bad_Cursor(Exception): pass
 
 class Database:
     """
     The Database class.
 
     Instantiates a database, if none are present, otherwise opens a connection,
-    to an existing database.
+    to an existing database. Many processes may open the same database; Each
+    picking up the rows appended by the others when next read or written.
     Maintains a `_users` table, for usernames and password
-    and a `data` table, for user inserted data.
+    and a segmented log, for user inserted data. The rows of the log are
+    replayed into memory when the database is opened.
     Also contains functions for inserting and querying the database.
     As well as allowing usernames and passwords to be verified with 
     stored (encrypted) user and password details.
     """
-    def __init__(self, path=None):
+    def __init__(self, path=None, encoded_cache_bytes=64 * 1024 * 1024,
+            durability="batch", compact_interval=None):
         from pathlib import Path
         _path = Path('./')
 
@@ -69,7 +118,190 @@ class Database:
         self._db = TinyDB(_path, storage=caching_n_serialization_store)
 
         self._user_table = self._db.table('_users')
-        self._data_table = self._db.table('data')
+
+        #an index of the `_users` table, mapping each escaped username to
+        #the password hashes stored for it
+        self._users = dict()
+        for row in self._user_table.all():
+            for _u, _p in row.items():
+                self._users.setdefault(_u, list()).append(_p)
+
+        #rows of data are appended to a log, kept in a directory alongside
+        #the TinyDB file
+        from .Segmented_Log import Segmented_Log
+        self._log = Segmented_Log(_path.parent / f"{_path.stem}_log")
+
+        #rows stored before the log, in the TinyDB `data` table, are moved
+        #to the log once
+        self._migrate_data_table()
+
+        #the rows, and the indexes over them, are loaded from the latest
+        #snapshot (if any) and the rows of the log that follow it; See
+        #`_load()` and `compact()`
+        self._snapshot_seq = 0
+        self._load()
+
+        #notified as rows are loaded, waking those waiting on new rows; A
+        #single broadcast to all subscribers, see `wait_for_rows()`
+        import threading
+        self._appended = threading.Condition()
+        self._polling = False #if a waiter is checking the log for new rows
+
+        #rows never change once stored, so their JSON encoding can be reused
+        #across responses, see `encoded()`
+        self._encoded_rows = Encoded_Row_Cache(encoded_cache_bytes)
+
+        #watch the free space of the volume holding the database in the
+        #background, see `_check_disk_usage()`
+        from .Disk_Monitor import Disk_Monitor
+        self._disk_monitor = Disk_Monitor(
+            _path.parent, bytes_written=lambda: self._log.bytes_written
+            )
+        self._disk_monitor.start()
+
+        #rows are committed to the log by a single writer thread, in groups,
+        #see `_commit()` and the Writer module
+        from .Writer import Writer
+        self._writer = Writer(self._commit, self._log.sync, durability)
+        self._writer.start()
+
+        #snapshot the database, and compact the log, every `compact_interval`
+        #seconds in the background; See `compact()`
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+        if not compact_interval is None:
+            from .Snapshot import Compactor
+            self._compactor = Compactor(self.compact, compact_interval)
+            self._compactor.start()
+
+    def _migrate_data_table(self):
+        """
+        Move the rows of the TinyDB `data` table, where rows were stored
+        before the log, to the log; In the order they were inserted, and
+        numbered as they are appended. The table is then dropped.
+        Done holding the log, and only while the log holds neither segments
+        nor snapshots; As otherwise the rows have already been moved, by
+        another process (which may have died before dropping the table).
+
+        :return: None
+        """
+        if not "data" in self._db.tables():
+            return
+
+        from .Snapshot import latest_snapshot
+        with self._log.lock():
+            moved = (len(self._log.segments()) > 0) or \
+                (not latest_snapshot(self._log.path) is None)
+
+            if not moved:
+                rows = [dict(row) for row in self._db.table("data").all()]
+                for i, row in enumerate(rows):
+                    row["_seq"] = i
+
+                self._log.extend(rows)
+                self._log.sync()
+
+            self._db.drop_table("data")
+            self._db.storage.flush()
+
+    def _reset_state(self):
+        """
+        Set up the rows held in memory, and the indexes and orderings over
+        them, empty; As new objects, so that those being read by other
+        threads are left as they were.
+
+        :return: None
+        """
+        #rows in the order they were appended, such that the position of
+        #each row is its sequence number, `_seq`
+        self._rows = list()
+
+        #rows ordered by `_timestamp` (and then by `_seq`), alongside their
+        #sort keys, see `_order_row()`
+        self._ordered = list()
+        self._ordered_keys = list()
+
+        #the `date_time` of each row that holds a parsable one, alongside its
+        #`_seq`, in order; See `parse_time()`
+        self._date_time_keys = list()
+
+        #the sorted keys of each field that rows can be selected by a range
+        #of times on, see `_time_window()`
+        self._time_keys = {
+            "_timestamp": self._ordered_keys,
+            "date_time": self._date_time_keys,
+        }
+
+        #for each patient, the (`_timestamp`, `_seq`) keys of their rows in
+        #order; Their audit trail, see `timeline()`
+        self._timelines = dict()
+
+        #hash indexes, mapping the value of a field to the positions of the
+        #rows holding that value, see `_index_row()`
+        from . import Validation_and_Standardization_Handler as vns
+        _indexed_fields = vns.Validation_and_Standardization()._required_keys
+        self._indexes = {k: dict() for k in _indexed_fields + ["_user"]}
+
+        #counts of rows, by field and over time, see the Stats module; Rebuilt
+        #as the log is replayed
+        from .Stats import Stats
+        self._stats = Stats()
+
+        #an inverted index of the words of free-text fields, such as `notes`;
+        #Fields held in a hash index are not free-text, see the Text_Index module
+        from .Text_Index import Text_Index
+        self._text_index = Text_Index(
+            exclude=list(self._indexes) + ["date_time", "infected_by"]
+            )
+
+        #who infected whom, from the optional `infected_by` field, see the
+        #Transmission_Graph module
+        from .Transmission_Graph import Transmission_Graph
+        self._graph = Transmission_Graph()
+
+        #the `_timestamp`, `event_type` and `location` of each row as compact
+        #columns, for vectorized analytics, see the Analytics module
+        from .Analytics import Event_Columns
+        self._columns = Event_Columns()
+
+    def _load(self):
+        """
+        Load the rows held in memory, and the indexes over them, from the
+        latest snapshot; Then load the rows of the log that follow it.
+
+        :return: None
+        """
+        from .Snapshot import latest_snapshot, read_snapshot
+
+        #the log directory is created along with the first row appended
+        if not self._log.path.exists():
+            self._reset_state()
+            return
+
+        with self._log.lock():
+            self._reset_state()
+
+            seq = 0
+            snapshot = latest_snapshot(self._log.path)
+            if not snapshot is None:
+                seq, path = snapshot
+                for k, v in read_snapshot(path).items():
+                    setattr(self, k, v)
+
+                #snapshots written before columns were kept hold none
+                if len(self._columns) != len(self._rows):
+                    for row in self._rows:
+                        self._columns.add(row)
+
+                self._time_keys = {
+                    "_timestamp": self._ordered_keys,
+                    "date_time": self._date_time_keys,
+                }
+
+            for row in self._log.replay(seq):
+                self._load_row(row)
+
+            self._snapshot_seq = seq
 
     def add_user(self, username, password):
         """
@@ -93,7 +325,13 @@ class Database:
         _p = generate_password_hash(password)
 
         from flask import escape
-        self._user_table.insert({escape(username): _p})
+        _username = escape(username)
+        self._user_table.insert({_username: _p})
+        self._users.setdefault(_username, list()).append(_p)
+
+        #write the user out from the cache, so it is seen by other processes
+        #opening the database
+        self._db.storage.flush()
 
     def username_exists(self, username): return self._username_exists(username)
     
@@ -107,8 +345,7 @@ class Database:
         from flask import escape
         _username = escape(username)
 
-        _users = [list(row.keys())[0] for row in self._user_table.all()]
-        return (_username in _users)
+        return (_username in self._users)
 
     def username_has_password(self, username, password):
         """
@@ -126,15 +363,9 @@ class Database:
         if not self._username_exists(_username):
             raise No_Such_User()
 
-        for row in self._user_table.all():
-            _u = list(row.keys())[0]
-            _p = list(row.values())[0]
-
-            from werkzeug.security import check_password_hash
-            _username_matches = (_username == _u)
-            _password_matches = check_password_hash(_p, password)
-
-            if _username_matches and _password_matches:
+        from werkzeug.security import check_password_hash
+        for _p in self._users[_username]:
+            if check_password_hash(_p, password):
                 return True
 
         return False
@@ -148,68 +379,838 @@ class Database:
         `_timestamp` value is added; Indication the time when the row
         was inserted.
 
+        Each row is also given a sequence number, `_seq`, counting up from zero
+        in the order rows are appended.
+
         :param row: dictionary
-        :return: The content of the database after insert the new row; As a list
-        of dictionaries.
+        :return: dictionary, the row as stored
         """
         self._check_disk_usage()
 
+        new_row = self._prepare_row(row)
+
+        return self._writer.submit( [new_row] )[0]
+
+    def extend(self, rows):
+        """
+        Add many new rows of data to the database, as with `append()`; But
+        committing all the valid rows to storage in a single write. Rows that
+        fail validation are skipped, and reported back to the caller.
+
+        :param rows: iterable of dictionaries
+        :return: tuple, of a list of the rows as stored, and a list of
+        (index, message) tuples for each row that failed validation; Where
+        `index` is the position of the row in `rows`
+        """
+        self._check_disk_usage()
+
+        from . import Validation_and_Standardization_Handler as vns
+
+        new_rows = list()
+        errors = list()
+        for i, row in enumerate(rows):
+            try:
+                new_rows.append( self._prepare_row(row) )
+            except vns.Malformed_Input as e:
+                errors.append( (i, str(e)) )
+
+        if len(new_rows) == 0:
+            return new_rows, errors
+
+        return self._writer.submit(new_rows), errors
+
+    def _prepare_row(self, row):
+        """
+        Escape, validate and standardize a row of data, ready to be stored.
+        Done by the thread appending the row, rather than the writer thread.
+
+        :param row: dictionary
+        :return: dictionary
+        """
         new_row = self._escape_input(row)
 
+        #the escaped row is a new dictionary, so can be standardized in place
         from . import Validation_and_Standardization_Handler as vns
-        vns.validate(new_row)
-        new_row = vns.standardize(new_row)
+        vns.validate_and_standardize(new_row)
 
-        self._data_table.insert( new_row )
+        return new_row
 
-        return self.__repr__()
+    def _commit(self, rows):
+        """
+        Number prepared rows, and write them to the log with a single write.
+        Called by the writer thread only.
+
+        :param rows: list of dictionaries, as returned by `_prepare_row()`
+        :return: list of dictionaries, the rows as stored
+        """
+        from datetime import datetime
+
+        #rows are numbered, timestamped, and written, holding the log; Having
+        #first loaded any rows appended by other processes. So `_timestamp`s
+        #are in the order of `_seq`, as rows are committed; Never earlier than
+        #the last row held, even should the clock be set back
+        with self._log.lock():
+            self._catch_up()
+
+            now = datetime.now(tz=None)
+            if len(self._ordered_keys) > 0:
+                now = max(now, self._ordered_keys[-1][0])
+
+            for i, row in enumerate(rows):
+                row["_seq"] = len(self._rows) + i
+                row["_timestamp"] = now
+
+            self._log.extend( rows )
+            for row in rows:
+                self._load_row( row )
+
+        with self._appended:
+            self._appended.notify_all()
+
+        return rows
 
     def _escape_input(self, row):
         """
         A function to escape the content of a row of data.
+        Escaped keys and values are kept as plain strings, rather than
+        `Markup`; As rows read back from the log are, and so that snapshots
+        of rows can be pickled quickly, see `compact()`.
+        Values are read as strings in the same pass, as for JSON input: A
+        None is taken as the field being absent, and booleans (as numbers
+        are) are kept as their JSON text.
 
         :param row: dictionary
         :return: dictionary, the escaped input
         """
+        from flask import escape
+
         res = dict()
-        for k in row.keys():
-            from flask import escape
-            _k = escape(k)
-            _v = escape(row[k])
-            res[_k] = _v
+        for k, v in row.items():
+            if v is None:
+                continue
+
+            if isinstance(v, bool):
+                v = "true" if v else "false"
+
+            res[ str(escape(k)) ] = str( escape(v) )
         return res
 
-    def search(self, q):
+    def _catch_up(self):
+        """
+        Load the rows appended to the log by other processes, if any.
+
+        :return: None
+        """
+        if not self._log.has_new():
+            return
+
+        from .Segmented_Log import Missing_Records
+        with self._log.lock():
+            try:
+                rows = self._log.read_new()
+            except Missing_Records:
+                #another process has compacted away rows not yet loaded, so
+                #load them from its snapshot instead
+                self._load_missing()
+            else:
+                for row in rows:
+                    self._load_row(row)
+
+        with self._appended:
+            self._appended.notify_all()
+
+    def _load_missing(self):
+        """
+        Load the rows not yet held in memory from the latest snapshot, and
+        then the rows of the log that follow them; Such as when another
+        process has compacted away rows of the log not yet loaded. Should be
+        called holding the log.
+        The snapshot is read off to the side, and only the rows it holds
+        beyond those already held are loaded, as rows appended are; So threads
+        reading meanwhile only see rows added, rather than an emptied or half
+        replaced state, as reloading with `_load()` would show them.
+
+        :return: None
+        """
+        from .Snapshot import latest_snapshot, read_snapshot
+
+        snapshot = latest_snapshot(self._log.path)
+        if not snapshot is None:
+            seq, path = snapshot
+            for row in read_snapshot(path)["_rows"][len(self._rows):seq]:
+                self._load_row(row)
+
+            self._snapshot_seq = seq
+
+        for row in self._log.replay( len(self._rows) ):
+            self._load_row(row)
+
+    def _load_row(self, row):
+        """
+        Add a row, as read back from or appended to the log, to the rows held
+        in memory; And to the indexes and orderings over them.
+
+        :param row: dictionary
+        :return: None
+        """
+        #rows written before sequence numbers were introduced take their
+        #position in the log
+        row.setdefault("_seq", len(self._rows))
+
+        self._rows.append(row)
+        self._index_row(row["_seq"], row)
+        self._order_row(row)
+        self._stats.add(row)
+        self._text_index.add(row)
+        self._graph.add(row)
+        self._columns.add(row)
+
+    def _order_row(self, row):
+        """
+        Merge a row into the rows ordered by `_timestamp`, into the timeline
+        of its patient, and into the ordering of `date_time`s. Rows are
+        timestamped as they are committed, so arrive in order of `_timestamp`
+        and are placed at the end; Rows that don't (those of logs written
+        before, or out of order `date_time`s) are inserted in place by binary
+        search, rather than re-sorting.
+
+        :param row: dictionary
+        :return: None
+        """
+        key = (row["_timestamp"], row["_seq"])
+        i = _insert_sorted(self._ordered_keys, key)
+        self._ordered.insert(i, row)
+
+        if "patient" in row:
+            _insert_sorted(self._timelines.setdefault(row["patient"], list()), key)
+
+        date_time = parse_time( row.get("date_time") )
+        if not date_time is None:
+            _insert_sorted(self._date_time_keys, (date_time, row["_seq"]))
+
+    def _index_row(self, position, row):
+        """
+        Add a row to the hash indexes of the indexed fields it holds.
+
+        :param position: integer, the position of the row in `_rows`
+        :param row: dictionary
+        :return: None
+        """
+        for k, index in self._indexes.items():
+            if k in row:
+                index.setdefault(row[k], list()).append(position)
+
+    def search(self, q, limit=None, cursor=None, since=None, until=None,
+            time_field="_timestamp", text=None, text_field="notes", after=None):
         """
         A function to search the database for rows that containing the query `q`
 
         :param q: dictionary
+        :param limit: integer, the most rows to return, or None for all rows
+        :param cursor: string, as returned by `make_cursor()`, to return only
+        rows after the row the cursor was made from
+        :param since: datetime, to return only rows with a `time_field` at or
+        after this time, or None
+        :param until: datetime, to return only rows with a `time_field` before
+        this time, or None
+        :param time_field: string, `_timestamp` or `date_time`; The field
+        `since` and `until` apply to. Rows without a parsable `date_time` are
+        never within a range of `date_time`s
+        :param text: string, to return only rows with a `text_field` matching
+        this full-text search, see `Text_Query` for its form; Or None. Raises
+        `Bad_Text_Query` if malformed
+        :param text_field: string, the free-text field searched by `text`
+        :param after: integer, to return only rows with a `_seq` greater than
+        this, or None; Found by binary search, rather than by checking the
+        rows before it
         :return: list of dictionaries, or an empty list on not found
         """
+        from itertools import islice
+        return list( islice(
+            self.iter_search(
+                q, cursor, since, until, time_field, text, text_field, after
+                ),
+            limit
+            ) )
+
+    def iter_search(self, q, cursor=None, since=None, until=None,
+            time_field="_timestamp", text=None, text_field="notes", after=None):
+        """
+        A generator version of `search()`, yielding matching rows in the order
+        they were appended. The cursor, and full-text search, are checked
+        before returning; Raising `Bad_Cursor` or `Bad_Text_Query` if malformed.
+
+        :param q: dictionary
+        :param cursor: string, as returned by `make_cursor()`
+        :param since: datetime, or None
+        :param until: datetime, or None
+        :param time_field: string, `_timestamp` or `date_time`
+        :param text: string, or None
+        :param text_field: string
+        :param after: integer, a `_seq`, or None
+        :return: generator of dictionaries
+        """
+        self._catch_up()
+
         safe_query = self._escape_input(q)
 
-        from tinydb import Query
-        dbq = Query()
+        #each way of narrowing down the rows to check, as tuples of: the
+        #number of rows it leaves, a function listing those rows in order of
+        #`_seq`, and a function checking a row (or None where `_matches()`
+        #does); Only the narrowest is listed, with the others checked per row
+        narrowing = list()
+
+        #when the query holds an indexed field, only the rows listed under
+        #that field need to be checked
+        for k in safe_query:
+            if k in self._indexes:
+                positions = self._indexes[k].get(safe_query[k], list())
+                narrowing.append( (len(positions), lambda p=positions: p, None) )
+
+        #a full-text search is answered from the inverted index, see the
+        #Text_Index module; Though rows listed for a phrase are always
+        #checked, as the index doesn't hold the order of words
+        match_phrases = None
+        if not text is None:
+            from .Text_Index import Text_Query
+            text_query = Text_Query(text)
+            text_candidates = text_query.candidates(self._text_index, text_field)
+
+            def match_text(row):
+                return text_query.matches(row, text_field)
+
+            narrowing.append(
+                (len(text_candidates), lambda: text_candidates, match_text)
+                )
+            if text_query.has_phrases:
+                match_phrases = match_text
+
+        #a range of times is found by binary search, and put in order of `_seq`
+        if (not since is None) or (not until is None):
+            keys, lo, hi = self._time_window(since, until, time_field)
+            narrowing.append( (
+                hi - lo,
+                lambda: sorted( keys[i][1] for i in range(lo, hi) ),
+                _time_filter(since, until, time_field),
+                ) )
+
+        candidates = range(len(self._rows))
+        filters = list()
+        if len(narrowing) > 0:
+            from operator import itemgetter
+            narrowest = min(narrowing, key=itemgetter(0))
+
+            candidates = narrowest[1]()
+            filters = [
+                way[2] for way in narrowing
+                if (not way is narrowest) and (not way[2] is None)
+                ]
+            if (not match_phrases is None) and (not match_phrases in filters):
+                filters.append(match_phrases)
+
+        #both the positions in an index, and the positions of all rows,
+        #are in order of `_seq`; So a cursor, or `after`, is found by binary
+        #search
+        import bisect
+        start = 0
+        if not cursor is None:
+            _, seq = _parse_cursor(cursor)
+            start = bisect.bisect_right(candidates, seq)
+
+        if not after is None:
+            start = max( start, bisect.bisect_right(candidates, after) )
+
+        return _select(self._rows, candidates, start, safe_query, filters)
+
+    def search_any(self, queries, limit=None, cursor=None, since=None,
+            until=None, time_field="_timestamp", text=None, text_field="notes",
+            after=None):
+        """
+        As `search()`, but for rows matching any of a list of queries.
+
+        :param queries: list of dictionaries
+        :param limit: integer, the most rows to return, or None for all rows
+        :param cursor: string, as returned by `make_cursor()`
+        :param since: datetime, or None
+        :param until: datetime, or None
+        :param time_field: string, `_timestamp` or `date_time`
+        :param text: string, or None
+        :param text_field: string
+        :param after: integer, a `_seq`, or None
+        :return: list of dictionaries, or an empty list on not found
+        """
+        from itertools import islice
+        return list( islice(
+            self.iter_search_any(
+                queries, cursor, since, until, time_field, text, text_field,
+                after
+                ),
+            limit
+            ) )
+
+    def iter_search_any(self, queries, cursor=None, since=None, until=None,
+            time_field="_timestamp", text=None, text_field="notes", after=None):
+        """
+        A generator version of `search_any()`, yielding matching rows in the
+        order they were appended; Each row only once.
+
+        :param queries: list of dictionaries
+        :param cursor: string, as returned by `make_cursor()`
+        :param since: datetime, or None
+        :param until: datetime, or None
+        :param time_field: string, `_timestamp` or `date_time`
+        :param text: string, or None
+        :param text_field: string
+        :param after: integer, a `_seq`, or None
+        :return: generator of dictionaries
+        """
+        return _merge_unique( [
+            self.iter_search(
+                q, cursor, since, until, time_field, text, text_field, after
+                )
+            for q in queries
+            ] )
+
+    def page(self, limit=None, cursor=None, since=None, until=None,
+            time_field="_timestamp"):
+        """
+        Return a page of the content of the database, ordered by timestamp.
+
+        :param limit: integer, the most rows to return, or None for all rows
+        :param cursor: string, as returned by `make_cursor()`, to return only
+        rows after the row the cursor was made from
+        :param since: datetime, to return only rows with a `time_field` at or
+        after this time, or None
+        :param until: datetime, to return only rows with a `time_field` before
+        this time, or None
+        :param time_field: string, `_timestamp` or `date_time`; Rows in a
+        range of `date_time`s are returned in the order they were appended,
+        as with `search()`
+        :return: list of dictionaries
+        """
+        if time_field != "_timestamp":
+            from itertools import islice
+            return list( islice(
+                self.iter_search(dict(), cursor, since, until, time_field), limit
+                ) )
+
+        start, end = self._ordered_range(cursor, since, until)
+        if not limit is None:
+            end = min(end, start + limit)
+
+        return self._ordered[start:end]
+
+    def iter_rows(self, cursor=None, since=None, until=None,
+            time_field="_timestamp"):
+        """
+        A generator version of `page()`, yielding rows ordered by timestamp.
+        Rows added while iterating are not yielded. The cursor is checked
+        before returning, raising `Bad_Cursor` if malformed.
+
+        :param cursor: string, as returned by `make_cursor()`
+        :param since: datetime, or None
+        :param until: datetime, or None
+        :param time_field: string, `_timestamp` or `date_time`
+        :return: generator of dictionaries
+        """
+        if time_field != "_timestamp":
+            return self.iter_search(dict(), cursor, since, until, time_field)
+
+        #the rows are copied as the generator is made, so a row inserted into
+        #the ordering while iterating can't shift the rows still to come
+        start, end = self._ordered_range(cursor, since, until)
+        return iter( self._ordered[start:end] )
+
+    def _ordered_range(self, cursor=None, since=None, until=None):
+        """
+        The range of positions in `_ordered` of the rows after a cursor, and
+        within a range of timestamps.
+
+        :param cursor: string, as returned by `make_cursor()`
+        :param since: datetime, or None
+        :param until: datetime, or None
+        :return: tuple, of the first position and the position after the last
+        """
+        self._catch_up()
+
+        #only the rows within the range of timestamps are touched
+        _, start, end = self._time_window(since, until, "_timestamp")
+
+        if not cursor is None:
+            import bisect
+            start = max(
+                start, bisect.bisect_right(self._ordered_keys, _parse_cursor(cursor))
+                )
+
+        return start, max(start, end)
+
+    def timeline(self, patient, limit=None, cursor=None):
+        """
+        Return the audit trail of a patient; Their rows, ordered by timestamp.
+        Takes time proportional to the number of rows returned, rather than
+        the size of the database.
+
+        :param patient: string, the name of the patient
+        :param limit: integer, the most rows to return, or None for all rows
+        :param cursor: string, as returned by `make_cursor()`, to return only
+        rows after the row the cursor was made from
+        :return: list of dictionaries, or an empty list for unknown patients
+        """
+        from itertools import islice
+        return list( islice(self.iter_timeline(patient, cursor), limit) )
+
+    def iter_timeline(self, patient, cursor=None):
+        """
+        A generator version of `timeline()`. The cursor is checked before
+        returning, raising `Bad_Cursor` if malformed.
+
+        :param patient: string, the name of the patient
+        :param cursor: string, as returned by `make_cursor()`
+        :return: generator of dictionaries
+        """
+        self._catch_up()
+
+        from flask import escape
+        keys = self._timelines.get(escape(patient), list())
+
+        start = 0
+        if not cursor is None:
+            import bisect
+            start = bisect.bisect_right(keys, _parse_cursor(cursor))
+
+        _rows = self._rows
+        return (_rows[keys[i][1]] for i in range(start, len(keys)))
+
+    def iter_changes(self, after, q=None, before=None):
+        """
+        The rows appended after the row with the sequence number `after`, in
+        order of `_seq`; Only reading the rows that follow it.
+
+        :param after: integer, a `_seq`; Or -1 for every row
+        :param q: dictionary, to yield only the rows matching the query, as
+        with `search()`; Or None
+        :param before: integer, a `_seq` to stop before, such as a `version()`;
+        Or None to stop at the last row held
+        :return: generator of dictionaries
+        """
+        self._catch_up()
+
+        safe_query = self._escape_input( q or dict() )
+
+        end = len(self._rows)
+        if not before is None:
+            end = min(end, before)
+
+        #rows are held in order of `_seq`, at the position of their `_seq`
+        return _select(self._rows, range(end), max(after + 1, 0), safe_query)
+
+    def wait_for_rows(self, after, timeout):
+        """
+        Wait until a row is appended after the row with the sequence number
+        `after`, or for `timeout` seconds. Rows appended by this process wake
+        all waiters with a single broadcast as they are committed. Rows
+        appended by other processes are found by one of the waiters checking
+        the log every `_FEED_POLL_SECONDS`, on behalf of the others; So idle
+        waiters cost nothing while they wait.
+
+        :param after: integer, a `_seq`; Or -1 to wait for the first row
+        :param timeout: number, in seconds
+        :return: boolean, if there are rows after `after`
+        """
+        import time
+        deadline = time.monotonic() + timeout
+
+        poll = True #every waiter checks the log once, on starting to wait
+        polling = False #if this waiter is checking on behalf of the others
+        try:
+            while True:
+                if poll:
+                    self._catch_up()
+
+                with self._appended:
+                    if len(self._rows) > after + 1:
+                        return True
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+
+                    if not self._polling:
+                        self._polling = polling = True
+
+                    poll = polling
+                    if polling:
+                        remaining = min(remaining, _FEED_POLL_SECONDS)
+                    self._appended.wait(remaining)
+        finally:
+            #hand checking the log over to another waiter, if any; Including
+            #when handed it just as this waiter stops waiting
+            with self._appended:
+                if polling:
+                    self._polling = False
+                if not self._polling:
+                    self._appended.notify()
+
+    def version(self):
+        """
+        The version of the database, increasing with every row appended; By
+        this or any other process sharing the log. Responses read from the
+        same version of the database hold the same rows.
+
+        :return: integer, the number of rows held; The `_seq` of the next row
+        """
+        self._catch_up()
+
+        return len(self._rows)
+
+    def stats(self):
+        """
+        The counts of rows in the database, by field and over time; Kept up
+        to date as rows are added, so reading them doesn't scan the rows.
+
+        :return: Stats
+        """
+        self._catch_up()
+
+        return self._stats
+
+    def transmission_chain(self, patient):
+        """
+        The chain of infections leading to a patient, as recorded by the
+        `infected_by` field.
+
+        :param patient: string, the name of the patient
+        :return: list of strings, the patients of the chain from the first
+        infected to `patient`; Or an empty list for unknown patients
+        """
+        self._catch_up()
+
+        from flask import escape
+        _patient = escape(patient)
+
+        if (not _patient in self._timelines) and (not _patient in self._graph):
+            return list()
+
+        return self._graph.chain(_patient)
 
-        #return a list of rows of which the query `q` is a subset of each row
-        #see: https://tinydb.readthedocs.io/en/latest/usage.html#advanced-queries
-        return list( self._data_table.search(dbq.fragment( safe_query )) )
+    def transmission_cluster(self, patient, depth=None):
+        """
+        The patients infected downstream of a patient, as recorded by the
+        `infected_by` field; Found breadth first.
+
+        :param patient: string, the name of the patient
+        :param depth: integer, the most steps of infection to follow, or None
+        to follow every step
+        :return: list of (patient, infected_by, depth) tuples, in order of
+        depth; Or an empty list for unknown patients
+        """
+        self._catch_up()
+
+        from flask import escape
+        _patient = escape(patient)
+
+        if (not _patient in self._timelines) and (not _patient in self._graph):
+            return list()
+
+        return self._graph.cluster(_patient, depth)
+
+    def largest_clusters(self, n=10):
+        """
+        The largest clusters of patients connected by infections.
+
+        :param n: integer, the most clusters to return
+        :return: list of (index case, size) tuples, largest first; Where the
+        index case is the first patient of the cluster recorded
+        """
+        self._catch_up()
+
+        return self._graph.largest_clusters(n)
+
+    def epicurve(self, event_type="patient_infected", window=7, since=None,
+            until=None, location=None):
+        """
+        The daily incidence of an event type by location, with its rolling
+        growth rate and doubling time; Computed over columns of the rows
+        with NumPy, rather than by scanning the rows. See
+        `Analytics.epicurve()`; Raising ValueError if the range of days is
+        too wide.
+
+        :param event_type: string, the event type counted as an incident case
+        :param window: integer, the number of days of each rolling window
+        :param since: datetime, the first day counted, or None
+        :param until: datetime, the day after the last day counted, or None
+        :param location: string, the only location counted, or None
+        :return: dictionary, see `Analytics.epicurve()`
+        """
+        self._catch_up()
+
+        from flask import escape
+        from .Analytics import epicurve
+        if not location is None:
+            location = str(escape(location))
+
+        return epicurve(
+            self._columns, str(escape(event_type)), window, since, until,
+            location
+            )
+
+    def _time_window(self, since, until, time_field):
+        """
+        Find the rows with a `time_field` in the range [since, until) by
+        binary search, over the sorted keys of `time_field`.
+        see: https://docs.python.org/3/library/bisect.html
+
+        :param since: datetime, or None for no lower bound
+        :param until: datetime, or None for no upper bound
+        :param time_field: string, `_timestamp` or `date_time`
+        :return: tuple, of the sorted (time, `_seq`) keys of `time_field`,
+        and the start and end positions of the range within them
+        """
+        import bisect
+        keys = self._time_keys[time_field]
+
+        #a key of just the time sorts before every (time, `_seq`) key holding
+        #that time
+        lo = 0
+        if not since is None:
+            lo = bisect.bisect_left(keys, (since,))
+
+        hi = len(keys)
+        if not until is None:
+            hi = bisect.bisect_left(keys, (until,))
+
+        return keys, lo, max(lo, hi)
+
+    def encoded(self, row):
+        """
+        The JSON encoding of a row, as given by `row_to_JSON_safe()`. Encoded
+        rows are cached, such that each row is usually only encoded once.
+
+        :param row: dictionary, a row as returned by Database
+        :return: bytes
+        """
+        res = self._encoded_rows.get(row["_seq"])
+
+        if res is None:
+            res = _json_dumps( row_to_JSON_safe(row) )
+            self._encoded_rows.put(row["_seq"], res)
+
+        return res
+
+    def encoded_list(self, rows):
+        """
+        The JSON encoding of a list of rows, joined from the encoding of
+        each row.
+
+        :param rows: iterable of dictionaries, rows as returned by Database
+        :return: bytes
+        """
+        return b"[" + b",".join( self.encoded(row) for row in rows ) + b"]"
 
     def _check_disk_usage(self):
         """
-        A function to check the disk usage of the server the app is running on.
+        A function to check the disk usage of the volume holding the database.
         This prevents new insertions to the database if the disk is too full
         to take them.
+        The disk usage is sampled in the background by a Disk_Monitor, so
+        this only reads the result of the last sample.
 
         :return: None
         """
-        import shutil
-        usage = shutil.disk_usage("/")
-
-        if ((usage.free / usage.total) <= .01):
+        if self._disk_monitor.is_full:
             import errno
             raise OSError(errno.ENOSPC, "No space left on device")
 
+    def seconds_to_full(self):
+        """
+        Project the time until the volume holding the database is full, at
+        the recent rate of writes.
+
+        :return: float, or None if nothing is being written
+        """
+        return self._disk_monitor.seconds_to_full()
+
+    def compact(self):
+        """
+        Write a snapshot of the rows held in memory, and the indexes over
+        them; Then remove the segments of the log the snapshot covers, and
+        any older snapshot. Later opening the database then loads the snapshot
+        and replays only the rows appended since.
+        Rows can be appended while the snapshot is written; The process is
+        forked holding the log, and the child process writes the snapshot from
+        its copy of memory, while the parent process carries on. Where fork
+        isn't supported, the snapshot is written holding the log.
+        see: https://man7.org/linux/man-pages/man2/fork.2.html
+
+        :return: boolean, if a snapshot was written; Or False if no rows have
+        been appended since the last snapshot
+        """
+        import os
+        from .Snapshot import write_snapshot, remove_snapshots
+
+        with self._compact_lock:
+            with self._log.lock():
+                self._catch_up()
+
+                seq = len(self._rows)
+                if seq == self._snapshot_seq:
+                    return False
+
+                #start a new segment, so the snapshot covers whole segments
+                self._log.roll_over()
+
+                pid = None
+                if hasattr(os, "fork"):
+                    pid = os.fork()
+
+                if pid == 0: #the child process
+                    status = 0
+                    try:
+                        write_snapshot(self._log.path, seq, self._snapshot_state())
+                    except BaseException:
+                        import traceback
+                        traceback.print_exc()
+                        status = 1
+                    finally:
+                        os._exit(status)
+
+                if pid is None:
+                    write_snapshot(self._log.path, seq, self._snapshot_state())
+
+            if not pid is None:
+                _, status = os.waitpid(pid, 0)
+                if status != 0:
+                    raise OSError(f"Failed to write a snapshot of {seq} rows")
+
+            with self._log.lock():
+                self._log.truncate(seq)
+                remove_snapshots(self._log.path, seq)
+
+            self._snapshot_seq = seq
+            return True
+
+    def _snapshot_state(self):
+        """
+        The state saved to snapshots, see `compact()` and `_load()`.
+
+        :return: dictionary, mapping attribute names to their values
+        """
+        return {k: getattr(self, k) for k in _SNAPSHOT_ATTRIBUTES}
+
+    def close(self):
+        """
+        Stop monitoring the disk and compacting, commit any rows waiting to
+        be written, and close the log.
+
+        :return: None
+        """
+        if not self._compactor is None:
+            self._compactor.stop()
+
+        self._disk_monitor.stop()
+        self._writer.stop()
+        self._log.close()
+
     def __repr__(self):
         """
         A convenience function to return the content of the database, ordered
@@ -217,20 +1218,210 @@ class Database:
 
         :return: list of dictionaries
         """
-        _all = self._data_table.all()
+        self._catch_up()
 
-        #if there are no records, then no need for sorting
-        if len(_all) == 0:
-            return _all
-
-        #return a sorted list of the records in the database, sorted by timestmap
-        #see: https://stackoverflow.com/questions/72899/how-do-i-sort-a-list-of-dictionaries-by-a-value-of-the-dictionary
-        from operator import itemgetter
-        return sorted(_all , key=itemgetter('_timestamp') )
+        #rows are kept ordered by timestamp as they are added, see `_order_row()`
+        return list(self._ordered)
 
     def __str__(self):
         return str(self.__repr__())
 
+class Encoded_Row_Cache:
+    """
+    The Encoded_Row_Cache class.
+
+    Maps the `_seq` of a row to its JSON encoding. Once the encodings held
+    total more than `max_bytes`, the least recently used are evicted.
+    """
+    def __init__(self, max_bytes):
+        import threading
+        from collections import OrderedDict
+
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, seq):
+        """
+        :param seq: integer, the `_seq` of a row
+        :return: bytes, or None if not cached
+        """
+        with self._lock:
+            res = self._entries.get(seq)
+
+            if not res is None:
+                self._entries.move_to_end(seq)
+
+            return res
+
+    def put(self, seq, encoded):
+        """
+        :param seq: integer, the `_seq` of a row
+        :param encoded: bytes, the encoding of the row
+        :return: None
+        """
+        #an encoding larger than the cache would only evict everything else
+        if len(encoded) > self._max_bytes:
+            return
+
+        with self._lock:
+            if seq in self._entries:
+                return
+
+            self._entries[seq] = encoded
+            self._bytes += len(encoded)
+
+            while self._bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+def make_cursor(row):
+    """
+    Make an opaque cursor marking the position of a row, for use with
+    `Database.page()` and `Database.search()`.
+
+    :param row: dictionary, a row as returned by Database
+    :return: string
+    """
+    import json
+    import base64
+    _key = [row["_timestamp"].isoformat(), row["_seq"]]
+    return base64.urlsafe_b64encode( json.dumps(_key).encode() ).decode()
+
+def _parse_cursor(cursor):
+    """
+    The inverse of `make_cursor()`; Raising `Bad_Cursor` on malformed cursors.
+
+    :param cursor: string
+    :return: tuple, of the `_timestamp` and `_seq` of the row
+    """
+    import json
+    import base64
+    from datetime import datetime
+    try:
+        _timestamp, _seq = json.loads( base64.urlsafe_b64decode(cursor.encode()) )
+        return (datetime.fromisoformat(_timestamp), int(_seq))
+    except (ValueError, TypeError) as e:
+        raise Bad_Cursor(f"Malformed cursor: {cursor}") from e
+
+def _select(rows, positions, start, q, filters=()):
+    """
+    Yield the rows at `positions[start:]` of which the query `q` is a subset
+    of each row; As with TinyDB's `Query().fragment()`.
+    see: https://tinydb.readthedocs.io/en/latest/usage.html#advanced-queries
+
+    :param rows: list of dictionaries
+    :param positions: list of integers, positions in `rows`
+    :param start: integer
+    :param q: dictionary
+    :param filters: list of functions, taking a row and returning a boolean,
+    to further select rows by; Such as returned by `_time_filter()`
+    :return: generator of dictionaries
+    """
+    for i in range(start, len(positions)):
+        row = rows[positions[i]]
+        if _matches(row, q) and all( f(row) for f in filters ):
+            yield row
+
+def _time_filter(since, until, time_field):
+    """
+    Make a function checking if a row has a `time_field` in the range
+    [since, until); For when rows are not selected from the range by
+    `Database._time_window()`.
+
+    :param since: datetime, or None
+    :param until: datetime, or None
+    :param time_field: string, `_timestamp` or `date_time`
+    :return: function, taking a row and returning a boolean
+    """
+    def _in_range(row):
+        time = parse_time( row.get(time_field) )
+
+        if time is None:
+            return False
+
+        return ((since is None) or (since <= time)) and \
+            ((until is None) or (time < until))
+
+    return _in_range
+
+def _insert_sorted(keys, key):
+    """
+    Insert a key into a sorted list of keys; Appending where the key sorts
+    last, as is usual, and otherwise inserting by binary search.
+
+    :param keys: list
+    :param key: a key comparable with those of `keys`
+    :return: integer, the position the key was inserted at
+    """
+    if (len(keys) == 0) or (keys[-1] <= key):
+        keys.append(key)
+        return len(keys) - 1
+
+    import bisect
+    i = bisect.bisect_right(keys, key)
+    keys.insert(i, key)
+    return i
+
+def parse_time(value):
+    """
+    Parse a time given as an ISO 8601 string (such as a `date_time` entered
+    by a user), or as a datetime; Into a naive datetime in local time, as
+    `_timestamp`s are stored, so that the two can be compared.
+    see: https://docs.python.org/3/library/datetime.html#datetime.datetime.fromisoformat
+
+    :param value: string, datetime, or None
+    :return: datetime, or None if `value` isn't a time
+    """
+    from datetime import datetime
+
+    if isinstance(value, datetime):
+        time = value
+    elif isinstance(value, str):
+        try:
+            time = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    else:
+        return None
+
+    if not time.tzinfo is None:
+        time = time.astimezone().replace(tzinfo=None)
+
+    return time
+
+def _merge_unique(iterables):
+    """
+    Merge iterables of rows, each in order of `_seq`, into a single iterable
+    in order of `_seq`; Skipping rows already yielded.
+    see: https://docs.python.org/3/library/heapq.html#heapq.merge
+
+    :param iterables: list of iterables of dictionaries
+    :return: generator of dictionaries
+    """
+    import heapq
+    from operator import itemgetter
+
+    last = None
+    for row in heapq.merge(*iterables, key=itemgetter("_seq")):
+        if row["_seq"] != last:
+            last = row["_seq"]
+            yield row
+
+def _matches(row, q):
+    """
+    Determine if the query `q` is a subset of the row.
+
+    :param row: dictionary
+    :param q: dictionary
+    :return: boolean
+    """
+    return all( (k in row) and (row[k] == q[k]) for k in q )
+
 def to_JSON_safe(rows):
     '''
     A helper function to convert outputted database rows into a format that can
@@ -240,16 +1431,20 @@ def to_JSON_safe(rows):
     :return: sanitized list of dictionaries
     '''
 
-    res = list()
+    return [row_to_JSON_safe(row) for row in rows]
 
-    for row in rows:
-        tmp = dict(row)
-        from datetime import datetime
-        tmp["_timestamp"] = row["_timestamp"].isoformat()
-        res.append( tmp )
+def row_to_JSON_safe(row):
+    '''
+    As `to_JSON_safe()`, but for a single row.
+
+    :param row: dictionary
+    :return: sanitized dictionary
+    '''
+    tmp = dict(row)
+    tmp["_timestamp"] = row["_timestamp"].isoformat()
 
-        if "date_time" in row:
-            if hasattr(row["date_time"], "isoformat"):
-                tmp["date_time"] = row["date_time"].isoformat()
+    if "date_time" in row:
+        if hasattr(row["date_time"], "isoformat"):
+            tmp["date_time"] = row["date_time"].isoformat()
 
-    return res
\ No newline at end of file
+    return tmp
\ No newline at end of file
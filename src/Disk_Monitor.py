@@ -0,0 +1,125 @@
+"""
+Disk Monitor module
+
+Watches the free space of the volume holding the database from a background
+thread; So that appending to the database need only read a cached flag, rather
+than querying the filesystem on every insert.
+
+Disk_Monitor
+The main class of the module. Samples the free space of a volume on a timer,
+and projects the time until the volume is full from the recent rate of writes.
+"""
+
+class Disk_Monitor:
+    """
+    The Disk_Monitor class.
+
+    Samples the disk usage of the volume holding `path` every `interval`
+    seconds. The volume is considered full once the fraction of free space
+    falls to `min_free_fraction` or below.
+    The rate of writes is measured from `bytes_written`, a function returning
+    the total number of bytes written so far; And is smoothed across samples.
+    """
+    def __init__(self, path, bytes_written=None, interval=5.0,
+            min_free_fraction=.01):
+        import threading
+        from pathlib import Path
+
+        self._path = Path(path)
+        self._bytes_written = bytes_written
+        self._interval = interval
+        self._min_free_fraction = min_free_fraction
+
+        self.free = None
+        self.total = None
+        self.is_full = False
+        self.write_rate = 0.0 #bytes per second
+
+        self._last_sample_time = None
+        self._last_bytes_written = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Take a first sample, then continue sampling on a background thread.
+
+        :return: None
+        """
+        self.sample()
+
+        import threading
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling.
+
+        :return: None
+        """
+        self._stop.set()
+
+        if not self._thread is None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            #an error sampling (say, a transient EIO) is retried next interval,
+            #rather than stopping the thread with `is_full` left as it was
+            try:
+                self.sample()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+    def sample(self):
+        """
+        Sample the disk usage of the volume, and the rate of writes since the
+        last sample.
+
+        :return: None
+        """
+        import time
+        import shutil
+        usage = shutil.disk_usage(self._path)
+
+        self.free = usage.free
+        self.total = usage.total
+        if usage.total > 0:
+            self.is_full = ((usage.free / usage.total) <= self._min_free_fraction)
+        else: #a volume reporting no size, so only its free space can tell
+            self.is_full = (usage.free == 0)
+
+        if self._bytes_written is None:
+            return
+
+        now = time.monotonic()
+        written = self._bytes_written()
+
+        if not self._last_sample_time is None:
+            elapsed = now - self._last_sample_time
+            if elapsed > 0:
+                rate = (written - self._last_bytes_written) / elapsed
+
+                #an exponentially weighted moving average, so that a single
+                #burst of writes doesn't dominate the projection
+                #see: https://en.wikipedia.org/wiki/Moving_average#Exponential_moving_average
+                self.write_rate = (.5 * rate) + (.5 * self.write_rate)
+
+        self._last_sample_time = now
+        self._last_bytes_written = written
+
+    def seconds_to_full(self):
+        """
+        Project the time until the volume is full, at the recent rate of writes.
+
+        :return: float, or None if nothing is being written
+        """
+        if (self.free is None) or (self.write_rate <= 0):
+            return None
+
+        reserved = self.total * self._min_free_fraction
+        return max(self.free - reserved, 0) / self.write_rate
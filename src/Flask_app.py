@@ -3,16 +3,24 @@ Flask_app module
 
 Defines a flask application for handling HTTP traffic.
 
+create_app()
+Makes a new Flask application bound to a Database, and returns it as a WSGI
+application.
+
 run()
 The main entrypoint for the Flask application.
-Starts the flask application running.
+Starts the flask application running, with the development server.
+
+serve()
+Starts the flask application running across many pre-forked worker processes.
 """
 
 #TODO
 '''
 Run with a proper web server, rather than the integrated development server
-The development server should be fine for the simple testing assocaited
-with this project
+`serve()` pre-forks workers around the WSGI server bundled with Werkzeug,
+which scales across cores, but a dedicated server (e.g., gunicorn) would also
+handle worker restarts, timeouts and graceful reloads
     see:
     https://flask.palletsprojects.com/en/2.1.x/tutorial/deploy/#run-with-a-production-server
 '''
@@ -22,6 +30,8 @@ with this project
     When accessing `request.json` the following error is returned for all requests:
         `code 400, message Bad request syntax`
     A fix is to avoid accessing the parameter on `request`
+    JSON bodies are instead decoded from the raw request data,
+    see `_request_input()`
 '''
 #BUG
 '''
@@ -79,41 +89,163 @@ TODO
 '''
 '''
 TODO
-    JSON
-    Adding JSON support seems trivial, but seemed to more complex than
-    was arranted for this exercise
-    It would be useful to have the server accept JSON input as well as
-    plain-text
-        see:
-        https://flask.palletsprojects.com/en/2.1.x/api/#module-flask.json
+    Bearer tokens are revoked in memory, see Token_Signer; So with `serve()`,
+    a token revoked through one worker is still accepted by the others until
+    it expires. The deny list could be shared between workers, as rows are,
+    see Segmented_Log
 '''
-_db = None
-_ah = None
+#JSON is decoded and encoded as with Database, with orjson where installed
+from .Database import _json_dumps, _json_loads
+
+def create_app(db, token_key=None):
+    """
+    The application factory. Makes a new Flask application, bound to a
+    Database; Each application made serving its own Database, held by the
+    application rather than by this module, see `_get_db()`.
+
+    :param db: Database
+    :param token_key: bytes, the key bearer tokens are signed with; Or None
+    for a random key. Processes serving the same clients must share a key
+    :return: the Flask application, a WSGI application
+    """
+    from flask import Flask
+    from flask_restx import Api
+    from flask_limiter import Limiter
+    from .Authorization_Handler import Authorization_Handler, Token_Signer
+    from .Compression import Compressed_Cache
+
+    app = Flask(__name__)
+
+    app.extensions["database"] = db
+    app.extensions["authorization_handler"] = Authorization_Handler(
+        db, token_signer=Token_Signer(token_key)
+        )
+    #compressed bodies of responses, by their entity tag, see `_compress_response()`
+    app.extensions["compressed_cache"] = Compressed_Cache()
+
+    api = Api(app)
+    api.representation("application/json")(_output_json)
+    api.add_namespace(_ns)
+
+    #rate limiting to avoid swamping the server, applied to each endpoint
+    #see: https://flask-limiter.readthedocs.io/en/stable/configuration.html#ratelimit-defaults
+    Limiter(
+        app,
+        #apply the limit to all incoming requests not just single IPs
+        key_func = lambda : "",
+        default_limits = ["20/second"],
+        )
+
+    app.after_request(_compress_response)
+
+    return app
+
+def _get_db():
+    """
+    :return: Database, that of the application handling the current request
+    """
+    from flask import current_app
+    return current_app.extensions["database"]
+
+def _get_ah():
+    """
+    :return: Authorization_Handler, that of the application handling the
+    current request
+    """
+    from flask import current_app
+    return current_app.extensions["authorization_handler"]
 
 def run(db, _debug = False):
-    global _ah
-    global _db
+    create_app(db).run(debug=_debug)
 
-    _db = db
+def serve(db_path, workers=2, host="127.0.0.1", port=5000, durability="batch",
+        compact_interval=None):
+    """
+    Serve the Flask application from `workers` worker processes, forked from
+    this process, sharing a single listening socket. Each worker opens its own
+    Database at `db_path`, see Database for how rows are shared between them.
+    Returns once all workers have exited; Stopping all workers on SIGINT or
+    SIGTERM.
+    see: https://docs.python.org/3/library/os.html#os.fork
+
+    :param db_path: a path, as taken by Database
+    :param workers: integer, the number of worker processes
+    :param host: string
+    :param port: integer
+    :param durability: string, as taken by Database
+    :param compact_interval: number, as taken by Database; Only the first
+    worker compacts the database, for all of them
+    :return: None
+    """
+    import os
+    import signal
+    import socket
 
-    from .Authorization_Handler import Authorization_Handler
-    _ah = Authorization_Handler(db)
+    sock = socket.create_server((host, port), backlog=128)
+    sock.set_inheritable(True)
 
-    _app.run(debug=_debug)
+    #workers share the key tokens are signed with, so that a token issued by
+    #one worker is accepted by the others
+    token_key = os.urandom(32)
 
-from flask import Flask
-_app = Flask(__name__)
+    pids = list()
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0: #the worker process
+            status = 0
+            try:
+                _serve_worker(
+                    db_path, host, port, sock, durability,
+                    compact_interval if (i == 0) else None, token_key
+                    )
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        pids.append(pid)
 
-from flask_restx import Api
-_api = Api(_app)
+    sock.close()
 
-#rate limiting to avoid swamping the server
-from flask_limiter import Limiter
-_limiter = Limiter(
-    _app,
-    #apply the limit to all incoming requests not just single IPs
-    key_func = lambda : "",
-    )
+    def stop_workers(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop_workers)
+    signal.signal(signal.SIGTERM, stop_workers)
+
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+def _serve_worker(db_path, host, port, sock, durability, compact_interval,
+        token_key):
+    """
+    The body of a worker process started by `serve()`.
+
+    :return: None
+    """
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN) #the parent stops the workers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    from .Database import Database
+    app = create_app( Database(
+        db_path, durability=durability, compact_interval=compact_interval
+        ), token_key )
+
+    #see: https://werkzeug.palletsprojects.com/en/2.1.x/serving/#werkzeug.serving.make_server
+    from werkzeug.serving import make_server
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+#the endpoints of the application, added to each application made by
+#`create_app()`
+from flask_restx import Namespace
+_ns = Namespace("log", path="/")
 
 #custom exception for HTTP error 507
 from werkzeug.exceptions import HTTPException
@@ -125,18 +257,146 @@ class InsufficientStorage(HTTPException):
     code = 507
     description = 'Insufficient Storage'
 
+def _output_json(data, code, headers=None):
+    """
+    Encode the data returned by a handler as a JSON response; Replacing the
+    encoder of Flask-restx, with `_json_dumps()`.
+    see: https://flask-restx.readthedocs.io/en/latest/api.html#flask_restx.Api.representation
+
+    :param data: the data returned by a handler
+    :param code: integer, the status code
+    :param headers: dictionary, of headers to add to the response
+    :return: a Flask response
+    """
+    from flask import Response
+    return Response(
+        _json_dumps(data), status=code, mimetype="application/json", headers=headers
+        )
+
+def _compress_response(response):
+    """
+    Compress a response with the encoding negotiated with the client, see the
+    Compression module. Streamed responses are compressed as they are sent.
+    The compressed bodies of responses with an entity tag are cached, as the
+    tag only changes along with the body, see Main.get().
+
+    :param response: a Flask response
+    :return: the Flask response
+    """
+    from flask import request
+    from flask import current_app
+    from . import Compression
+
+    response.vary.add("Accept-Encoding")
+
+    if (response.status_code in [204, 304]) or (response.status_code < 200) or \
+            ("Content-Encoding" in response.headers):
+        return response
+
+    #events are sent as they happen, where a compressor would hold them back
+    if response.mimetype == "text/event-stream":
+        return response
+
+    encoding = Compression.negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    etag, _ = response.get_etag()
+
+    if response.is_streamed:
+        response.response = Compression.compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        if len( response.get_data() ) < Compression.MIN_COMPRESS_BYTES:
+            return response
+
+        _compressed_cache = current_app.extensions["compressed_cache"]
+        compressed = None
+        if not etag is None:
+            compressed = _compressed_cache.get(etag, encoding)
+
+        if compressed is None:
+            compressed = Compression.compress(response.get_data(), encoding)
+
+            if not etag is None:
+                _compressed_cache.put(etag, encoding, compressed)
+
+        response.set_data(compressed)
+
+    #the compressed body differs from the body the tag was made for, so the
+    #tag is weakened; It still holds for conditional requests, see Main.get()
+    if not etag is None:
+        response.set_etag(etag, weak=True)
+
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+def _authorize(request):
+    """
+    Check the authentication of a request, by HTTP Basic credentials or by a
+    bearer token (see Token); Aborting with 401 if the request is not
+    authorized.
+
+    :param request: a Flask request
+    :return: string, the username of the authorized user
+    """
+    from flask import abort
+
+    token = _bearer_token(request)
+    if not token is None:
+        from .Authorization_Handler import Bad_Token
+        try:
+            return _get_ah().token_username(token)
+        except Bad_Token as e:
+            abort(401, str(e))
+
+    from .Authorization_Handler import Missing_Username_Or_Password
+    from .Authorization_Handler import Bad_Username_Or_Password
+    try:
+        authorized = _get_ah().is_authorized( request.authorization )
+    except Missing_Username_Or_Password:
+        abort(401, "Username and password required.")
+    except Bad_Username_Or_Password:
+        abort(401, _get_ah().not_authorized_msg)
+    else:
+        if not authorized:
+            abort(401, _get_ah().not_authorized_msg)
+
+    return (request.authorization or dict()).get("username")
+
+def _bearer_token(request):
+    """
+    :param request: a Flask request
+    :return: string, the token of a `Bearer` Authorization header; Or None
+    see: https://datatracker.ietf.org/doc/html/rfc6750#section-2.1
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+
+    return token.strip()
+
+def _is_out_of_storage(e):
+    """
+    Determine if an OSError raised by Database is due to being out of storage.
+
+    :param e: OSError
+    :return: boolean
+    """
+    import errno
+    return (e.errno == errno.ENOSPC) or ( str(errno.ENOSPC) == str(e) )
+
+#the ways a successful POST can respond, see Main.post()
+_post_response_modes = ["full", "record", "ack"]
+
 from flask_restx import Resource
-@_api.route('/log')
+@_ns.route('/log')
 class Main(Resource):
     """
     A class defining the behaviour of the Flask application
     Not meant for instantiation, but to configure Flask for this application
     """
 
-    #apply the rate limiter to each handler
-    #see: https://flask-limiter.readthedocs.io/en/stable/recipes.html#using-flask-pluggable-views
-    decorators = [_limiter.limit("20/second")]
-
     def post(self):
         """
         A handler function for flask that is called for all POST HTTP requests
@@ -148,6 +408,15 @@ class Main(Resource):
         Returns the entire database if there is no data input
         Appends username information to successful inserts
         Attempts to insert in the database and raises errors on issues
+
+        Input is read from form data, or from a JSON body
+        (`application/json`); Which may be a single event, or a list of events
+        that are appended and reported on as with Bulk.post().
+
+        Responds according to the `response` query parameter:
+            `full` (default), the entire database
+            `record`, only the stored record
+            `ack`, an empty 204 response
         """
 
         from flask import request
@@ -161,41 +430,43 @@ class Main(Resource):
                 #see: https://www.w3.org/Protocols/rfc2616/rfc2616-sec10.html#sec10.4.15
                 abort(414)
 
-        from .Authorization_Handler import Missing_Username_Or_Password
-        from .Authorization_Handler import Bad_Username_Or_Password
-        try:
-            authorized = _ah.is_authorized( request.authorization )
-        except Missing_Username_Or_Password:
-            abort(401, "Username and password required.")
-        except Bad_Username_Or_Password:
-            abort(401, _ah.not_authorized_msg)
-        else:
-            if not authorized:
-                abort(401, _ah.not_authorized_msg)
+        _user = _authorize(request)
+
+        response_mode = request.args.get("response", "full")
+        if not response_mode in _post_response_modes:
+            abort(400, f"response should be one of: {_post_response_modes}")
         
-        _input = dict(request.form)
+        _input = _request_input(request)
         
         if len(_input) == 0: #don't append empty input
             from .Database import to_JSON_safe
-            return to_JSON_safe( _db.__repr__() )
+            return to_JSON_safe( _get_db().__repr__() )
+
+        #a JSON list of events is appended as with Bulk.post()
+        if isinstance(_input, list):
+            for row in _input:
+                row["_user"] = _user
+
+            stored, invalid = _store(_get_db().extend, _input)
 
-        _input["_user"] = request.authorization['username']
+            return _bulk_report(stored, invalid)
+
+        _input["_user"] = _user
 
         from . import Validation_and_Standardization_Handler as vns
         try:
-            res = _db.append( _input )
-        except OSError as e:
-            import errno
-            if ( str(errno.ENOSPC) == str(e) ):
-                m = 'Could not append to the database as out of storage.'
-                raise InsufficientStorage(m)
-            else:
-                raise #raise other OSError
+            res = _store(_get_db().append, _input)
         except vns.Malformed_Input as e:
             abort(400, str(e))
 
+        if response_mode == "ack":
+            return "", 204
+
         from .Database import to_JSON_safe
-        return to_JSON_safe( _db.__repr__() )
+        if response_mode == "record":
+            return to_JSON_safe( [res] )[0]
+
+        return to_JSON_safe( _get_db().__repr__() )
 
     def get(self):
         """
@@ -207,6 +478,33 @@ class Main(Resource):
         Checks authentication
         Returns the entire database if there is no data input
         Returns search results for any data passed.
+
+        The query is read from form data, or from a JSON body
+        (`application/json`); Which may be a single query, or a list of
+        queries returning the rows that match any of them.
+
+        Results can be paged with the `limit` and `cursor` query parameters;
+        Where the cursor for the next page is returned in the `X-Next-Cursor`
+        header. With the `stream` query parameter set, results are instead
+        streamed as they are encoded.
+
+        Results can be limited to a range of times with the `since` and
+        `until` query parameters, ISO 8601 times; Applying to `_timestamp`,
+        or to `date_time` with the `time_field` query parameter.
+
+        The `text` query parameter searches the words of `notes`, or of
+        another free-text field named by `text_field`; See Text_Query for
+        the form of a search.
+
+        The `after` query parameter returns only rows with a greater `_seq`,
+        in order of `_seq` (-1 for every row); For mirroring the log. Paged
+        with `limit`, where the `after` of the next page is returned in the
+        `X-Next-After` header, rather than a cursor.
+
+        Responses carry an `ETag` header, of the version of the database and
+        the query; So a request with a matching `If-None-Match` header gets
+        an empty 304 response until rows are appended, without the database
+        being read.
         """
 
         from flask import request
@@ -220,24 +518,881 @@ class Main(Resource):
                 #see: https://www.w3.org/Protocols/rfc2616/rfc2616-sec10.html#sec10.4.15
                 abort(414)
 
-        from .Authorization_Handler import Missing_Username_Or_Password
-        from .Authorization_Handler import Bad_Username_Or_Password
+        _authorize(request)
+
+        paging = _paging_args(request.args)
+        paging.update( _time_range_args(request.args) )
+        paging.update( _text_search_args(request.args) )
+        stream = request.args.get("stream", "0") in ["1", "true"]
+
+        if "after" in request.args:
+            if "cursor" in paging:
+                abort(400, "Use one of cursor or after.")
+
+            paging["after"] = _seq_arg(request.args["after"], "after")
+
+        search_args = _request_input(request)
+
+        #the version is read before the rows, so a response is never tagged
+        #with a later version than the rows it holds
+        etag = _etag(_get_db().version(), request.args, search_args)
+        if request.if_none_match.contains_weak(etag):
+            from flask import Response
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        #without a query or a full-text search, rows are read in order of
+        #time; Unless read after a `_seq`, in order of `_seq`
+        browse = (len(search_args) == 0) and (not "text" in paging) and \
+            (not "after" in paging)
+
+        from .Database import Bad_Cursor
+        from .Text_Index import Bad_Text_Query
+        try:
+            if stream:
+                _paging = dict(paging)
+                limit = _paging.pop("limit", None)
+
+                if browse:
+                    rows = _get_db().iter_rows(**_paging)
+                elif isinstance(search_args, list):
+                    rows = _get_db().iter_search_any(search_args, **_paging)
+                else:
+                    rows = _get_db().iter_search(search_args, **_paging)
+
+                response = _stream_rows(rows, limit)
+
+            #if no query, then return the entire database
+            elif (len(search_args) == 0) and (len(paging) == 0):
+                response = _rows_response( _get_db().__repr__() )
+
+            else:
+                if browse:
+                    res = _get_db().page(**paging)
+                elif isinstance(search_args, list):
+                    res = _get_db().search_any(search_args, **paging)
+                else:
+                    res = _get_db().search(search_args, **paging)
+
+                if "after" in paging:
+                    headers = _next_after_header(res, paging["after"])
+                else:
+                    headers = _next_cursor_header(res, paging)
+
+                response = _rows_response(res, headers)
+        except (Bad_Cursor, Bad_Text_Query) as e:
+            abort(400, str(e))
+
+        response.set_etag(etag)
+        return response
+
+#the longest a long-poll of Changes waits for new rows, and the longest a
+#stream of Server-Sent Events goes without sending anything; In seconds
+_max_long_poll_seconds = 60
+_keep_alive_seconds = 15
+
+#the query parameters of Changes that aren't fields to filter rows by
+_changes_params = ["after", "timeout", "limit"]
+
+@_ns.route('/log/changes')
+class Changes(Resource):
+    """
+    A class defining the behaviour of the change feed endpoint, for following
+    the rows appended to the log as they are committed.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def get(self):
+        """
+        A handler function for flask that is called for all GET HTTP requests
+        to the change feed endpoint.
+
+        Responds with the rows appended after the row with the `_seq` given
+        by the `after` query parameter (-1 for every row); Or, without it,
+        the rows appended from now on. Other query parameters (and form data
+        or a JSON body) filter the rows by field, as with a search of
+        Main.get().
+
+        Requests accepting `text/event-stream` are sent a stream of
+        Server-Sent Events, one per row with the `_seq` of the row as its id,
+        for as long as the client stays connected; Resuming after the
+        `Last-Event-ID` header on reconnecting.
+        see: https://html.spec.whatwg.org/multipage/server-sent-events.html
+
+        Otherwise the request is long-polled; Held for up to `timeout`
+        seconds (default and at most 60) until there are rows to respond
+        with, then responding with a JSON list of up to `limit` rows. The
+        `X-Next-After` header is the `after` of the next poll.
+        """
+
+        from flask import request
+        from flask import abort
+
+        _authorize(request)
+
+        after = request.headers.get("Last-Event-ID", request.args.get("after"))
+        if after is None:
+            after = _get_db().version() - 1
+        else:
+            after = _seq_arg(after, "after")
+
+        q = _request_input(request)
+        if isinstance(q, list):
+            abort(400, "Changes are filtered by a single query.")
+        q.update( (k, v) for k, v in request.args.items() if not k in _changes_params )
+
+        best = request.accept_mimetypes.best_match(
+            ["application/json", "text/event-stream"]
+            )
+        if best == "text/event-stream":
+            return _stream_changes(after, q)
+
+        timeout = _max_long_poll_seconds
+        if "timeout" in request.args:
+            timeout = min( _positive_int_arg(request.args, "timeout"), timeout )
+
+        limit = None
+        if "limit" in request.args:
+            limit = _positive_int_arg(request.args, "limit")
+
+        import time
+        from itertools import islice
+        deadline = time.monotonic() + timeout
+        while True:
+            #rows appended while reading are left to the next poll, so that
+            #`after` marks all the rows checked
+            end = _get_db().version()
+            rows = list( islice(_get_db().iter_changes(after, q, end), limit) )
+
+            if (not limit is None) and (len(rows) == limit):
+                after = rows[-1]["_seq"]
+            else:
+                after = max(after, end - 1)
+
+            remaining = deadline - time.monotonic()
+            if (len(rows) > 0) or (remaining <= 0):
+                break
+
+            _get_db().wait_for_rows(after, remaining)
+
+        return _rows_response( rows, {"X-Next-After": str(after)} )
+
+def _stream_changes(after, q):
+    """
+    Stream the rows appended after `after` matching `q` as Server-Sent Events,
+    waiting on new rows between events; With a comment sent every
+    `_keep_alive_seconds` without rows, so that idle connections are kept.
+
+    :param after: integer, a `_seq`
+    :param q: dictionary, a query
+    :return: a streamed Flask response
+    """
+    db = _get_db()
+
+    def generate():
+        _after = after
+        while True:
+            end = db.version()
+            for row in db.iter_changes(_after, q, end):
+                yield b"id: %d\nevent: row\ndata: %s\n\n" % (row["_seq"], db.encoded(row))
+            _after = max(_after, end - 1)
+
+            if not db.wait_for_rows(_after, _keep_alive_seconds):
+                yield b": keep-alive\n\n"
+
+    from flask import Response
+    from flask import stream_with_context
+    return Response(
+        stream_with_context( generate() ), mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+        )
+
+@_ns.route('/patients/<string:name>/timeline')
+class Timeline(Resource):
+    """
+    A class defining the behaviour of the patient timeline endpoint, for
+    following the audit trail of a single patient.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def get(self, name):
+        """
+        A handler function for flask that is called for all GET HTTP requests
+        to the patient timeline endpoint.
+
+        Returns the events of the patient `name`, ordered by `_timestamp`; An
+        empty list if there are none. Paged with the `limit` and `cursor`
+        query parameters, as with Main.get().
+        """
+
+        from flask import request
+        from flask import abort
+
+        _authorize(request)
+
+        paging = _paging_args(request.args)
+
+        from .Database import Bad_Cursor
         try:
-            authorized = _ah.is_authorized( request.authorization )
-        except Missing_Username_Or_Password:
+            res = _get_db().timeline(name, **paging)
+        except Bad_Cursor as e:
+            abort(400, str(e))
+
+        return _rows_response( res, _next_cursor_header(res, paging) )
+
+@_ns.route('/patients/<string:name>/chain')
+class Chain(Resource):
+    """
+    A class defining the behaviour of the transmission chain endpoint, for
+    tracing how a patient came to be infected.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def get(self, name):
+        """
+        A handler function for flask that is called for all GET HTTP requests
+        to the transmission chain endpoint.
+
+        Returns the chain of infections leading to the patient `name`, as
+        recorded by the `infected_by` field of events; A list of patients
+        from the first infected to `name`. An empty list for unknown patients.
+        """
+
+        from flask import request
+
+        _authorize(request)
+
+        return _get_db().transmission_chain(name)
+
+@_ns.route('/patients/<string:name>/cluster')
+class Cluster(Resource):
+    """
+    A class defining the behaviour of the transmission cluster endpoint, for
+    tracing the spread of the disease from a patient.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def get(self, name):
+        """
+        A handler function for flask that is called for all GET HTTP requests
+        to the transmission cluster endpoint.
+
+        Returns the patients infected downstream of the patient `name`, as
+        recorded by the `infected_by` field of events; Up to `depth` steps
+        of infection away, if given. As `{"size": <int>, "infected":
+        [{"patient": <string>, "infected_by": <string>, "depth": <int>}, ...]}`
+        in order of depth, starting with `name` itself.
+        """
+
+        from flask import request
+
+        _authorize(request)
+
+        depth = None
+        if "depth" in request.args:
+            depth = _positive_int_arg(request.args, "depth")
+
+        infected = [
+            {"patient": patient, "infected_by": infected_by, "depth": d}
+            for patient, infected_by, d in _get_db().transmission_cluster(name, depth)
+            ]
+
+        return {"size": len(infected), "infected": infected}
+
+@_ns.route('/clusters')
+class Clusters(Resource):
+    """
+    A class defining the behaviour of the largest clusters endpoint.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def get(self):
+        """
+        A handler function for flask that is called for all GET HTTP requests
+        to the largest clusters endpoint.
+
+        Returns the largest clusters of patients connected by infections,
+        largest first; As `[{"index_case": <string>, "size": <int>}, ...]`.
+        The `limit` query parameter sets the most clusters returned,
+        defaulting to 10.
+        """
+
+        from flask import request
+
+        _authorize(request)
+
+        limit = 10
+        if "limit" in request.args:
+            limit = _positive_int_arg(request.args, "limit")
+
+        return [
+            {"index_case": index_case, "size": size}
+            for index_case, size in _get_db().largest_clusters(limit)
+            ]
+
+@_ns.route('/stats')
+class Stats(Resource):
+    """
+    A class defining the behaviour of the statistics endpoint, for counts of
+    the events held.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def get(self):
+        """
+        A handler function for flask that is called for all GET HTTP requests
+        to the statistics endpoint.
+
+        Returns the total number of events, and the number of events by
+        `event_type`, by `location`, and per hour and day of `_timestamp`.
+        With the `by` query parameter, returns only the counts by that one
+        field or time bucket.
+        """
+
+        from flask import request
+        from flask import abort
+
+        _authorize(request)
+
+        res = _get_db().stats().to_JSON_safe()
+
+        if "by" in request.args:
+            _by = [k for k in res if k != "total"]
+            if not request.args["by"] in _by:
+                abort(400, f"by should be one of: {_by}")
+
+            return res[ request.args["by"] ]
+
+        return res
+
+@_ns.route('/analytics/epicurve')
+class Epicurve(Resource):
+    """
+    A class defining the behaviour of the epidemic curve endpoint, for the
+    incidence of an event over time, and how quickly it is growing.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def get(self):
+        """
+        A handler function for flask that is called for all GET HTTP requests
+        to the epidemic curve endpoint.
+
+        Returns the daily incidence of `event_type` events (default
+        `patient_infected`) by location, with the growth rate and doubling
+        time over a rolling `window` of days (default 7); As:
+            {
+                "days": [<ISO 8601 day>, ...],
+                "locations": {
+                    <location>: {
+                        "incidence": [<int>, ...],
+                        "growth_rate": [<float or null>, ...],
+                        "doubling_time": [<float or null>, ...]
+                    }, ...
+                }
+            }
+        With each list holding a value per day; Null where there is too
+        little incidence to tell, or the doubling time where incidence isn't
+        growing. The `location` query parameter limits the response to one
+        location, and `since` and `until` to a range of days of `_timestamp`
+        (of at most `Analytics.MAX_DAYS` days). Responds with 501 if NumPy is
+        not installed.
+        """
+
+        from flask import request
+        from flask import abort
+
+        _authorize(request)
+
+        kwargs = dict()
+        if "event_type" in request.args:
+            kwargs["event_type"] = request.args["event_type"]
+        if "window" in request.args:
+            kwargs["window"] = _positive_int_arg(request.args, "window")
+        if "location" in request.args:
+            kwargs["location"] = request.args["location"]
+
+        time_range = _time_range_args(request.args)
+        if time_range.pop("time_field", "_timestamp") != "_timestamp":
+            abort(400, "time_field should be _timestamp.")
+        kwargs.update(time_range)
+
+        try:
+            res = _get_db().epicurve(**kwargs)
+        except ImportError:
+            abort(501, "Analytics require NumPy, see the `analytics` extra.")
+        except ValueError as e:
+            abort(400, str(e))
+
+        return {
+            "days": [day.date().isoformat() for day in res["days"]],
+            "locations": {
+                k: {
+                    "incidence": res["incidence"][i].tolist(),
+                    "growth_rate": _finite_list(res["growth_rate"][i]),
+                    "doubling_time": _finite_list(res["doubling_time"][i]),
+                }
+                for i, k in enumerate(res["locations"])
+            },
+        }
+
+@_ns.route('/token')
+class Token(Resource):
+    """
+    A class defining the behaviour of the token endpoint, for exchanging a
+    username and password for a bearer token; So that later requests need
+    not have their password checked.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def post(self):
+        """
+        A handler function for flask that is called for all POST HTTP requests
+        to the token endpoint.
+
+        Takes HTTP Basic credentials, and returns a bearer token in exchange;
+        As `{"token": <string>, "token_type": "Bearer", "expires_in": <int>}`.
+        Other endpoints accept the token in place of credentials, with the
+        header `Authorization: Bearer <token>`, until it expires.
+        """
+
+        from flask import request
+        from flask import abort
+
+        #tokens are not exchanged for fresh tokens, so they expire as issued
+        if not _bearer_token(request) is None:
             abort(401, "Username and password required.")
-        except Bad_Username_Or_Password:
-            abort(401, _ah.not_authorized_msg)
+
+        token, expires_in = _get_ah().issue_token( _authorize(request) )
+
+        return {"token": token, "token_type": "Bearer", "expires_in": expires_in}
+
+    def delete(self):
+        """
+        A handler function for flask that is called for all DELETE HTTP
+        requests to the token endpoint.
+
+        Revokes the bearer token the request is authorized with. Responds
+        with an empty 204 response.
+        """
+
+        from flask import request
+        from flask import abort
+
+        token = _bearer_token(request)
+        if token is None:
+            abort(401, "Bearer token required.")
+
+        _authorize(request)
+        _get_ah().revoke_token(token)
+
+        return "", 204
+
+def _finite_list(values):
+    """
+    Convert an array of floats to a list that can be converted to JSON; As
+    JSON has no NaN or infinity, which become None.
+
+    :param values: NumPy array of floats
+    :return: list
+    """
+    import math
+    return [v if math.isfinite(v) else None for v in values.tolist()]
+
+def _request_input(request):
+    """
+    Read the input of a request; Decoding JSON bodies (`application/json`),
+    otherwise reading form data. Aborting on malformed JSON.
+
+    :param request: a Flask request
+    :return: dictionary, or list of dictionaries for a JSON list
+    """
+    if request.mimetype != "application/json":
+        return dict(request.form)
+
+    from flask import abort
+
+    try:
+        res = _json_loads( request.get_data() )
+    except ValueError:
+        abort(400, "Malformed JSON.")
+
+    if isinstance(res, dict):
+        rows = [res]
+    elif isinstance(res, list) and all( isinstance(row, dict) for row in res ):
+        rows = res
+    else:
+        abort(400, "JSON input should be an object, or a list of objects.")
+
+    try:
+        for row in rows:
+            _check_json_row(row)
+    except ValueError as e:
+        abort(400, str(e))
+
+    return res
+
+def _check_json_row(row):
+    """
+    Check the values of a JSON object can be held by a row; Raising
+    ValueError on objects and arrays. Other values are read as strings as
+    the row is escaped, see `Database._escape_input()`; So the row isn't
+    copied here.
+
+    :param row: dictionary, as decoded from JSON
+    :return: None
+    """
+    for k, v in row.items():
+        if isinstance(v, (dict, list)):
+            raise ValueError(
+                f"The value of '{k}' should be a string, number, boolean or null."
+                )
+
+def _store(store, rows):
+    """
+    Store rows with `Database.append()` or `Database.extend()`, raising
+    InsufficientStorage if out of storage.
+
+    :param store: Database.append or Database.extend
+    :param rows: dictionary, or list of dictionaries, as taken by `store`
+    :return: the return value of `store`
+    """
+    try:
+        return store(rows)
+    except OSError as e:
+        if _is_out_of_storage(e):
+            m = 'Could not append to the database as out of storage.'
+            raise InsufficientStorage(m)
         else:
-            if not authorized:
-                abort(401, _ah.not_authorized_msg)
+            raise #raise other OSError
 
-        search_args = dict(request.form)
+def _bulk_report(stored, errors):
+    """
+    Report on appending many events, as returned by Bulk.post().
 
-        #if no query, then return the entire database
-        if len(search_args) == 0:
-            from .Database import to_JSON_safe
-            return to_JSON_safe( _db.__repr__() )
+    :param stored: list of dictionaries, the rows as stored
+    :param errors: list of (index, message) tuples
+    :return: dictionary
+    """
+    return {
+        "appended": len(stored),
+        "errors": [{"row": i, "message": message} for i, message in errors],
+    }
 
-        from .Database import to_JSON_safe
-        return to_JSON_safe( _db.search(search_args) )
\ No newline at end of file
+def _paging_args(args):
+    """
+    Read the `limit` and `cursor` query parameters of a request; Aborting
+    on bad values.
+
+    :param args: the request.args dictionary of a Flask request
+    :return: dictionary, of the paging parameters present
+    """
+    res = dict()
+
+    if "limit" in args:
+        res["limit"] = _positive_int_arg(args, "limit")
+
+    if "cursor" in args:
+        res["cursor"] = args["cursor"]
+
+    return res
+
+_time_fields = ["_timestamp", "date_time"]
+
+def _seq_arg(value, k):
+    """
+    Read a parameter that should be a `_seq`, or -1 for before the first row;
+    Aborting on bad values.
+
+    :param value: string
+    :param k: string, the name of the parameter
+    :return: integer
+    """
+    from flask import abort
+
+    try:
+        res = int(value)
+    except ValueError:
+        abort(400, f"{k} should be an integer, of -1 or more.")
+
+    if res < -1:
+        abort(400, f"{k} should be an integer, of -1 or more.")
+
+    return res
+
+def _positive_int_arg(args, k):
+    """
+    Read a query parameter that should be a positive integer; Aborting on
+    bad values.
+
+    :param args: the request.args dictionary of a Flask request
+    :param k: string, the name of the parameter
+    :return: integer
+    """
+    from flask import abort
+
+    try:
+        res = int(args[k])
+    except ValueError:
+        abort(400, f"{k} should be a positive integer.")
+
+    if res <= 0:
+        abort(400, f"{k} should be a positive integer.")
+
+    return res
+
+def _time_range_args(args):
+    """
+    Read the `since`, `until` and `time_field` query parameters of a
+    request; Aborting on bad values.
+
+    :param args: the request.args dictionary of a Flask request
+    :return: dictionary, of the time range parameters present
+    """
+    from flask import abort
+    from .Database import parse_time
+
+    res = dict()
+
+    for k in ["since", "until"]:
+        if k in args:
+            res[k] = parse_time(args[k])
+
+            if res[k] is None:
+                abort(400, f"{k} should be an ISO 8601 time.")
+
+    if "time_field" in args:
+        if not args["time_field"] in _time_fields:
+            abort(400, f"time_field should be one of: {_time_fields}")
+
+        res["time_field"] = args["time_field"]
+
+    return res
+
+def _text_search_args(args):
+    """
+    Read the `text` and `text_field` query parameters of a request.
+
+    :param args: the request.args dictionary of a Flask request
+    :return: dictionary, of the full-text search parameters present; Empty
+    without `text`
+    """
+    if not "text" in args:
+        return dict()
+
+    res = {"text": args["text"]}
+    if "text_field" in args:
+        res["text_field"] = args["text_field"]
+
+    return res
+
+def _next_cursor_header(rows, paging):
+    """
+    Make the `X-Next-Cursor` header for a page of rows, if a full page was
+    returned; As there may be more rows to follow.
+
+    :param rows: list of dictionaries, the page of rows
+    :param paging: dictionary, as returned by `_paging_args()`
+    :return: dictionary of headers
+    """
+    if (not "limit" in paging) or (len(rows) < paging["limit"]):
+        return dict()
+
+    from .Database import make_cursor
+    return {"X-Next-Cursor": make_cursor(rows[-1])}
+
+def _etag(version, args, query):
+    """
+    Make the entity tag of a response to a query; Which holds for as long as
+    the database is at the same version, see `Database.version()`.
+    see: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
+
+    :param version: integer, the version of the database
+    :param args: the request.args dictionary of a Flask request
+    :param query: dictionary or list, the query read from the request, see
+    `_request_input()`
+    :return: string
+    """
+    import hashlib
+    import json
+
+    key = json.dumps(
+        [sorted( args.items(multi=True) ), query], sort_keys=True, default=str
+        )
+
+    return f"{version}-{hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()}"
+
+def _next_after_header(rows, after):
+    """
+    Make the `X-Next-After` header for a page of rows read after a `_seq`;
+    The `_seq` of the last row, or `after` again if there were none.
+
+    :param rows: list of dictionaries, the page of rows
+    :param after: integer, the `_seq` the page was read after
+    :return: dictionary of headers
+    """
+    if len(rows) > 0:
+        after = rows[-1]["_seq"]
+
+    return {"X-Next-After": str(after)}
+
+def _rows_response(rows, headers=None):
+    """
+    Respond with a JSON list of rows; Joined from the cached JSON encoding
+    of each row, see `Database.encoded()`.
+
+    :param rows: list of dictionaries
+    :param headers: dictionary, of headers to add to the response
+    :return: a Flask response
+    """
+    from flask import Response
+    return Response(
+        _get_db().encoded_list(rows), mimetype="application/json", headers=headers
+        )
+
+def _stream_rows(rows, limit=None):
+    """
+    Stream rows to the client as a JSON list, encoding a row at a time;
+    Rather than encoding the entire list in memory before responding.
+    see: https://flask.palletsprojects.com/en/2.1.x/patterns/streaming/
+
+    :param rows: iterable of dictionaries
+    :param limit: integer, the most rows to stream, or None for all rows
+    :return: a streamed Flask response
+    """
+    from itertools import islice
+    rows = islice(rows, limit)
+    db = _get_db()
+
+    def generate():
+        yield b"["
+        for i, row in enumerate(rows):
+            if i > 0:
+                yield b","
+            yield db.encoded(row)
+        yield b"]"
+
+    from flask import Response
+    from flask import stream_with_context
+    return Response(
+        stream_with_context( generate() ), mimetype="application/json"
+        )
+
+@_ns.route('/log/bulk')
+class Bulk(Resource):
+    """
+    A class defining the behaviour of the bulk ingest endpoint, for appending
+    many events with a single request.
+    Not meant for instantiation, but to configure Flask for this application
+    """
+
+    def post(self):
+        """
+        A handler function for flask that is called for all POST HTTP requests
+        to the bulk ingest endpoint.
+
+        Accepts a body of newline-delimited JSON objects
+        (`application/x-ndjson`), or of CSV with a header row (`text/csv`);
+        Each object, or CSV row, being one event.
+
+        This function:
+        Checks authentication
+        Validates every event, and appends the valid events with a single write
+        Returns the number of events appended, and an error for each event
+        that could not be; As `{"appended": <int>, "errors": [{"row": <int>,
+        "message": <string>}, ...]}`, where `row` counts events from zero
+        """
+
+        from flask import request
+        from flask import abort
+
+        #limit POST requests to ~2GB, as with Main.post()
+        if not request.content_length is None:
+            if request.content_length > 2 * 1024 * 1024 * 1024:
+                abort(414)
+
+        _user = _authorize(request)
+
+        if not request.mimetype in _bulk_content_types:
+            abort(415, f"Content-Type should be one of: {list(_bulk_content_types)}")
+
+        _parse = _bulk_content_types[request.mimetype]
+
+        import io
+        import csv
+        _body = io.TextIOWrapper(request.stream, encoding="utf-8")
+
+        events = list()
+        positions = list() #the position of each event in the request
+        errors = list()
+        try:
+            for i, row in enumerate( _parse(_body) ):
+                if isinstance(row, str): #the event could not be parsed
+                    errors.append( (i, row) )
+                    continue
+
+                row["_user"] = _user
+                events.append(row)
+                positions.append(i)
+        except UnicodeDecodeError:
+            abort(400, "The body should be encoded as UTF-8.")
+        except csv.Error as e:
+            abort(400, f"Malformed CSV: {e}")
+
+        stored, invalid = _store(_get_db().extend, events)
+
+        errors.extend( (positions[i], message) for i, message in invalid )
+        errors.sort()
+
+        return _bulk_report(stored, errors)
+
+def _parse_ndjson(body):
+    """
+    Parse a body of newline-delimited JSON objects, skipping blank lines.
+    see: http://ndjson.org/
+
+    :param body: a text file object
+    :return: generator of dictionaries, or of an error message for each line
+    that is not a JSON object
+    """
+    for line in body:
+        if len(line.strip()) == 0:
+            continue
+
+        try:
+            row = _json_loads(line)
+        except ValueError:
+            yield "Malformed JSON."
+            continue
+
+        if not isinstance(row, dict):
+            yield "Each line should be a JSON object."
+            continue
+
+        try:
+            _check_json_row(row)
+        except ValueError as e:
+            yield str(e)
+            continue
+
+        yield row
+
+def _parse_csv(body):
+    """
+    Parse a body of CSV, the first row of which names the fields of each
+    following row. Fields left empty are skipped.
+    see: https://docs.python.org/3/library/csv.html#csv.DictReader
+
+    :param body: a text file object
+    :return: generator of dictionaries
+    """
+    import csv
+    for row in csv.DictReader(body):
+        yield {k: v for k, v in row.items() if not (k is None or v in [None, ""])}
+
+#the content types accepted by Bulk.post(), mapped to their parsers
+_bulk_content_types = {
+    "application/x-ndjson": _parse_ndjson,
+    "text/csv": _parse_csv,
+}
\ No newline at end of file
@@ -0,0 +1,566 @@
+"""
+Segmented Log module
+
+An append-only log, split across a series of segment files, used as the storage
+engine for rows of data held by Database.
+
+Each appended row is written as a single record to the end of the active
+segment; Rather than re-serializing and rewriting the entire database as
+TinyDB's JSONStorage does. Once the active segment grows past a size limit a
+new segment is started (rollover). Each record is framed with its length and a
+CRC32 checksum, so that a record torn by a crash can be detected and discarded
+when the log is read back.
+
+Custom exception classes:
+Corrupt_Segment
+Missing_Records
+
+Segmented_Log
+The main class of the module. Appends rows to the log, and replays the log
+to recover previously appended rows.
+"""
+
+'''
+On-disk format
+
+A log is a directory of segment files, each named after the sequence number of
+the first record it holds (zero padded, so that segments sort by name):
+    00000000000000000000.seg
+    00000000000000041233.seg
+    ...
+
+Segments holding only rows covered by a snapshot may be removed, see
+`Segmented_Log.truncate()`; So the oldest segment need not start at zero.
+
+Each segment is a run of records of the form:
+    [payload length: 4 bytes, big-endian][CRC32 of payload: 4 bytes, big-endian][payload]
+
+Where the payload is a row encoded as UTF-8 JSON. `datetime` values are encoded
+as `{"$date": "<isoformat>"}`, as row values supplied by users are always strings.
+    see:
+    https://kafka.apache.org/documentation/#log
+'''
+
+from contextlib import contextmanager
+
+class Corrupt_Segment(Exception): pass
+class Missing_Records(Exception): pass
+
+_HEADER = ">II"
+_SEGMENT_SUFFIX = ".seg"
+_DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+def encode_row(row):
+    """
+    Encode a row of data as the payload of a log record.
+
+    :param row: dictionary
+    :return: bytes
+    """
+    import json
+    return json.dumps(
+        row, default=_encode_default, separators=(",", ":")
+    ).encode("utf-8")
+
+def decode_row(payload):
+    """
+    Decode the payload of a log record back into a row of data.
+
+    :param payload: bytes
+    :return: dictionary
+    """
+    import json
+    return json.loads(payload.decode("utf-8"), object_hook=_decode_object)
+
+def _encode_default(obj):
+    if hasattr(obj, "isoformat"):
+        return {"$date": obj.isoformat()}
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+def _decode_object(obj):
+    if (len(obj) == 1) and ("$date" in obj):
+        from datetime import datetime
+        return datetime.fromisoformat(obj["$date"])
+
+    return obj
+
+def _frame(payload):
+    """
+    Frame the payload of a record with its length and checksum.
+
+    :param payload: bytes
+    :return: bytes, the record
+    """
+    import struct
+    import zlib
+    return struct.pack(_HEADER, len(payload), zlib.crc32(payload)) + payload
+
+def _first_seq(segment):
+    """
+    :param segment: Path, a segment file
+    :return: integer, the sequence number of the first record of the segment
+    """
+    return int(segment.stem)
+
+class Segmented_Log:
+    """
+    The Segmented_Log class.
+
+    Holds a directory of segment files. The directory, and the first segment,
+    are only created when the first row is appended.
+
+    Many processes (and threads) may share a log. Writes are made holding an
+    exclusive lock, see `lock()`; And rows appended by other processes are
+    picked up with `read_new()`. Each instance keeps track of how far it has
+    read, such that rows it appends itself (holding the lock, having read all
+    prior rows) are not returned again by `read_new()`.
+    """
+    def __init__(self, path, max_segment_bytes=_DEFAULT_MAX_SEGMENT_BYTES):
+        import threading
+        from pathlib import Path
+        self._path = Path(path)
+        self._max_segment_bytes = max_segment_bytes
+
+        self._active = None #file object of the segment being appended to
+        self._active_name = None
+        self._next_seq = 0
+
+        #the segment, and the offset within it, of the end of the last record read
+        self._read_segment = None
+        self._read_offset = 0
+
+        self._thread_lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+
+        self.bytes_written = 0 #since the log was opened
+
+    def __len__(self):
+        return self._next_seq
+
+    def segments(self):
+        """
+        List the segment files of the log, oldest first.
+
+        :return: list of Path objects
+        """
+        if not self._path.exists():
+            return list()
+
+        return sorted(self._path.glob("*" + _SEGMENT_SUFFIX))
+
+    @contextmanager
+    def lock(self):
+        """
+        A context manager holding the log exclusively, across both the threads
+        of this process and other processes; Creating the log directory if
+        needed. Reentrant.
+        Processes are locked out with `flock()` on a lock file in the log
+        directory, where supported.
+        see: https://man7.org/linux/man-pages/man2/flock.2.html
+
+        :return: None
+        """
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                self._acquire_file_lock()
+            self._lock_depth += 1
+
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._release_file_lock()
+
+    def _acquire_file_lock(self):
+        try:
+            import fcntl
+        except ImportError: #not supported on this platform
+            return
+
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self._path / "lock", "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+
+    def _release_file_lock(self):
+        if self._lock_file is None:
+            return
+
+        import fcntl
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def replay(self, from_seq=0):
+        """
+        Read back every row held by the log, in the order they were appended.
+        A torn or corrupt record at the end of the newest segment (as left
+        by a crash mid-write) is truncated away; Corruption anywhere else
+        raises `Corrupt_Segment`.
+        Raises `Missing_Records` if the records from `from_seq` have been
+        removed from the log, see `truncate()`.
+
+        :param from_seq: integer, the sequence number of the first row to
+        read back; Such as the first row not held by a snapshot
+        :return: generator of dictionaries
+        """
+        if not self._path.exists():
+            self._next_seq = from_seq
+            return
+
+        with self.lock():
+            self.close()
+            self._next_seq = from_seq
+            self._read_segment = None
+            self._read_offset = 0
+
+            yield from self._read_from(repair=True)
+
+    def read_new(self):
+        """
+        Read back the rows appended to the log since last read; Such as those
+        appended by other processes.
+        A record still being written by another process is left to be read
+        by a later call. Except when called holding `lock()`, as then no other
+        process can be writing; So a torn record at the end of the log was
+        left by a process that died mid-write, and is truncated away before
+        rows are appended after it.
+
+        :return: list of dictionaries
+        """
+        if not self.has_new():
+            return list()
+
+        with self._thread_lock:
+            #holding `_thread_lock`, the file lock can only be held by this thread
+            repair = not self._lock_file is None
+            return list( self._read_from(repair=repair) )
+
+    def has_new(self):
+        """
+        Cheaply check if there may be rows in the log not yet read.
+
+        :return: boolean
+        """
+        if self._read_segment is None:
+            return len(self.segments()) > 0
+
+        try:
+            if self._read_segment.stat().st_size > self._read_offset:
+                return True
+        except FileNotFoundError:
+            return True
+
+        #a new segment is named after the sequence number of its first record
+        return self._segment_path(self._next_seq).exists()
+
+    def _read_from(self, repair):
+        """
+        Read the records of the log following the last record read.
+
+        :param repair: boolean, if a torn record at the end of the newest
+        segment should be truncated away, rather than left to be read later
+        :return: generator of dictionaries
+        """
+        segments = self.segments()
+        if not self._read_segment is None:
+            segments = [s for s in segments if s.name >= self._read_segment.name]
+        else:
+            #skip the segments wholly before the first row to read
+            while (len(segments) > 1) and (_first_seq(segments[1]) <= self._next_seq):
+                segments.pop(0)
+
+        for i, segment in enumerate(segments):
+            is_last = (i == len(segments) - 1)
+
+            offset = 0
+            skip = 0 #the records at the start of the segment already read
+            if segment == self._read_segment:
+                offset = self._read_offset
+            else:
+                first_seq = _first_seq(segment)
+                if first_seq > self._next_seq:
+                    raise Missing_Records(
+                        f"Records from {self._next_seq} to {first_seq} have been removed"
+                        )
+                skip = self._next_seq - first_seq
+
+            self._read_segment = segment
+            self._read_offset = offset
+
+            for payload, end in self._read_segment_records(segment, offset, is_last, repair):
+                self._read_offset = end
+
+                if skip > 0:
+                    skip -= 1
+                    continue
+
+                self._next_seq += 1
+                yield decode_row(payload)
+
+    def _read_segment_records(self, segment, offset, is_last, repair):
+        """
+        Read the records of a single segment file, from an offset.
+
+        :param segment: Path, the segment file
+        :param offset: integer, the offset of the first record to read
+        :param is_last: boolean, if the segment is the newest of the log
+        :param repair: boolean, see `_read_from()`
+        :return: generator of tuples, of the payload of each record and the
+        offset of the end of the record
+        """
+        import struct
+        import zlib
+        header_size = struct.calcsize(_HEADER)
+
+        with open(segment, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+
+        start = 0
+        while start < len(data):
+            header = data[start:start + header_size]
+            payload = b""
+            if len(header) == header_size:
+                length, checksum = struct.unpack(_HEADER, header)
+                payload = data[start + header_size:start + header_size + length]
+
+            good_record = (len(header) == header_size) and \
+                (len(payload) == length) and \
+                (zlib.crc32(payload) == checksum)
+
+            if not good_record:
+                if not is_last:
+                    raise Corrupt_Segment(
+                        f"Corrupt record in {segment} at {offset + start}"
+                        )
+
+                if repair:
+                    #discard the torn tail of the log, so new records follow on
+                    #from the last good one
+                    with open(segment, "r+b") as f:
+                        f.truncate(offset + start)
+                break
+
+            start += header_size + length
+            yield payload, offset + start
+
+    def append(self, row):
+        """
+        Append a row as a single record to the end of the log; Starting a new
+        segment if the active one is full.
+
+        :param row: dictionary
+        :return: integer, the sequence number of the new record
+        """
+        with self.lock():
+            self._write( _frame(encode_row(row)) )
+
+            seq = self._next_seq
+            self._next_seq += 1
+            return seq
+
+    def extend(self, rows):
+        """
+        Append many rows to the end of the log, with a single write. The rows
+        are kept together in one segment, which may then run past the size
+        limit.
+
+        :param rows: list of dictionaries
+        :return: list of integers, the sequence numbers of the new records
+        """
+        if len(rows) == 0:
+            return list()
+
+        with self.lock():
+            self._write( b"".join(_frame(encode_row(row)) for row in rows) )
+
+            seqs = list( range(self._next_seq, self._next_seq + len(rows)) )
+            self._next_seq += len(rows)
+            return seqs
+
+    def _write(self, record):
+        """
+        Write encoded records to the active segment, and flush them to the
+        operating system. Should be called holding `lock()`.
+
+        :param record: bytes, one or more records as framed by `_frame()`
+        :return: None
+        """
+        import os
+
+        self._open_active()
+
+        size = os.fstat(self._active.fileno()).st_size
+
+        #if all prior records have been read, then so has this one
+        caught_up = (self._read_segment is None) or \
+            ((self._read_segment.name == self._active_name) and (self._read_offset == size))
+
+        full = (size + len(record)) > self._max_segment_bytes
+        if full and (size > 0):
+            self._roll_over()
+            size = 0
+
+        try:
+            self._active.write(record)
+            self._active.flush()
+        except BaseException:
+            self._discard_write(size)
+            raise
+        self.bytes_written += len(record)
+
+        if caught_up:
+            self._read_segment = self._path / self._active_name
+            self._read_offset = size + len(record)
+
+    def _discard_write(self, size):
+        """
+        Undo a failed write (say, with the disk full) by truncating the active
+        segment back to its size before the write; As the torn record left by
+        a partial write would otherwise sit ahead of later records, and be
+        taken for the end of the log by `replay()`. The active segment is
+        closed without flushing, so what's left of the record in its buffer
+        is dropped; And reopened by the next write.
+
+        :param size: integer, the size of the active segment before the write
+        :return: None
+        """
+        import os
+
+        try:
+            os.ftruncate(self._active.fileno(), size)
+        finally:
+            #closing the raw file first leaves nothing for the buffer to flush
+            self._active.raw.close()
+            self._active = None
+            self._active_name = None
+
+    def roll_over(self):
+        """
+        Start a new segment, unless the active segment is empty; So that every
+        row appended so far is held by a segment that is no longer written to.
+
+        :return: None
+        """
+        with self.lock():
+            if len(self.segments()) == 0:
+                return
+
+            import os
+            self._open_active()
+            if os.fstat(self._active.fileno()).st_size > 0:
+                self._roll_over()
+
+    def truncate(self, before_seq):
+        """
+        Remove the segments holding only rows before `before_seq`, such as
+        rows held by a snapshot. The newest segment is never removed.
+
+        :param before_seq: integer, a sequence number
+        :return: integer, the number of segments removed
+        """
+        with self.lock():
+            segments = self.segments()
+
+            removed = 0
+            for segment, following in zip(segments, segments[1:]):
+                if _first_seq(following) > before_seq:
+                    break
+
+                segment.unlink()
+                removed += 1
+
+            return removed
+
+    def sync(self):
+        """
+        Force the writes to the active segment to disk.
+        see: https://man7.org/linux/man-pages/man2/fsync.2.html
+
+        :return: None
+        """
+        with self._thread_lock:
+            if not self._active is None:
+                import os
+                os.fsync(self._active.fileno())
+
+    def _open_active(self):
+        """
+        Open the newest segment for appending, creating the log directory
+        and its first segment if needed. If another process has started a new
+        segment since, it is opened in place of the current one.
+
+        :return: None
+        """
+        self._path.mkdir(parents=True, exist_ok=True)
+
+        segments = self.segments()
+        if len(segments) == 0:
+            segment = self._segment_path(self._next_seq)
+        else:
+            segment = segments[-1]
+
+        if (not self._active is None) and (self._active_name == segment.name):
+            return
+
+        self.close()
+        self._active = open(segment, "ab")
+        self._active_name = segment.name
+
+        if len(segments) == 0: #the first segment, and maybe the directory
+            self._sync_new_segment(first=True)
+
+    def _roll_over(self):
+        """
+        Close the active segment, and start a new one. The closed segment is
+        forced to disk first, as `sync()` only reaches the active segment.
+
+        :return: None
+        """
+        self.sync()
+        self.close()
+        segment = self._segment_path(self._next_seq)
+        self._active = open(segment, "ab")
+        self._active_name = segment.name
+
+        self._sync_new_segment()
+
+    def _sync_new_segment(self, first=False):
+        """
+        Force the entry of a newly created segment to disk; As otherwise rows
+        written to it, and forced to disk with `sync()`, could still be lost
+        with the segment itself on a power loss.
+
+        :param first: boolean, if the segment is the first of the log; So the
+        entry of the log directory is forced to disk too
+        :return: None
+        """
+        from .Snapshot import _sync_directory
+
+        _sync_directory(self._path)
+        if first:
+            _sync_directory(self._path.parent)
+
+    def _segment_path(self, first_seq):
+        return self._path / f"{first_seq:020d}{_SEGMENT_SUFFIX}"
+
+    @property
+    def path(self):
+        """
+        :return: Path, the directory of the log
+        """
+        return self._path
+
+    def close(self):
+        """
+        Close the active segment, if open.
+
+        :return: None
+        """
+        if not self._active is None:
+            self._active.close()
+            self._active = None
+            self._active_name = None
@@ -0,0 +1,207 @@
+"""
+Snapshot module
+
+Snapshots of the in-memory state of Database; Its rows, and the indexes built
+over them. A snapshot holds every row before a given sequence number, so that
+opening the database need only load the snapshot, and replay the rows of the
+log that follow it; Rather than replaying, and re-indexing, every row ever
+appended. Once written, the segments of the log the snapshot covers can be
+removed (compaction).
+    see:
+    https://redis.io/docs/management/persistence/#snapshotting
+
+Custom exception classes:
+Corrupt_Snapshot
+
+Compactor
+Takes snapshots, by calling a function, on a timer in the background.
+"""
+
+'''
+On-disk format
+
+Snapshots are kept alongside the segments of the log, each named after the
+sequence number of the first row it doesn't hold:
+    00000000000000041233.snap
+
+A snapshot is a header followed by a payload:
+    [magic: 4 bytes][format version: 2 bytes][payload length: 8 bytes][CRC32 of payload: 4 bytes][payload]
+
+Where the payload is the state pickled; Snapshots are only ever read by the
+process that wrote them, or by others sharing the same database, and never
+from an untrusted source.
+    see:
+    https://docs.python.org/3/library/pickle.html
+'''
+
+class Corrupt_Snapshot(Exception): pass
+
+_MAGIC = b"ZDDS"
+_VERSION = 1
+_HEADER = ">4sHQI"
+_SNAPSHOT_SUFFIX = ".snap"
+
+def write_snapshot(directory, seq, state):
+    """
+    Write a snapshot, atomically; So that a snapshot is either absent, or
+    whole, even if the process crashes mid-write.
+    see: https://man7.org/linux/man-pages/man2/rename.2.html
+
+    :param directory: Path, the directory to keep snapshots in
+    :param seq: integer, the sequence number of the first row the snapshot
+    doesn't hold
+    :param state: a picklable object
+    :return: Path, the snapshot file
+    """
+    import os
+    import pickle
+    import struct
+    import zlib
+
+    payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    header = struct.pack(_HEADER, _MAGIC, _VERSION, len(payload), zlib.crc32(payload))
+
+    path = directory / f"{seq:020d}{_SNAPSHOT_SUFFIX}"
+    tmp_path = directory / f"{path.name}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    _sync_directory(directory)
+
+    return path
+
+def _sync_directory(directory):
+    """
+    Force the entries of a directory (such as a renamed file) to disk, where
+    supported.
+
+    :param directory: Path
+    :return: None
+    """
+    import os
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError: #not supported on this platform
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def read_snapshot(path):
+    """
+    Read back the state held by a snapshot, raising `Corrupt_Snapshot` if the
+    snapshot fails its checksum.
+
+    :param path: Path, the snapshot file
+    :return: the state, as written by `write_snapshot()`
+    """
+    import pickle
+    import struct
+    import zlib
+    header_size = struct.calcsize(_HEADER)
+
+    data = path.read_bytes()
+
+    if len(data) < header_size:
+        raise Corrupt_Snapshot(f"Truncated snapshot: {path}")
+
+    magic, version, length, checksum = struct.unpack(_HEADER, data[:header_size])
+    if (magic != _MAGIC) or (version != _VERSION):
+        raise Corrupt_Snapshot(f"Not a snapshot, or of an unknown version: {path}")
+
+    payload = memoryview(data)[header_size:]
+    if (len(payload) != length) or (zlib.crc32(payload) != checksum):
+        raise Corrupt_Snapshot(f"Corrupt snapshot: {path}")
+
+    return pickle.loads(payload)
+
+def latest_snapshot(directory):
+    """
+    Find the newest snapshot in a directory.
+
+    :param directory: Path
+    :return: tuple, of the sequence number of the first row the snapshot
+    doesn't hold and the snapshot file; Or None if there are no snapshots
+    """
+    snapshots = snapshot_files(directory)
+    if len(snapshots) == 0:
+        return None
+
+    return int(snapshots[-1].stem), snapshots[-1]
+
+def snapshot_files(directory):
+    """
+    :param directory: Path
+    :return: list of Path objects, the snapshots in a directory, oldest first
+    """
+    if not directory.exists():
+        return list()
+
+    return sorted(directory.glob("*" + _SNAPSHOT_SUFFIX))
+
+def remove_snapshots(directory, before_seq):
+    """
+    Remove the snapshots older than the snapshot of `before_seq`.
+
+    :param directory: Path
+    :param before_seq: integer
+    :return: None
+    """
+    for path in snapshot_files(directory):
+        if int(path.stem) < before_seq:
+            path.unlink()
+
+class Compactor:
+    """
+    The Compactor class.
+
+    Calls `compact`, a function taking a snapshot and compacting the log,
+    every `interval` seconds from a background thread. Errors are printed,
+    rather than stopping the thread, so that a failed compaction is retried.
+    """
+    def __init__(self, compact, interval):
+        import threading
+        self._compact = compact
+        self._interval = interval
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start compacting in the background.
+
+        :return: None
+        """
+        import threading
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop compacting, waiting for a compaction under way to finish.
+
+        :return: None
+        """
+        self._stop.set()
+
+        if not self._thread is None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self._compact()
+            except Exception:
+                import traceback
+                traceback.print_exc()
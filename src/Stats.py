@@ -0,0 +1,94 @@
+"""
+Stats module
+
+Counts of the rows held by Database, kept up to date as each row is loaded;
+So that the usual rollups (events by type, by location, and over time) are
+read from the counts, rather than by scanning every row.
+
+Stats
+The main class of the module.
+"""
+
+#the fields rows are counted by
+STATS_FIELDS = ["event_type", "location"]
+
+#the time buckets rows are counted in by their `_timestamp`, mapped to a
+#function truncating a timestamp to the start of its bucket
+STATS_BUCKETS = {
+    "hourly": lambda t: t.replace(minute=0, second=0, microsecond=0),
+    "daily": lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+class Stats:
+    """
+    The Stats class.
+
+    Counts rows in total, by the value of each of `STATS_FIELDS`, and by
+    the hour and day of their `_timestamp`. Adding a row takes constant time.
+    """
+    def __init__(self):
+        import threading
+        from collections import Counter
+
+        self._total = 0
+        self._counts = {k: Counter() for k in list(STATS_FIELDS) + list(STATS_BUCKETS)}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._total
+
+    def __getstate__(self):
+        #locks can't be pickled, see `Database.compact()`
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        import threading
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, row):
+        """
+        Count a row.
+
+        :param row: dictionary
+        :return: None
+        """
+        with self._lock:
+            self._total += 1
+
+            for k in STATS_FIELDS:
+                if k in row:
+                    self._counts[k][row[k]] += 1
+
+            for k, bucket in STATS_BUCKETS.items():
+                self._counts[k][bucket(row["_timestamp"])] += 1
+
+    def counts(self, by):
+        """
+        The counts of rows by a field, or by a time bucket.
+
+        :param by: string, one of `STATS_FIELDS` or `STATS_BUCKETS`
+        :return: dictionary, mapping each value (or the start of each bucket,
+        as a datetime) to a count of rows
+        """
+        with self._lock:
+            return dict(self._counts[by])
+
+    def to_JSON_safe(self):
+        """
+        All the counts, in a format that can be converted to JSON; With
+        buckets keyed by their start in ISO 8601, in order of time.
+
+        :return: dictionary
+        """
+        res = {"total": len(self)}
+
+        for k in STATS_FIELDS:
+            res[k] = self.counts(k)
+
+        for k in STATS_BUCKETS:
+            res[k] = {t.isoformat(): n for t, n in sorted( self.counts(k).items() )}
+
+        return res
@@ -0,0 +1,216 @@
+"""
+Text Index module
+
+Full-text search over the free-text fields of rows held by Database, such as
+`notes`. Each field is tokenized into lower-case words, and an inverted index
+maps each word to the rows holding it (a postings list); So that a search
+need only read the postings lists of the words searched for.
+    see:
+    https://nlp.stanford.edu/IR-book/html/htmledition/a-first-take-at-building-an-inverted-index-1.html
+
+Custom exception classes:
+Bad_Text_Query
+
+Text_Index
+The main class of the module. An inverted index, added to as rows are loaded.
+
+Text_Query
+A parsed search of a Text_Index.
+"""
+
+import re
+
+class Bad_Text_Query(Exception): pass
+
+_WORD = re.compile(r"\w+")
+_QUERY_TERM = re.compile(r'"[^"]*"?|\S+')
+
+def tokenize(text):
+    """
+    Split text into lower-case words. Text is unescaped first, as values
+    are escaped before being stored, see `Database._escape_input()`.
+
+    :param text: string
+    :return: list of strings
+    """
+    import html
+    return _WORD.findall( html.unescape(str(text)).lower() )
+
+class Text_Index:
+    """
+    The Text_Index class.
+
+    Indexes the string values of each field of a row, other than fields in
+    `exclude` and fields starting with an underscore. Rows must be added in
+    order of `_seq`, so that each postings list is sorted.
+    Postings lists are held as arrays of integers, rather than lists, as they
+    are several times smaller.
+    """
+    def __init__(self, exclude=()):
+        self._exclude = frozenset(exclude)
+
+        #mapping each field, to a mapping of each word to a postings list of
+        #the `_seq` of each row holding the word in that field
+        self._postings = dict()
+
+    def fields(self):
+        """
+        :return: list of strings, the fields indexed so far
+        """
+        return list(self._postings)
+
+    def add(self, row):
+        """
+        Add the words of the free-text fields of a row to the index.
+
+        :param row: dictionary
+        :return: None
+        """
+        from array import array
+
+        for field, value in row.items():
+            if (not isinstance(value, str)) or (field in self._exclude) or \
+                    field.startswith("_"):
+                continue
+
+            postings = self._postings.setdefault(field, dict())
+            for word in set( tokenize(value) ):
+                if not word in postings:
+                    postings[word] = array("q")
+                postings[word].append( row["_seq"] )
+
+    def postings(self, field, word):
+        """
+        :param field: string
+        :param word: string, a lower-case word, as returned by `tokenize()`
+        :return: the sorted `_seq` of the rows holding `word` in `field`
+        """
+        return self._postings.get(field, dict()).get(word, ())
+
+class Text_Query:
+    """
+    The Text_Query class.
+
+    Parses a search of the form:
+        dance fever
+        dance AND fever
+        tango OR waltz
+        "moon walk" OR "robot dance" AND recovered
+
+    Words are matched ignoring case; Words next to each other match rows
+    holding all of them (as does AND), OR matches rows holding either side,
+    and binds looser than AND. Double quotes match a phrase, the words in
+    order. Raises `Bad_Text_Query` if there is nothing to search for.
+    """
+    def __init__(self, text):
+        #a list of clauses, any of which may match; Each a list of phrases,
+        #all of which must match; Each phrase a tuple of words
+        self.clauses = list()
+
+        clause = list()
+        for term in _QUERY_TERM.findall(text):
+            if term == "OR":
+                self.clauses.append(clause)
+                clause = list()
+            elif term != "AND":
+                #a term of many words (quoted or not, e.g. `don't`) is a phrase
+                phrase = tuple( tokenize(term) )
+                if len(phrase) > 0:
+                    clause.append(phrase)
+        self.clauses.append(clause)
+
+        self.clauses = [clause for clause in self.clauses if len(clause) > 0]
+        if len(self.clauses) == 0:
+            raise Bad_Text_Query(f"Nothing to search for: {text}")
+
+        self.has_phrases = any(
+            len(phrase) > 1 for clause in self.clauses for phrase in clause
+            )
+
+    def candidates(self, index, field):
+        """
+        Find the rows holding every word of any clause, by intersecting the
+        postings lists of the words of each clause, and merging the results.
+        Rows holding the words of a phrase, but not in order, are included;
+        See `matches()`.
+
+        :param index: Text_Index
+        :param field: string
+        :return: list of integers, the sorted `_seq` of each row
+        """
+        results = list()
+        for clause in self.clauses:
+            words = set(word for phrase in clause for word in phrase)
+            results.append( _intersect([index.postings(field, w) for w in words]) )
+
+        if len(results) == 1:
+            return results[0]
+
+        import heapq
+        res = list()
+        for seq in heapq.merge(*results):
+            if (len(res) == 0) or (res[-1] != seq):
+                res.append(seq)
+        return res
+
+    def matches(self, row, field):
+        """
+        Determine if a row matches the query.
+
+        :param row: dictionary
+        :param field: string
+        :return: boolean
+        """
+        if not isinstance(row.get(field), str):
+            return False
+
+        words = tokenize(row[field])
+        return any(
+            all( _holds_phrase(words, phrase) for phrase in clause )
+            for clause in self.clauses
+            )
+
+def _intersect(postings):
+    """
+    Intersect sorted postings lists; Starting from the shortest, and finding
+    each of its entries in the longer lists by binary search, so that long
+    lists are mostly skipped over.
+    see: https://nlp.stanford.edu/IR-book/html/htmledition/faster-postings-list-intersection-via-skip-pointers-1.html
+
+    :param postings: list of sorted sequences of integers
+    :return: list of integers
+    """
+    import bisect
+
+    postings = sorted(postings, key=len)
+    res = list(postings[0])
+
+    for other in postings[1:]:
+        found = list()
+        lo = 0
+        for seq in res:
+            lo = bisect.bisect_left(other, seq, lo)
+            if lo == len(other):
+                break
+            if other[lo] == seq:
+                found.append(seq)
+        res = found
+
+        if len(res) == 0:
+            break
+
+    return res
+
+def _holds_phrase(words, phrase):
+    """
+    :param words: list of strings
+    :param phrase: tuple of strings
+    :return: boolean, if `phrase` appears in order within `words`
+    """
+    if len(phrase) == 1:
+        return phrase[0] in words
+
+    n = len(phrase)
+    return any(
+        tuple(words[i:i + n]) == phrase for i in range(len(words) - n + 1)
+        )
@@ -0,0 +1,203 @@
+"""
+Transmission Graph module
+
+Tracks the spread of the disease from patient to patient, as recorded by the
+optional `infected_by` field of rows held by Database; The name of the patient
+that infected the patient of the row.
+
+Transmission_Graph
+The main class of the module. A graph of who infected whom, added to as rows
+are loaded, and searched breadth first.
+    see:
+    https://en.wikipedia.org/wiki/Breadth-first_search
+"""
+
+class Transmission_Graph:
+    """
+    The Transmission_Graph class.
+
+    Holds an adjacency list, mapping each patient to the patients they
+    infected; And the source of each patient's infection. Where more than one
+    source is recorded for a patient, the first is taken as their source.
+
+    Patients connected by any chain of infections form a cluster, tracked as
+    rows are added with a disjoint-set forest; So that the sizes of clusters
+    need not be counted by searching the graph.
+        see:
+        https://en.wikipedia.org/wiki/Disjoint-set_data_structure
+    """
+    def __init__(self):
+        import threading
+
+        self._infected = dict() #patient, to the patients they infected
+        self._sources = dict() #patient, to the patient that infected them
+
+        #the disjoint-set forest of clusters; Each patient, to their parent in
+        #the forest, with the root of each tree holding the size of its
+        #cluster, and its index case (the patient added to the graph first)
+        self._parents = dict()
+        self._sizes = dict()
+        self._index_cases = dict()
+        self._order = dict() #patient, to the order they were added in
+
+        self._lock = threading.Lock()
+
+    def __contains__(self, patient):
+        return patient in self._parents
+
+    def __getstate__(self):
+        #locks can't be pickled, see `Database.compact()`
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        import threading
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, row):
+        """
+        Add the infection recorded by a row, if any.
+
+        :param row: dictionary
+        :return: None
+        """
+        if (not "infected_by" in row) or (not "patient" in row):
+            return
+
+        source = row["infected_by"]
+        patient = row["patient"]
+
+        with self._lock:
+            self._add_patient(source)
+            self._add_patient(patient)
+
+            if patient in self._infected[source]:
+                return
+
+            self._infected[source].append(patient)
+            self._sources.setdefault(patient, source)
+            self._union(source, patient)
+
+    def _add_patient(self, patient):
+        if patient in self._parents:
+            return
+
+        self._infected[patient] = list()
+        self._parents[patient] = patient
+        self._sizes[patient] = 1
+        self._index_cases[patient] = patient
+        self._order[patient] = len(self._order)
+
+    def _find(self, patient):
+        """
+        Find the root of the tree holding a patient; Halving the path to the
+        root along the way, so later finds are quicker.
+
+        :param patient: string
+        :return: string
+        """
+        parents = self._parents
+        while parents[patient] != patient:
+            parents[patient] = parents[ parents[patient] ]
+            patient = parents[patient]
+        return patient
+
+    def _union(self, a, b):
+        """
+        Merge the clusters of two patients, placing the smaller tree under the
+        larger.
+
+        :param a: string
+        :param b: string
+        :return: None
+        """
+        a = self._find(a)
+        b = self._find(b)
+        if a == b:
+            return
+
+        if self._sizes[a] < self._sizes[b]:
+            a, b = b, a
+
+        self._parents[b] = a
+        self._sizes[a] += self._sizes.pop(b)
+
+        index_case = self._index_cases.pop(b)
+        if self._order[index_case] < self._order[ self._index_cases[a] ]:
+            self._index_cases[a] = index_case
+
+    def chain(self, patient):
+        """
+        The chain of infections leading to a patient, by following the source
+        of each infection back to the first.
+
+        :param patient: string
+        :return: list of strings, the patients of the chain from the first
+        infected to `patient`
+        """
+        res = [patient]
+        seen = set(res)
+
+        with self._lock:
+            while res[-1] in self._sources:
+                source = self._sources[ res[-1] ]
+                if source in seen: #a cycle of recorded infections
+                    break
+
+                res.append(source)
+                seen.add(source)
+
+        res.reverse()
+        return res
+
+    def cluster(self, patient, depth=None):
+        """
+        The patients infected downstream of a patient, breadth first.
+
+        :param patient: string
+        :param depth: integer, the most steps of infection to follow from
+        `patient`, or None to follow every step
+        :return: list of (patient, infected_by, depth) tuples, in order of
+        depth; Starting with (`patient`, None, 0)
+        """
+        from collections import deque
+
+        res = [(patient, None, 0)]
+        seen = {patient}
+        queue = deque(res)
+
+        with self._lock:
+            while len(queue) > 0:
+                source, _, d = queue.popleft()
+                if (not depth is None) and (d >= depth):
+                    continue
+
+                for infected in self._infected.get(source, ()):
+                    if infected in seen:
+                        continue
+
+                    seen.add(infected)
+                    step = (infected, source, d + 1)
+                    res.append(step)
+                    queue.append(step)
+
+        return res
+
+    def largest_clusters(self, n):
+        """
+        The largest clusters of patients connected by infections.
+
+        :param n: integer, the most clusters to return
+        :return: list of (index case, size) tuples, largest first
+        """
+        import heapq
+        from operator import itemgetter
+
+        with self._lock:
+            clusters = [
+                (self._index_cases[root], size) for root, size in self._sizes.items()
+                ]
+
+        return heapq.nlargest(n, clusters, key=itemgetter(1))
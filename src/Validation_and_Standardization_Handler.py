@@ -6,6 +6,10 @@ errors back to the caller.
 
 In addition, this module handles appending sensible defaults for optional
 parameters of the input.
+
+The rules of Validation_and_Standardization are compiled once, by
+`compile_schema()`, into a single function that validates and standardizes a
+row; Which is used by the module-level entrypoints.
 """
 
 '''
@@ -26,8 +30,7 @@ def validate(row):
 
     :param row: dictionary
     """
-    vns = Validation_and_Standardization()
-    vns.validate(row)
+    _compiled.validate(row)
 
 def standardize(row):
     """
@@ -35,10 +38,20 @@ def standardize(row):
     the input.
 
     :param row: dictionary
+    :return: dictionary, a standardized copy of the row
     """
 
-    vns = Validation_and_Standardization()
-    return vns.standardize(row)
+    return _compiled.standardize( dict(row) )
+
+def validate_and_standardize(row):
+    """
+    A function that validates a row, and then adds sensible defaults to it;
+    Modifying the row in place, rather than copying it.
+
+    :param row: dictionary
+    :return: dictionary, the row
+    """
+    return _compiled(row)
 
 class Validation_and_Standardization:
     """
@@ -186,4 +199,73 @@ class Validation_and_Standardization:
         _row = dict(row)
         from datetime import datetime
         _row["_timestamp"] = datetime.now(tz=None)
-        return _row
\ No newline at end of file
+        return _row
+
+class Compiled_Schema:
+    """
+    The rules of a Validation_and_Standardization, specialized into a single
+    function, as returned by `compile_schema()`.
+
+    Calling an instance validates and then standardizes a row, in place.
+    """
+    def __init__(self, validate, standardize):
+        self.validate = validate
+        self.standardize = standardize
+
+    def __call__(self, row):
+        self.validate(row)
+        return self.standardize(row)
+
+def compile_schema(vns=None):
+    """
+    Compile the rules of a Validation_and_Standardization into functions that
+    validate and standardize a row; Without the per-call construction of a
+    Validation_and_Standardization, or copying the row for each default added.
+
+    The rules compiled are those applied by
+    `Validation_and_Standardization.validate()` and
+    `Validation_and_Standardization.standardize()`, in the same order and with
+    the same error messages:
+    All keys and values should have non-zero length
+    The required keys should be present
+    "date_time" defaults to the current time, and "notes" to None
+    "_timestamp" is set to the current time
+
+    :param vns: Validation_and_Standardization, or None for the default rules
+    :return: Compiled_Schema
+    """
+    if vns is None:
+        vns = Validation_and_Standardization()
+
+    _zero_length_msg = vns._error_msgs["_zero_length_check"]
+    _required_keys_msg = vns._error_msgs["_required_keys_check"]
+    _required_keys = frozenset(vns._required_keys)
+
+    from datetime import datetime
+    _now = datetime.now
+
+    def _validate(row):
+        for k, v in row.items():
+            if (len(k) == 0) or (len(v) == 0):
+                raise Malformed_Input(_zero_length_msg)
+
+        if not (_required_keys <= row.keys()):
+            raise Malformed_Input(_required_keys_msg)
+
+    def _standardize(row):
+        now = _now(tz=None)
+
+        #TODO, as with `_date_time_check()` we should check if date_time is valid
+        if not "date_time" in row:
+            row["date_time"] = now
+
+        if not "notes" in row:
+            row["notes"] = None
+
+        row["_timestamp"] = now
+
+        return row
+
+    return Compiled_Schema(_validate, _standardize)
+
+_compiled = compile_schema()
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""
+Writer module
+
+A single writer thread, that commits rows to storage on behalf of many request
+threads. Rows waiting to be written are committed together as a group, with a
+single write and (depending on the durability mode) a single fsync; And each
+waiting thread is woken once its rows are stored.
+    see:
+    https://en.wikipedia.org/wiki/Group_commit
+
+Writer
+The main class of the module.
+"""
+
+#the durability modes of Writer:
+#`request`, each request is written and fsync-ed on its own
+#`batch`, requests are written and fsync-ed in groups
+#`interval`, requests are written in groups, and fsync-ed on a timer
+DURABILITY_MODES = ["request", "batch", "interval"]
+
+class _Job:
+    """
+    The rows of a single request to the Writer, and their outcome.
+    """
+    def __init__(self, rows):
+        import threading
+        self.rows = rows
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class Writer:
+    """
+    The Writer class.
+
+    Takes lists of rows from many threads through `submit()`, and commits them
+    from a single thread with `commit`; A function taking a list of rows and
+    returning the list of rows as stored. `sync` is a function forcing the
+    writes to disk (fsync), called as the durability mode requires.
+    """
+    def __init__(self, commit, sync, durability="batch", sync_interval=1.0,
+            max_batch=1024):
+        if not durability in DURABILITY_MODES:
+            raise ValueError(f"durability should be one of: {DURABILITY_MODES}")
+
+        import queue
+        self._commit = commit
+        self._sync = sync
+        self._durability = durability
+        self._sync_interval = sync_interval
+        self._max_batch = max_batch
+
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the writer thread.
+
+        :return: None
+        """
+        import threading
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Commit the rows already submitted, then stop the writer thread.
+
+        :return: None
+        """
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, rows):
+        """
+        Commit rows to storage, waiting until they are stored (and, depending
+        on the durability mode, fsync-ed). Errors raised while committing are
+        raised to every thread whose rows were in the failed group.
+
+        :param rows: list of dictionaries
+        :return: list of dictionaries, the rows as stored
+        """
+        job = _Job(rows)
+        self._queue.put(job)
+        job.done.wait()
+
+        if not job.error is None:
+            raise job.error
+
+        return job.result
+
+    def _run(self):
+        """
+        The body of the writer thread.
+
+        :return: None
+        """
+        import time
+        import queue
+
+        dirty = False #if there are writes not yet fsync-ed
+        next_sync = time.monotonic() + self._sync_interval
+
+        while True:
+            timeout = None
+            if self._durability == "interval":
+                timeout = max(next_sync - time.monotonic(), 0)
+
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                job = False #the timer has elapsed
+
+            stopping = (job is None)
+            batch = list()
+            if job:
+                batch.append(job)
+
+            #gather the other jobs waiting, to commit as a group
+            while (self._durability != "request") and (not stopping) and \
+                    (len(batch) < self._max_batch):
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if job is None:
+                    stopping = True
+                else:
+                    batch.append(job)
+
+            if len(batch) > 0:
+                self._commit_batch(batch)
+                dirty = (self._durability == "interval")
+
+            if (self._durability == "interval") and \
+                    (stopping or (time.monotonic() >= next_sync)):
+                if dirty:
+                    self._sync()
+                    dirty = False
+                next_sync = time.monotonic() + self._sync_interval
+
+            if stopping:
+                break
+
+    def _commit_batch(self, batch):
+        """
+        Commit the rows of a group of jobs with a single call to `commit`, and
+        wake the threads waiting on them.
+
+        :param batch: list of _Job
+        :return: None
+        """
+        rows = [row for job in batch for row in job.rows]
+
+        try:
+            stored = self._commit(rows)
+
+            if self._durability != "interval":
+                self._sync()
+        except BaseException as e:
+            for job in batch:
+                job.error = e
+        else:
+            start = 0
+            for job in batch:
+                job.result = stored[start:start + len(job.rows)]
+                start += len(job.rows)
+        finally:
+            for job in batch:
+                job.done.set()
@@ -1,7 +1,11 @@
 """
 An audit log service, built on flask.
 
-usage: main.py [-h] [database_path]
+usage: main.py [-h] [--durability {request,batch,interval}]
+               [--compact-interval COMPACT_INTERVAL] [database_path]
+       main.py serve [-h] [--workers WORKERS] [--host HOST] [--port PORT]
+                     [--durability {request,batch,interval}]
+                     [--compact-interval COMPACT_INTERVAL] [database_path]
 
 positional arguments:
   database_path
@@ -11,6 +15,18 @@ optional arguments:
 
 :param database_path: A path indicating where to save the database file.
                     Defaults to the current directory
+:param --durability: When appended events are forced to disk (fsync); Per
+                    request, per batch of requests written together, or on
+                    a one second timer. Defaults to `batch`
+:param --compact-interval: Seconds between snapshots of the database, after
+                    which the log the snapshot covers is removed; Or 0 to
+                    never take snapshots. Defaults to 3600
+
+The `serve` mode runs the service across many worker processes, for use in
+production, rather than with the development server:
+:param --workers: The number of worker processes. Defaults to the number of CPUs
+:param --host: The address to listen on. Defaults to 127.0.0.1
+:param --port: The port to listen on. Defaults to 5000
 
 ----
 
@@ -37,14 +53,53 @@ def _parse_input():
     :return: A dictionary mapping command line options to their or None
     """
     import argparse
+    import sys
+
+    #`serve` is only taken as a mode when given first, so that it doesn't
+    #shadow a database_path
+    _argv = sys.argv[1:]
+    serve = (list(_argv[:1]) == ["serve"])
 
     parser = argparse.ArgumentParser()
 
+    if serve:
+        import os
+        parser.prog += " serve"
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--host', type=str, default="127.0.0.1")
+        parser.add_argument('--port', type=int, default=5000)
+        _argv = _argv[1:]
+
+    from .Writer import DURABILITY_MODES
+    parser.add_argument(
+        '--durability', type=str, choices=DURABILITY_MODES, default="batch"
+        )
+
+    parser.add_argument('--compact-interval', type=float, default=3600)
+
     parser.add_argument('database_path', nargs='?', type=str)
 
+    if serve:
+        args = parser.parse_args(_argv)
+
+        return {
+            "database_path": args.database_path,
+            "durability": args.durability,
+            "compact_interval": args.compact_interval,
+            "serve": True,
+            "workers": args.workers,
+            "host": args.host,
+            "port": args.port,
+        }
+
     args = parser.parse_args()
 
-    return {"database_path": args.database_path}
+    return {
+        "database_path": args.database_path,
+        "durability": args.durability,
+        "compact_interval": args.compact_interval,
+        "serve": False,
+    }
 
 def _get_db_path(args):
     """
@@ -69,28 +124,50 @@ def _get_db_path(args):
 
     return db_path
 
-def init():
+def init(args=None):
     """
     Parses command-line input and then initializes an instance of Database
     with a valid path so it can save its data-file.
 
+    :param args: A dictionary of args as returned by _parse_input(), or None
+    to parse the command-line
     :return: an initialized Database object
     """
-    args = _parse_input()
+    if args is None:
+        args = _parse_input()
     db_path = _get_db_path(args)
 
     from .Database import Database as DB
-    db = DB(db_path)
+    compact_interval = args.get("compact_interval")
+    if compact_interval == 0:
+        compact_interval = None
+
+    db = DB(
+        db_path,
+        durability=args.get("durability", "batch"),
+        compact_interval=compact_interval,
+        )
 
     return db
 
 def main():
-    db = init()
+    args = _parse_input()
+    db = init(args)
 
     _DEBUG = True
 
     from . import Flask_app
-    if _DEBUG:
+    if args.get("serve"):
+        if _DEBUG:
+            db.add_user("test", "test")
+
+        #each worker opens the database for itself
+        db.close()
+        Flask_app.serve(
+            _get_db_path(args), args["workers"], args["host"], args["port"],
+            args["durability"], args["compact_interval"] or None
+            )
+    elif _DEBUG:
         db.add_user("test", "test")
         Flask_app.run(db, _DEBUG)
     else:
@@ -0,0 +1,145 @@
+import pytest
+
+from src.Analytics import Event_Columns, epicurve
+
+np = pytest.importorskip("numpy")
+
+def make_sample_row(event_type, location, day, hour=12):
+    from datetime import datetime, timedelta
+    return {
+        "event_type": event_type,
+        "location": location,
+        "_timestamp": datetime(2022, 5, 1, hour) + timedelta(days=day),
+    }
+
+def make_doubling_columns(days):
+    #Springfield doubles daily, Shelbyville holds steady
+    columns = Event_Columns()
+    for day in range(days):
+        for _ in range(2 ** day):
+            columns.add( make_sample_row("patient_infected", "Springfield", day) )
+        columns.add( make_sample_row("patient_infected", "Shelbyville", day) )
+        columns.add( make_sample_row("treatment", "Springfield", day) )
+    return columns
+
+class Test_Event_Columns:
+    def test1(self):
+        columns = Event_Columns()
+        columns.add( make_sample_row("treatment", "Springfield", 0) )
+        columns.add( make_sample_row("new_patient", "Springfield", 1) )
+        columns.add( make_sample_row("treatment", "Shelbyville", 1, hour=0) )
+
+        assert len(columns) == 3
+        assert columns.event_types == ["treatment", "new_patient"]
+        assert columns.locations == ["Springfield", "Shelbyville"]
+        assert columns.code_of("event_type", "new_patient") == 1
+        assert columns.code_of("event_type", "unknown") is None
+
+        days, event_types, locations = columns.arrays()
+        assert event_types.tolist() == [0, 1, 0]
+        assert locations.tolist() == [0, 0, 1]
+        assert (days[1] - days[0]) == 1
+
+    def test2(self):
+        import pickle
+        columns = Event_Columns()
+        columns.add( make_sample_row("treatment", "Springfield", 0) )
+
+        res = pickle.loads( pickle.dumps(columns) )
+        res.add( make_sample_row("treatment", "Springfield", 1) )
+
+        assert len(res) == 2
+        assert len(columns) == 1
+
+class Test_epicurve:
+    def test1(self):
+        from datetime import datetime
+        res = epicurve( make_doubling_columns(6), window=2 )
+
+        assert res["days"][0] == datetime(2022, 5, 1)
+        assert len(res["days"]) == 6
+        assert res["locations"] == ["Springfield", "Shelbyville"]
+        assert res["incidence"].tolist() == [
+            [1, 2, 4, 8, 16, 32],
+            [1, 1, 1, 1, 1, 1],
+            ]
+
+    def test2(self):
+        import math
+        res = epicurve( make_doubling_columns(6), window=2 )
+
+        #given from the first day with two full windows
+        assert np.isnan( res["growth_rate"][:, :3] ).all()
+        assert res["growth_rate"][0, 3:] == pytest.approx([math.log(2)] * 3)
+        assert res["doubling_time"][0, 3:] == pytest.approx([1, 1, 1])
+
+        #steady incidence doesn't double
+        assert res["growth_rate"][1, 3:] == pytest.approx([0, 0, 0])
+        assert np.isinf( res["doubling_time"][1, 3:] ).all()
+
+    def test3(self):
+        #a window holding no cases has no growth rate
+        columns = Event_Columns()
+        columns.add( make_sample_row("patient_infected", "Springfield", 0) )
+        columns.add( make_sample_row("patient_infected", "Springfield", 3) )
+
+        res = epicurve(columns, window=1)
+
+        assert res["incidence"].tolist() == [[1, 0, 0, 1]]
+        assert np.isnan( res["growth_rate"] ).all()
+        assert np.isnan( res["doubling_time"] ).all()
+
+    def test4(self):
+        from datetime import datetime
+        res = epicurve(
+            make_doubling_columns(6), window=2,
+            since=datetime(2022, 5, 2, 18), until=datetime(2022, 5, 4)
+            )
+
+        assert res["days"] == [datetime(2022, 5, 2), datetime(2022, 5, 3)]
+        assert res["incidence"].tolist() == [[2, 4], [1, 1]]
+
+    def test5(self):
+        res = epicurve( make_doubling_columns(3), event_type="treatment" )
+        assert res["incidence"].tolist() == [[1, 1, 1], [0, 0, 0]]
+
+        res = epicurve( make_doubling_columns(3), event_type="unknown" )
+        assert res["days"] == []
+        assert res["incidence"].shape == (2, 0)
+
+        res = epicurve( Event_Columns() )
+        assert res["days"] == []
+        assert res["locations"] == []
+
+    def test6(self):
+        #a range of days too wide to count is refused
+        from datetime import datetime, timedelta
+        from src.Analytics import MAX_DAYS
+        with pytest.raises(ValueError) as excinfo:
+            epicurve( make_doubling_columns(3), since=datetime(1, 1, 1) )
+
+        until = datetime(2022, 5, 1) + timedelta(days=MAX_DAYS)
+        res = epicurve(make_doubling_columns(3), until=until)
+
+        assert len(res["days"]) == MAX_DAYS
+
+    def test7(self):
+        #with no cases, an open end of the range counts no days
+        from datetime import datetime
+        for kwargs in [{"until": datetime(2026, 10, 18)}, {"since": datetime(1, 1, 1)}]:
+            res = epicurve(make_doubling_columns(3), event_type="unknown", **kwargs)
+
+            assert res["days"] == []
+            assert res["incidence"].shape == (2, 0)
+
+    def test8(self):
+        #a single location is counted alone
+        res = epicurve( make_doubling_columns(3), location="Shelbyville" )
+
+        assert res["locations"] == ["Shelbyville"]
+        assert res["incidence"].tolist() == [[1, 1, 1]]
+
+        res = epicurve( make_doubling_columns(3), location="Ogdenville" )
+
+        assert res["locations"] == []
+        assert res["days"] == []
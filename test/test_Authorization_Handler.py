@@ -84,4 +84,133 @@ class Test_is_authorized:
 
         from src.Authorization_Handler import Bad_Username_Or_Password
         with pytest.raises(Bad_Username_Or_Password) as excinfo:
-            test_ah.is_authorized(test_input)
\ No newline at end of file
+            test_ah.is_authorized(test_input)
+
+    def test4(self, setup_auth_handler, monkeypatch):
+        test_input = {'username': 'test', 'password': 'test'}
+        test_db.add_user('test', 'test')
+
+        assert test_ah.is_authorized(test_input)
+
+        #a repeat request is answered from the cache
+        from unittest.mock import MagicMock
+        mock_has_password = MagicMock()
+        monkeypatch.setattr(test_db, "username_has_password", mock_has_password)
+
+        assert test_ah.is_authorized(test_input)
+        mock_has_password.assert_not_called()
+
+    def test5(self, setup_auth_handler):
+        test_input = {'username': 'test', 'password': 'some bad password'}
+        test_db.add_user('test', 'test')
+
+        assert not test_ah.is_authorized(test_input)
+        assert len(test_ah._credential_cache) == 0
+
+from src.Authorization_Handler import Credential_Cache
+
+class Test_Credential_Cache:
+    def test1(self):
+        cache = Credential_Cache()
+
+        assert not cache.contains('test', 'test')
+
+        cache.add('test', 'test')
+
+        assert cache.contains('test', 'test')
+        assert not cache.contains('test', 'some bad password')
+        assert not cache.contains('some bad username', 'test')
+
+    def test2(self):
+        cache = Credential_Cache(ttl=0)
+        cache.add('test', 'test')
+
+        assert not cache.contains('test', 'test')
+        assert len(cache) == 0
+
+    def test3(self):
+        cache = Credential_Cache(max_size=2)
+        for i in range(3):
+            cache.add(f'test{i}', 'test')
+
+        assert len(cache) == 2
+        assert not cache.contains('test0', 'test')
+        assert cache.contains('test2', 'test')
+
+from src.Authorization_Handler import Token_Signer, Bad_Token
+
+class Test_Token_Signer:
+    def test1(self):
+        signer = Token_Signer()
+        token, expires_in = signer.issue('test')
+
+        assert expires_in == signer.ttl
+        assert signer.verify(token) == 'test'
+
+        #tokens are accepted by signers sharing a key, only
+        assert Token_Signer(signer._key).verify(token) == 'test'
+        with pytest.raises(Bad_Token) as excinfo:
+            Token_Signer().verify(token)
+
+    def test2(self):
+        signer = Token_Signer()
+        token, _ = signer.issue('test')
+        payload, signature = token.split(".")
+
+        import base64
+        forged = base64.urlsafe_b64encode(
+            base64.urlsafe_b64decode(payload).replace(b'"test"', b'"admin"')
+            ).decode("ascii")
+
+        for bad_token in [f"{forged}.{signature}", payload, "", "ü.ü", "a.b"]:
+            with pytest.raises(Bad_Token) as excinfo:
+                signer.verify(bad_token)
+
+    def test3(self):
+        signer = Token_Signer(ttl=0)
+        token, _ = signer.issue('test')
+
+        with pytest.raises(Bad_Token) as excinfo:
+            signer.verify(token)
+
+        assert "Expired" in str(excinfo.value)
+
+    def test4(self):
+        signer = Token_Signer()
+        token, _ = signer.issue('test')
+        other_token, _ = signer.issue('test')
+
+        signer.revoke(token)
+
+        assert len(signer) == 1
+        assert signer.verify(other_token) == 'test'
+        with pytest.raises(Bad_Token) as excinfo:
+            signer.verify(token)
+
+        assert "Revoked" in str(excinfo.value)
+
+    def test5(self, monkeypatch):
+        import time
+        signer = Token_Signer(ttl=10)
+        token, _ = signer.issue('test')
+        signer.revoke(token)
+
+        #revoked tokens are dropped from the deny list once expired
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 20)
+
+        other_token, _ = signer.issue('test')
+        signer.revoke(other_token)
+
+        assert len(signer) == 1
+
+class Test_tokens:
+    def test1(self, setup_auth_handler):
+        token, _ = test_ah.issue_token('test')
+
+        assert test_ah.token_username(token) == 'test'
+
+        test_ah.revoke_token(token)
+
+        with pytest.raises(Bad_Token) as excinfo:
+            test_ah.token_username(token)
@@ -0,0 +1,92 @@
+import pytest
+
+from src import Compression
+from src.Compression import Compressed_Cache
+
+def decompress(data, encoding):
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+    import gzip
+    return gzip.decompress(data)
+
+class Test_negotiate:
+    def test1(self):
+        from werkzeug.http import parse_accept_header
+
+        assert Compression.negotiate( parse_accept_header("gzip, deflate") ) == "gzip"
+        assert Compression.negotiate( parse_accept_header("gzip;q=0") ) is None
+        assert Compression.negotiate( parse_accept_header("identity") ) is None
+        assert Compression.negotiate( parse_accept_header("") ) is None
+        assert Compression.negotiate( parse_accept_header("*") ) == Compression.ENCODINGS[0]
+
+    def test2(self, monkeypatch):
+        pytest.importorskip("zstandard")
+        from werkzeug.http import parse_accept_header
+
+        assert Compression.negotiate( parse_accept_header("gzip, zstd") ) == "zstd"
+        assert Compression.negotiate( parse_accept_header("gzip, zstd;q=0.5") ) == "gzip"
+
+        #without zstandard installed, only gzip is offered
+        monkeypatch.setattr(Compression, "ENCODINGS", ["gzip"])
+        assert Compression.negotiate( parse_accept_header("zstd") ) is None
+
+class Test_compress:
+    @pytest.mark.parametrize("encoding", Compression.ENCODINGS)
+    def test1(self, encoding):
+        data = b'{"doctor": "Dr. Smith", "location": "Calgary, AB"},' * 1000
+        res = Compression.compress(data, encoding)
+
+        assert len(res) < len(data) / 10
+        assert decompress(res, encoding) == data
+
+    @pytest.mark.parametrize("encoding", Compression.ENCODINGS)
+    def test2(self, encoding):
+        chunks = [b"[", b'{"_seq": 0}'] + [b',{"_seq": %d}' % i for i in range(1, 10000)] + [b"]"]
+        res = list( Compression.compress_stream(iter(chunks), encoding) )
+
+        assert all( len(chunk) > 0 for chunk in res[:-1] )
+        assert decompress(b"".join(res), encoding) == b"".join(chunks)
+
+    @pytest.mark.parametrize("encoding", Compression.ENCODINGS)
+    def test3(self, encoding, monkeypatch):
+        monkeypatch.setattr(Compression, "STREAM_FLUSH_BYTES", 100)
+        chunks = [b'{"doctor": "Dr. Smith", "location": "Calgary, AB"},'] * 10
+
+        res = list( Compression.compress_stream(iter(chunks), encoding) )
+
+        #every chunk can be decompressed before the end of the stream
+        if encoding == "zstd":
+            import zstandard
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            import zlib
+            decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+
+        assert decompressor.decompress( b"".join(res[:-1]) ) == b"".join(chunks)
+
+class Test_Compressed_Cache:
+    def test1(self):
+        cache = Compressed_Cache()
+
+        assert cache.get("1-a", "gzip") is None
+
+        cache.put("1-a", "gzip", b"some bytes")
+
+        assert cache.get("1-a", "gzip") == b"some bytes"
+        assert cache.get("1-a", "zstd") is None
+        assert cache.get("2-a", "gzip") is None
+
+    def test2(self):
+        cache = Compressed_Cache(max_bytes=20)
+        for i in range(3):
+            cache.put(f"{i}-a", "gzip", b"0123456789")
+
+        assert len(cache) == 2
+        assert cache.get("0-a", "gzip") is None
+        assert cache.get("2-a", "gzip") == b"0123456789"
+
+        #a body larger than the cache isn't held
+        cache.put("3-a", "gzip", b"0" * 21)
+        assert cache.get("3-a", "gzip") is None
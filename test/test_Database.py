@@ -12,6 +12,7 @@ def setup_database(tmp_path):
 
     yield
 
+    test_db.close()
     test_db = None
 
 def make_sample_row():
@@ -100,6 +101,12 @@ class Test_append:
         sample_row["data"] = "some stored data"
         res = test_db.append( sample_row )
 
+        assert res["data"] == "some stored data"
+        assert "_timestamp" in res
+        assert res["_seq"] == 0
+
+        res = test_db.__repr__()
+
         assert len(res) == 1
         assert "data" in res[0]
         assert res[0]["data"] == "some stored data"
@@ -116,7 +123,9 @@ class Test_append:
 
         sample_row2 = make_sample_row()
         sample_row1["data"] = "some stored data 2"
-        res = test_db.append( sample_row2 )
+        test_db.append( sample_row2 )
+
+        res = test_db.__repr__()
 
         assert all( ["_timestamp" in row for row in res] )
 
@@ -161,6 +170,13 @@ class Test_escape_input:
         assert '&lt;b&gt;' in k #<b>
         assert '&lt;\x08&gt;' in k #<\b>
 
+    def test4(self, setup_database):
+        #values of JSON input are read as strings
+        sample_row = {"notes": None, "age": 42, "weight": 70.5, "bitten": False}
+        res = test_db._escape_input( sample_row )
+
+        assert res == {"age": "42", "weight": "70.5", "bitten": "false"}
+
 class Test_search:
     def test1(self, setup_database):
         res = test_db.search({})
@@ -244,6 +260,7 @@ class Test_check_disk_usage:
         test_res.free = 1
         test_res.total = 1
 
+        test_db._disk_monitor.sample()
         res = test_db._check_disk_usage()
         
         assert True
@@ -256,6 +273,7 @@ class Test_check_disk_usage:
         test_res.free = 0
         test_res.total = 1
 
+        test_db._disk_monitor.sample()
         try:
             test_db._check_disk_usage()
         except OSError as e:
@@ -272,6 +290,7 @@ class Test_check_disk_usage:
         test_res.free = 0
         test_res.total = 1
 
+        test_db._disk_monitor.sample()
         try:
             test_db.append({"test", "test"})
         except OSError as e:
@@ -280,6 +299,19 @@ class Test_check_disk_usage:
         else:
             assert False
 
+    @patch('shutil.disk_usage')
+    def test4(self, mock_disk_usage, setup_database):
+        from unittest.mock import MagicMock
+        test_res = MagicMock()
+        mock_disk_usage.return_value = test_res
+        test_res.free = 0
+        test_res.total = 1
+
+        #appending doesn't query the disk
+        test_db.append( make_sample_row() )
+
+        mock_disk_usage.assert_not_called()
+
 class Test__repr__:
     def test1(self, setup_database):
         res = test_db.__repr__()
@@ -299,7 +331,9 @@ class Test__repr__:
         sample_row2 = make_sample_row()
         sample_row2["data"] = "some stored data2"
 
-        res = test_db.append( sample_row2 )
+        test_db.append( sample_row2 )
+
+        res = test_db.__repr__()
 
         assert res[0]["_timestamp"] < res[1]["_timestamp"]
 
@@ -346,4 +380,808 @@ class Test_to_JSON_safe:
         assert True
 
         assert "date_time" in list( res3[0].keys() )
-        assert res3[0]["date_time"] == "last Friday"
\ No newline at end of file
+        assert res3[0]["date_time"] == "last Friday"
+
+class Test_reopen:
+    def test1(self, setup_database, tmp_path):
+        sample_row = make_sample_row()
+        sample_row["data"] = "some stored data"
+        test_db.append( sample_row )
+
+        res = Database(tmp_path).__repr__()
+
+        assert len(res) == 1
+        assert res[0]["data"] == "some stored data"
+        assert res[0]["_timestamp"] == test_db.__repr__()[0]["_timestamp"]
+
+    def test2(self, tmp_path):
+        #rows stored in the `data` table of earlier versions are moved to the log
+        import json
+        rows = {
+            str(i + 1): {
+                "doctor": "some doctor", "patient": f"some patient {i}",
+                "event_type": "some event", "location": "some location",
+                "date_time": "{TinyDate}:2022-05-01T12:00:00", "notes": None,
+                "_timestamp": f"{{TinyDate}}:2022-05-01T12:00:0{i}",
+            }
+            for i in range(2)
+        }
+        (tmp_path / "db.json").write_text(
+            json.dumps({"_users": {}, "data": rows})
+            )
+
+        db = Database(tmp_path)
+        res = db.__repr__()
+
+        assert [row["patient"] for row in res] == ["some patient 0", "some patient 1"]
+        assert [row["_seq"] for row in res] == [0, 1]
+        from datetime import datetime
+        assert res[1]["_timestamp"] == datetime(2022, 5, 1, 12, 0, 1)
+        assert len( db.search({"patient": "some patient 1"}) ) == 1
+        db.close()
+
+        assert not "data" in json.loads( (tmp_path / "db.json").read_text() )
+
+        #and only once
+        db = Database(tmp_path)
+        assert len( db.__repr__() ) == 2
+        db.close()
+
+class Test_index_row:
+    def test1(self, setup_database):
+        sample_row = make_sample_row()
+        sample_row["patient"] = "some patient"
+        test_db.append( sample_row )
+
+        assert test_db._indexes["patient"]["some patient"] == [0]
+
+    def test2(self, setup_database, tmp_path):
+        for i in range(3):
+            sample_row = make_sample_row()
+            sample_row["patient"] = f"some patient {i % 2}"
+            test_db.append( sample_row )
+
+        #indexes are rebuilt when the database is reopened
+        res = Database(tmp_path)
+
+        assert res._indexes["patient"]["some patient 0"] == [0, 2]
+        assert res._indexes["patient"]["some patient 1"] == [1]
+
+    def test3(self, setup_database):
+        for i in range(3):
+            sample_row = make_sample_row()
+            sample_row["patient"] = f"some patient {i % 2}"
+            sample_row["data"] = f"some stored data {i}"
+            test_db.append( sample_row )
+
+        res = test_db.search({"patient": "some patient 0"})
+
+        assert [row["data"] for row in res] == \
+            ["some stored data 0", "some stored data 2"]
+
+        res = test_db.search({
+            "patient": "some patient 0", "data": "some stored data 2"
+            })
+
+        assert len(res) == 1
+
+        res = test_db.search({"patient": "some patient 3"})
+
+        assert len(res) == 0
+
+class Test_order_row:
+    def test1(self, setup_database):
+        for i in range(3):
+            test_db.append( make_sample_row() )
+
+        assert [row["_seq"] for row in test_db.__repr__()] == [0, 1, 2]
+
+    def test2(self, setup_database):
+        from datetime import datetime, timedelta
+        now = datetime.now(tz=None)
+
+        #rows arriving out of order are merged in place
+        for seq, offset in enumerate([0, 2, 1, -1, 2]):
+            row = {"_timestamp": now + timedelta(seconds=offset), "_seq": seq}
+            test_db._order_row(row)
+
+        res = [row["_seq"] for row in test_db.__repr__()]
+
+        assert res == [3, 0, 2, 1, 4]
+
+    def test3(self, setup_database):
+        #rows are timestamped as they are committed, rather than prepared
+        prepared = test_db._prepare_row( make_sample_row() )
+        test_db.append( make_sample_row() )
+        test_db._writer.submit( [prepared] )
+
+        res = test_db.__repr__()
+
+        assert [row["_seq"] for row in res] == [0, 1]
+        assert res[0]["_timestamp"] <= res[1]["_timestamp"]
+
+    def test4(self, setup_database):
+        import threading
+
+        def append_rows():
+            for i in range(100):
+                test_db.append( make_sample_row() )
+
+        threads = [threading.Thread(target=append_rows) for i in range(8)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+
+        res = test_db.__repr__()
+
+        assert [row["_seq"] for row in res] == list(range(800))
+        assert all(
+            a["_timestamp"] <= b["_timestamp"] for a, b in zip(res, res[1:])
+            )
+
+class Test_page:
+    def test1(self, setup_database):
+        assert test_db.page(limit=2) == []
+
+    def test2(self, setup_database):
+        for i in range(5):
+            sample_row = make_sample_row()
+            sample_row["data"] = f"some stored data {i}"
+            test_db.append( sample_row )
+
+        from src.Database import make_cursor
+        res1 = test_db.page(limit=2)
+        res2 = test_db.page(limit=2, cursor=make_cursor(res1[-1]))
+        res3 = test_db.page(limit=2, cursor=make_cursor(res2[-1]))
+
+        assert [row["_seq"] for row in res1 + res2 + res3] == [0, 1, 2, 3, 4]
+
+    def test3(self, setup_database):
+        from src.Database import Bad_Cursor
+        with pytest.raises(Bad_Cursor) as excinfo:
+            test_db.page(cursor="some bad cursor")
+
+    def test4(self, setup_database):
+        for i in range(3):
+            test_db.append( make_sample_row() )
+
+        res = test_db.iter_rows()
+        first = next(res)
+
+        #a row ordered before those still to come doesn't shift them
+        from datetime import timedelta
+        row = {"_timestamp": first["_timestamp"] - timedelta(seconds=1), "_seq": 3}
+        test_db._order_row(row)
+
+        assert first["_seq"] == 0
+        assert [row["_seq"] for row in res] == [1, 2]
+
+        assert [row["_seq"] for row in test_db.page(limit=2)] == [3, 0]
+
+class Test_search_paging:
+    def test1(self, setup_database):
+        for i in range(5):
+            sample_row = make_sample_row()
+            sample_row["patient"] = f"some patient {i % 2}"
+            test_db.append( sample_row )
+
+        from src.Database import make_cursor
+        res1 = test_db.search({"patient": "some patient 0"}, limit=2)
+        res2 = test_db.search(
+            {"patient": "some patient 0"}, limit=2, cursor=make_cursor(res1[-1])
+            )
+
+        assert [row["_seq"] for row in res1] == [0, 2]
+        assert [row["_seq"] for row in res2] == [4]
+
+    def test2(self, setup_database):
+        for i in range(3):
+            test_db.append( make_sample_row() )
+
+        from src.Database import make_cursor
+        res1 = test_db.search({}, limit=1)
+        res2 = test_db.search({}, cursor=make_cursor(res1[-1]))
+
+        assert [row["_seq"] for row in res2] == [1, 2]
+
+    def test3(self, setup_database):
+        from src.Database import Bad_Cursor
+        with pytest.raises(Bad_Cursor) as excinfo:
+            test_db.iter_search({"data": "some data"}, cursor="some bad cursor")
+
+class Test_time_range:
+    def add_rows(self):
+        from datetime import datetime, timedelta
+        start = datetime(2022, 5, 1)
+
+        #appended out of order of `date_time`, some without a parsable one
+        for i, day in enumerate([3, 1, None, 2, 4]):
+            row = make_sample_row()
+            row["patient"] = f"some patient {i % 2}"
+            if not day is None:
+                row["date_time"] = (start + timedelta(days=day)).isoformat()
+            else:
+                row["date_time"] = "last Friday"
+            test_db.append(row)
+
+        return start
+
+    def test1(self, setup_database):
+        self.add_rows()
+        rows = test_db.page()
+        since = rows[1]["_timestamp"]
+        until = rows[3]["_timestamp"]
+
+        res = test_db.page(since=since, until=until)
+
+        assert [row["_seq"] for row in res] == [1, 2]
+        assert [row["_seq"] for row in test_db.page(since=since, limit=1)] == [1]
+        assert [row["_seq"] for row in test_db.page(until=since)] == [0]
+
+    def test2(self, setup_database):
+        from datetime import timedelta
+        start = self.add_rows()
+
+        res = test_db.page(
+            since=start + timedelta(days=2), time_field="date_time"
+            )
+
+        assert [row["_seq"] for row in res] == [0, 3, 4]
+
+        res = test_db.search(
+            {"patient": "some patient 0"},
+            since=start + timedelta(days=2), until=start + timedelta(days=4),
+            time_field="date_time"
+            )
+
+        assert [row["_seq"] for row in res] == [0]
+
+    def test3(self, setup_database):
+        #a range holding more rows than an index checks each row of the index
+        from datetime import timedelta
+        start = self.add_rows()
+
+        res = test_db.search(
+            {"patient": "some patient 1"}, since=start, time_field="date_time"
+            )
+
+        assert [row["_seq"] for row in res] == [1, 3]
+
+    def test4(self, setup_database):
+        from src.Database import make_cursor
+        from datetime import timedelta
+        start = self.add_rows()
+
+        res1 = test_db.search(
+            {}, limit=2, since=start, time_field="date_time"
+            )
+        res2 = test_db.search(
+            {}, cursor=make_cursor(res1[-1]), since=start, time_field="date_time"
+            )
+
+        assert [row["_seq"] for row in res1 + res2] == [0, 1, 3, 4]
+
+class Test_timeline:
+    def test1(self, setup_database):
+        assert test_db.timeline("some patient") == []
+
+    def test2(self, setup_database):
+        for i in range(5):
+            sample_row = make_sample_row()
+            sample_row["patient"] = f"some <patient> {i % 2}"
+            test_db.append( sample_row )
+
+        from src.Database import make_cursor
+        res1 = test_db.timeline("some <patient> 0", limit=2)
+        res2 = test_db.timeline("some <patient> 0", cursor=make_cursor(res1[-1]))
+
+        assert [row["_seq"] for row in res1] == [0, 2]
+        assert [row["_seq"] for row in res2] == [4]
+
+    def test3(self, setup_database):
+        from datetime import datetime, timedelta
+        now = datetime.now(tz=None)
+
+        #rows arriving out of order are merged into the timeline in place
+        for seq, offset in enumerate([0, 2, 1]):
+            row = {"_timestamp": now + timedelta(seconds=offset), "_seq": seq}
+            row["patient"] = "some patient"
+            test_db._rows.append(row)
+            test_db._order_row(row)
+
+        res = [row["_seq"] for row in test_db.timeline("some patient")]
+
+        assert res == [0, 2, 1]
+
+class Test_version:
+    def test1(self, setup_database, tmp_path):
+        assert test_db.version() == 0
+
+        test_db.append( make_sample_row() )
+        test_db.extend( [make_sample_row(), make_sample_row()] )
+
+        assert test_db.version() == 3
+
+        #rows appended by another process are counted
+        other_db = Database(tmp_path)
+        other_db.append( make_sample_row() )
+        other_db.close()
+
+        assert test_db.version() == 4
+
+class Test_after:
+    def test1(self, setup_database):
+        for i in range(6):
+            sample_row = make_sample_row()
+            sample_row["patient"] = f"some patient {i % 2}"
+            test_db.append( sample_row )
+
+        assert [row["_seq"] for row in test_db.search({}, after=-1)] == list(range(6))
+        assert [row["_seq"] for row in test_db.search({}, after=3)] == [4, 5]
+        assert [row["_seq"] for row in test_db.search({}, limit=1, after=3)] == [4]
+        assert test_db.search({}, after=5) == []
+
+        res = test_db.search({"patient": "some patient 1"}, after=1)
+        assert [row["_seq"] for row in res] == [3, 5]
+
+        res = test_db.search_any(
+            [{"patient": "some patient 0"}, {"patient": "some patient 1"}], after=2
+            )
+        assert [row["_seq"] for row in res] == [3, 4, 5]
+
+    def test2(self, setup_database, monkeypatch):
+        test_db.extend( [make_sample_row() for i in range(1000)] )
+
+        #only the rows after `after` are checked
+        import src.Database
+        checked = list()
+        def mock_matches(row, q):
+            checked.append( row["_seq"] )
+            return True
+        monkeypatch.setattr(src.Database, "_matches", mock_matches)
+
+        res = test_db.search({}, after=997)
+
+        assert [row["_seq"] for row in res] == [998, 999]
+        assert checked == [998, 999]
+
+class Test_changes:
+    def test1(self, setup_database):
+        for i in range(4):
+            sample_row = make_sample_row()
+            sample_row["patient"] = f"some patient {i % 2}"
+            test_db.append( sample_row )
+
+        assert [row["_seq"] for row in test_db.iter_changes(-1)] == [0, 1, 2, 3]
+        assert [row["_seq"] for row in test_db.iter_changes(1)] == [2, 3]
+        assert [row["_seq"] for row in test_db.iter_changes(3)] == []
+        assert [row["_seq"] for row in test_db.iter_changes(0, before=2)] == [1]
+
+        res = test_db.iter_changes(0, {"patient": "some patient 1"})
+        assert [row["_seq"] for row in res] == [1, 3]
+
+    def test2(self, setup_database):
+        import threading
+        import time
+
+        test_db.append( make_sample_row() )
+
+        assert test_db.wait_for_rows(-1, 0)
+        assert not test_db.wait_for_rows(0, 0.1)
+
+        #waiters are woken as rows are committed
+        timer = threading.Timer(0.2, lambda: test_db.append( make_sample_row() ))
+        timer.start()
+
+        start = time.monotonic()
+        assert test_db.wait_for_rows(0, 10)
+        assert time.monotonic() - start < 5
+
+        timer.join()
+
+    def test3(self, setup_database, tmp_path, monkeypatch):
+        import threading
+        import src.Database
+        monkeypatch.setattr(src.Database, "_FEED_POLL_SECONDS", 0.05)
+
+        test_db.append( make_sample_row() )
+
+        #rows appended by another process are found by checking the log
+        def append_elsewhere():
+            other_db = Database(tmp_path)
+            other_db.append( make_sample_row() )
+            other_db.close()
+
+        timer = threading.Timer(0.2, append_elsewhere)
+        timer.start()
+
+        assert test_db.wait_for_rows(0, 10)
+        assert [row["_seq"] for row in test_db.iter_changes(0)] == [1]
+
+        timer.join()
+
+    def test4(self, setup_database, tmp_path, monkeypatch):
+        import threading
+        import time
+        import src.Database
+        monkeypatch.setattr(src.Database, "_FEED_POLL_SECONDS", 0.05)
+
+        test_db.append( make_sample_row() )
+
+        #waiters that stop waiting hand checking the log to those remaining
+        results = list()
+        waiters = [
+            threading.Thread(
+                target=lambda t=t: results.append( test_db.wait_for_rows(0, t) )
+                )
+            for t in [0.1, 0.1, 10, 10]
+            ]
+        for waiter in waiters:
+            waiter.start()
+
+        time.sleep(0.5)
+        other_db = Database(tmp_path)
+        other_db.append( make_sample_row() )
+        other_db.close()
+
+        start = time.monotonic()
+        for waiter in waiters:
+            waiter.join()
+
+        assert time.monotonic() - start < 5
+        assert sorted(results) == [False, False, True, True]
+
+class Test_stats:
+    def test1(self, setup_database, tmp_path):
+        for i in range(3):
+            sample_row = make_sample_row()
+            sample_row["event_type"] = f"some event {i % 2}"
+            test_db.append( sample_row )
+
+        assert test_db.stats().counts("event_type") == {
+            "some event 0": 2, "some event 1": 1
+            }
+
+        #counts are rebuilt as the database is reopened
+        res = Database(tmp_path).stats()
+
+        assert len(res) == 3
+        assert res.counts("location") == {"some value": 3}
+
+class Test_epicurve:
+    def test1(self, setup_database, tmp_path):
+        pytest.importorskip("numpy")
+
+        for i in range(3):
+            sample_row = make_sample_row()
+            sample_row["event_type"] = "patient_infected"
+            sample_row["location"] = f"Springfield & {i % 2}"
+            test_db.append( sample_row )
+
+        res = test_db.epicurve(window=1)
+
+        assert res["locations"] == ["Springfield &amp; 0", "Springfield &amp; 1"]
+        assert res["incidence"].sum(axis=1).tolist() == [2, 1]
+        assert test_db.epicurve(event_type="some value")["days"] == []
+
+        #columns are kept in snapshots, and rebuilt as the database is reopened
+        test_db.compact()
+        sample_row = make_sample_row()
+        sample_row["event_type"] = "patient_infected"
+        test_db.append( sample_row )
+
+        res = Database(tmp_path).epicurve(window=1)
+
+        assert res["incidence"].sum(axis=1).tolist() == [2, 1, 1]
+
+class Test_text_search:
+    def add_rows(self):
+        notes = [
+            "tried the tango, no response",
+            "tried the waltz",
+            "tango then waltz, patient's fever broke",
+            None,
+        ]
+        for i, note in enumerate(notes):
+            sample_row = make_sample_row()
+            sample_row["patient"] = f"some patient {i % 2}"
+            if not note is None:
+                sample_row["notes"] = note
+            sample_row["symptoms"] = "uncontrollable moonwalking"
+            test_db.append( sample_row )
+
+    def test1(self, setup_database):
+        self.add_rows()
+
+        res = test_db.search({}, text="tango OR waltz")
+
+        assert [row["_seq"] for row in res] == [0, 1, 2]
+
+        res = test_db.search({}, text='"patient\'s fever"')
+
+        assert [row["_seq"] for row in res] == [2]
+
+    def test2(self, setup_database):
+        #combined with a query, and paged
+        self.add_rows()
+
+        from src.Database import make_cursor
+        res1 = test_db.search({"patient": "some patient 0"}, limit=1, text="tango")
+        res2 = test_db.search(
+            {"patient": "some patient 0"}, cursor=make_cursor(res1[-1]), text="tango"
+            )
+
+        assert [row["_seq"] for row in res1 + res2] == [0, 2]
+
+    def test3(self, setup_database):
+        self.add_rows()
+
+        res = test_db.search({}, text="moonwalking", text_field="symptoms")
+
+        assert len(res) == 4
+        assert test_db.search({}, text="moonwalking") == []
+
+        #hash indexed fields aren't free-text
+        assert test_db.search({}, text="patient", text_field="patient") == []
+
+    def test4(self, setup_database):
+        from src.Text_Index import Bad_Text_Query
+        with pytest.raises(Bad_Text_Query) as excinfo:
+            test_db.iter_search({}, text=" ")
+
+class Test_transmission:
+    def add_rows(self):
+        for source, patient in [(None, "a"), ("a", "b"), ("b", "c"), ("a", "d")]:
+            sample_row = make_sample_row()
+            sample_row["patient"] = patient
+            if not source is None:
+                sample_row["infected_by"] = source
+            test_db.append( sample_row )
+
+    def test1(self, setup_database, tmp_path):
+        self.add_rows()
+
+        assert test_db.transmission_chain("c") == ["a", "b", "c"]
+        assert test_db.transmission_chain("some unknown patient") == []
+
+        #the graph is rebuilt as the database is reopened
+        assert Database(tmp_path).transmission_chain("c") == ["a", "b", "c"]
+
+    def test2(self, setup_database):
+        self.add_rows()
+
+        res = test_db.transmission_cluster("a", depth=1)
+
+        assert res == [("a", None, 0), ("b", "a", 1), ("d", "a", 1)]
+        assert test_db.transmission_cluster("some unknown patient") == []
+        assert test_db.largest_clusters() == [("a", 4)]
+
+class Test_compact:
+    def add_rows(self, db, n, patient="some patient"):
+        for i in range(n):
+            sample_row = make_sample_row()
+            sample_row["patient"] = patient
+            sample_row["notes"] = f"tried the tango {i}"
+            db.append( sample_row )
+
+    def test1(self, setup_database, tmp_path):
+        assert not test_db.compact()
+
+        self.add_rows(test_db, 3)
+
+        assert test_db.compact()
+        assert not test_db.compact()
+
+        self.add_rows(test_db, 2, "some other patient")
+        test_db.close()
+
+        #only the snapshot, and the segment started for it, are left
+        log_path = tmp_path / "db_log"
+        assert sorted(p.name for p in log_path.glob("0*")) == [
+            "00000000000000000003.seg", "00000000000000000003.snap"
+            ]
+
+        res = Database(tmp_path)
+
+        assert [row["_seq"] for row in res.__repr__()] == [0, 1, 2, 3, 4]
+        assert len( res.search({"patient": "some patient"}) ) == 3
+        assert len( res.search({}, text="tango") ) == 5
+        assert len( res.timeline("some other patient") ) == 2
+        assert len( res.stats() ) == 5
+
+        #rows are appended following on from the snapshot
+        assert res.append( make_sample_row() )["_seq"] == 5
+        res.close()
+
+    def test2(self, setup_database, tmp_path, monkeypatch):
+        #where fork isn't supported, the snapshot is written in-process
+        import os
+        monkeypatch.delattr(os, "fork")
+
+        self.add_rows(test_db, 3)
+
+        assert test_db.compact()
+        test_db.close()
+
+        assert len( Database(tmp_path).__repr__() ) == 3
+
+    def test3(self, setup_database, tmp_path):
+        #another process compacting away rows not yet read
+        other_db = Database(tmp_path)
+        self.add_rows(test_db, 2)
+        test_db._log.roll_over()
+        self.add_rows(test_db, 2)
+        test_db.compact()
+
+        assert len( other_db.__repr__() ) == 4
+        assert other_db.append( make_sample_row() )["_seq"] == 4
+
+        other_db.close()
+
+    def test4(self, setup_database, tmp_path):
+        #rows loaded from another process's snapshot are added to those
+        #held, which readers meanwhile never see emptied
+        other_db = Database(tmp_path)
+        self.add_rows(test_db, 2)
+        assert len( other_db.__repr__() ) == 2
+
+        rows = other_db._rows
+        seen = list()
+        load_row = other_db._load_row
+        def mock_load_row(row):
+            seen.append( len(other_db._rows) )
+            load_row(row)
+        other_db._load_row = mock_load_row
+
+        test_db._log.roll_over()
+        self.add_rows(test_db, 2)
+        test_db.compact()
+
+        assert len( other_db.__repr__() ) == 4
+        assert seen == [2, 3]
+        assert other_db._rows is rows
+        assert len( other_db.search({"doctor": "some value"}) ) == 4
+
+        other_db.close()
+
+class Test_parse_time:
+    def test1(self):
+        from src.Database import parse_time
+        from datetime import datetime, timezone
+
+        assert parse_time("2022-05-01") == datetime(2022, 5, 1)
+        assert parse_time("last Friday") is None
+        assert parse_time(None) is None
+
+        time = datetime(2022, 5, 1, tzinfo=timezone.utc)
+        assert parse_time(time.isoformat()) == time.astimezone().replace(tzinfo=None)
+
+class Test_extend:
+    def test1(self, setup_database, tmp_path):
+        rows = [make_sample_row() for i in range(3)]
+        rows[1]["data"] = ""
+
+        stored, errors = test_db.extend(rows)
+
+        assert [row["_seq"] for row in stored] == [0, 1]
+        assert len(errors) == 1
+        assert errors[0][0] == 1
+
+        assert len( Database(tmp_path).__repr__() ) == 2
+
+    def test2(self, setup_database):
+        from unittest.mock import MagicMock
+        test_db._log = MagicMock()
+
+        test_db.extend([make_sample_row() for i in range(3)])
+
+        #all rows are committed with a single write
+        test_db._log.extend.assert_called_once()
+        test_db._log.append.assert_not_called()
+
+class Test_search_any:
+    def test1(self, setup_database):
+        for i in range(4):
+            sample_row = make_sample_row()
+            sample_row["patient"] = f"some patient {i % 2}"
+            sample_row["data"] = f"some stored data {i}"
+            test_db.append( sample_row )
+
+        res = test_db.search_any([
+            {"patient": "some patient 1"}, {"data": "some stored data 0"},
+            {"data": "some stored data 1"},
+        ])
+
+        assert [row["_seq"] for row in res] == [0, 1, 3]
+
+    def test2(self, setup_database):
+        assert test_db.search_any([]) == []
+
+class Test_encoded:
+    def test1(self, setup_database):
+        sample_row = make_sample_row()
+        sample_row["date_time"] = "last Friday"
+        row = test_db.append( sample_row )
+
+        import json
+        from src.Database import to_JSON_safe
+        res = json.loads( test_db.encoded(row) )
+
+        assert res == to_JSON_safe([row])[0]
+        assert len(test_db._encoded_rows) == 1
+
+    def test2(self, setup_database):
+        rows = [test_db.append( make_sample_row() ) for i in range(3)]
+
+        import json
+        res = json.loads( test_db.encoded_list(rows) )
+
+        assert [row["_seq"] for row in res] == [0, 1, 2]
+        assert json.loads( test_db.encoded_list([]) ) == []
+
+from src.Database import Encoded_Row_Cache
+
+class Test_Encoded_Row_Cache:
+    def test1(self):
+        cache = Encoded_Row_Cache(10)
+        cache.put(0, b"12345")
+        cache.put(1, b"12345")
+
+        assert cache.get(0) == b"12345"
+
+        #the least recently used entry is evicted
+        cache.put(2, b"12345")
+
+        assert cache.get(1) is None
+        assert cache.get(0) == b"12345"
+        assert cache.get(2) == b"12345"
+
+    def test2(self):
+        cache = Encoded_Row_Cache(4)
+        cache.put(0, b"12345")
+
+        assert cache.get(0) is None
+        assert len(cache) == 0
+
+class Test_catch_up:
+    def test1(self, setup_database, tmp_path):
+        #another process appending to the same database
+        other_db = Database(tmp_path)
+        other_db.append( make_sample_row() )
+
+        assert len( test_db.__repr__() ) == 1
+        assert len( test_db.search({"doctor": "some value"}) ) == 1
+
+        row = test_db.append( make_sample_row() )
+
+        assert row["_seq"] == 1
+        assert [row["_seq"] for row in other_db.__repr__()] == [0, 1]
+
+        other_db.close()
+
+    def test2(self, setup_database, tmp_path):
+        #users are written out for other processes
+        test_db.add_user("test", "test")
+
+        assert Database(tmp_path).username_exists("test")
+
+    def test3(self, setup_database, tmp_path):
+        #a record torn by a process that died mid-write
+        other_db = Database(tmp_path)
+        test_db.append( make_sample_row() )
+
+        segment = test_db._log.segments()[-1]
+        data = segment.read_bytes()
+        with open(segment, "ab") as f:
+            f.write(data[:5])
+
+        rows = [db.append( make_sample_row() ) for db in [test_db, other_db] * 2]
+
+        assert [row["_seq"] for row in rows] == [1, 2, 3, 4]
+        assert [row["_seq"] for row in other_db.__repr__()] == [0, 1, 2, 3, 4]
+        other_db.close()
+        test_db.close()
+
+        reopened = Database(tmp_path)
+
+        assert [row["_seq"] for row in reopened.__repr__()] == [0, 1, 2, 3, 4]
+        reopened.close()
@@ -0,0 +1,105 @@
+import pytest
+from unittest.mock import patch
+
+from src.Disk_Monitor import Disk_Monitor
+
+def make_usage(free, total):
+    from unittest.mock import MagicMock
+    res = MagicMock()
+    res.free = free
+    res.total = total
+    return res
+
+class Test_sample:
+    @patch('shutil.disk_usage')
+    def test1(self, mock_disk_usage, tmp_path):
+        mock_disk_usage.return_value = make_usage(50, 100)
+
+        monitor = Disk_Monitor(tmp_path)
+        monitor.sample()
+
+        assert not monitor.is_full
+        mock_disk_usage.assert_called_with(tmp_path)
+
+    @patch('shutil.disk_usage')
+    def test2(self, mock_disk_usage, tmp_path):
+        mock_disk_usage.return_value = make_usage(1, 100)
+
+        monitor = Disk_Monitor(tmp_path)
+        monitor.sample()
+
+        assert monitor.is_full
+
+    @patch('shutil.disk_usage')
+    def test3(self, mock_disk_usage, tmp_path):
+        #a volume reporting no size
+        mock_disk_usage.return_value = make_usage(0, 0)
+
+        monitor = Disk_Monitor(tmp_path)
+        monitor.sample()
+
+        assert monitor.is_full
+
+        mock_disk_usage.return_value = make_usage(10, 0)
+        monitor.sample()
+
+        assert not monitor.is_full
+
+class Test_seconds_to_full:
+    @patch('shutil.disk_usage')
+    def test1(self, mock_disk_usage, tmp_path):
+        mock_disk_usage.return_value = make_usage(50, 100)
+
+        monitor = Disk_Monitor(tmp_path, bytes_written=lambda: 0)
+        monitor.sample()
+
+        assert monitor.seconds_to_full() is None
+
+    @patch('time.monotonic')
+    @patch('shutil.disk_usage')
+    def test2(self, mock_disk_usage, mock_monotonic, tmp_path):
+        mock_disk_usage.return_value = make_usage(1001, 100000)
+
+        written = [0]
+        monitor = Disk_Monitor(tmp_path, bytes_written=lambda: written[0])
+
+        mock_monotonic.return_value = 0
+        monitor.sample()
+
+        written[0] = 20
+        mock_monotonic.return_value = 1
+        monitor.sample()
+
+        #10 bytes/second (smoothed from 20), with 1 byte free above the reserve
+        assert monitor.write_rate == 10
+        assert monitor.seconds_to_full() == pytest.approx(.1)
+
+class Test_start:
+    def test1(self, tmp_path):
+        monitor = Disk_Monitor(tmp_path, interval=.01)
+        monitor.start()
+
+        assert not monitor.free is None
+
+        monitor.stop()
+
+    @patch('shutil.disk_usage')
+    def test2(self, mock_disk_usage, tmp_path):
+        #sampling carries on after an error
+        import errno
+        import time
+        mock_disk_usage.return_value = make_usage(50, 100)
+
+        monitor = Disk_Monitor(tmp_path, interval=.01)
+        monitor.start()
+
+        mock_disk_usage.side_effect = OSError(errno.EIO, "Input/output error")
+        time.sleep(.05)
+
+        mock_disk_usage.side_effect = None
+        mock_disk_usage.return_value = make_usage(1, 100)
+        time.sleep(.05)
+
+        assert monitor.is_full
+
+        monitor.stop()
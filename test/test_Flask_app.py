@@ -19,16 +19,20 @@ def teardown_database():
 
 @pytest.fixture
 def setup_flask_app(setup_database):
-    import src.Flask_app as fa
-    fa._db = test_db
-
-    from src.Authorization_Handler import Authorization_Handler
-    fa._ah = Authorization_Handler(fa._db)
+    global _app
+    from src.Flask_app import create_app
+    _app = create_app(test_db)
 
     yield
 
     teardown_database()
 
+def make_sample_row():
+    import src.Validation_and_Standardization_Handler as vns1
+    vns2 = vns1.Validation_and_Standardization()
+
+    return {str(k):"some value" for k in vns2._required_keys}
+
 class Test_post:
     def test_request_too_large(self, setup_flask_app, monkeypatch):
         from unittest.mock import MagicMock
@@ -244,6 +248,188 @@ class Test_post:
             with pytest.raises(Mock_Exception) as excinfo:
                 Main.post(mock_self)
 
+    def test_response_record(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(2):
+            with _app.test_request_context(
+                "/log?response=record", method="POST", data=make_sample_row()
+            ):
+                from flask import request
+                request.authorization = {'username' : "test", 'password' : "test"}
+
+                res = Main.post(mock_self)
+
+        assert isinstance(res, dict)
+        assert res["_seq"] == 1
+        assert res["_user"] == "test"
+        assert isinstance(res["_timestamp"], str)
+
+    def test_response_ack(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        with _app.test_request_context(
+            "/log?response=ack", method="POST", data=make_sample_row()
+        ):
+            from flask import request
+            request.authorization = {'username' : "test", 'password' : "test"}
+
+            res = Main.post(mock_self)
+
+        assert res == ("", 204)
+        assert len(test_db.__repr__()) == 1
+
+    def test_response_bad_mode(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        with _app.test_request_context(
+            "/log?response=some bad mode", method="POST", data=make_sample_row()
+        ):
+            from flask import request
+            request.authorization = {'username' : "test", 'password' : "test"}
+
+            from werkzeug.exceptions import BadRequest
+            with pytest.raises(BadRequest) as excinfo:
+                Main.post(mock_self)
+
+        assert len(test_db.__repr__()) == 0
+
+    def test_json(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        with _app.test_request_context(
+            "/log?response=record", method="POST", json=make_sample_row()
+        ):
+            from flask import request
+            request.authorization = {'username' : "test", 'password' : "test"}
+
+            res = Main.post(mock_self)
+
+        assert res["_seq"] == 0
+        assert res["_user"] == "test"
+
+    def test_json_list(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        body = [make_sample_row(), {"data": "some stored data"}, make_sample_row()]
+        with _app.test_request_context(
+            "/log", method="POST", json=body
+        ):
+            from flask import request
+            request.authorization = {'username' : "test", 'password' : "test"}
+
+            res = Main.post(mock_self)
+
+        assert res["appended"] == 2
+        assert [e["row"] for e in res["errors"]] == [1]
+
+    def test_bad_json(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        from werkzeug.exceptions import BadRequest
+        for body in ["some bad json", "[1, 2]", "\"some string\""]:
+            with _app.test_request_context(
+                "/log", method="POST", data=body, content_type="application/json"
+            ):
+                from flask import request
+                request.authorization = {'username' : "test", 'password' : "test"}
+
+                with pytest.raises(BadRequest) as excinfo:
+                    Main.post(mock_self)
+
+    def test_json_values(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        body = make_sample_row()
+        body.update( {"notes": None, "age": 42, "weight": 70.5, "bitten": True} )
+        with _app.test_request_context("/log", method="POST", json=body):
+            Main.post(mock_self)
+
+        row = test_db.__repr__()[-1]
+
+        #a null is taken as an absent field
+        assert row["notes"] is None
+        assert row["age"] == "42"
+        assert row["weight"] == "70.5"
+        assert row["bitten"] == "true"
+
+        from werkzeug.exceptions import BadRequest
+        for value in [{"x": 1}, [1, 2]]:
+            body = make_sample_row()
+            body["notes"] = value
+            with _app.test_request_context("/log", method="POST", json=body):
+                with pytest.raises(BadRequest) as excinfo:
+                    Main.post(mock_self)
+
+            #nor are queries nested
+            with _app.test_request_context(
+                    "/log", method="GET", json={"patient": value}):
+                with pytest.raises(BadRequest) as excinfo:
+                    Main.get(mock_self)
+
 class Test_get:
     def test_request_too_large(self, monkeypatch, setup_flask_app):
         from unittest.mock import MagicMock
@@ -360,18 +546,977 @@ class Test_get:
 
         mock_search.assert_called_with({"some key": "some data"})
 
-class Test_run:
-    def test_1(self, setup_database):
+    def test_paging(self, monkeypatch, setup_flask_app):
         from unittest.mock import MagicMock
-        import src.Flask_app as Flask_app
-        Flask_app._app = MagicMock()
+        mock_self = MagicMock()
 
-        from src.Flask_app import run
-        run(test_db)
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(3):
+            test_db.append( make_sample_row() )
+
+        with _app.test_request_context(
+            "/log?limit=2", method="GET", data={}
+        ):
+            res1 = Main.get(mock_self)
+
+        assert [row["_seq"] for row in res1.get_json()] == [0, 1]
+        assert "X-Next-Cursor" in res1.headers
+
+        _cursor = res1.headers["X-Next-Cursor"]
+        with _app.test_request_context(
+            f"/log?limit=2&cursor={_cursor}", method="GET", data={}
+        ):
+            res2 = Main.get(mock_self)
+
+        assert [row["_seq"] for row in res2.get_json()] == [2]
+        assert not "X-Next-Cursor" in res2.headers
+
+    def test_bad_paging(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        from werkzeug.exceptions import BadRequest
+        for args in ["limit=0", "limit=some bad limit", "cursor=some bad cursor"]:
+            with _app.test_request_context(
+                f"/log?{args}", method="GET", data={}
+            ):
+                with pytest.raises(BadRequest) as excinfo:
+                    Main.get(mock_self)
+
+    def test_stream(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(3):
+            test_db.append( make_sample_row() )
+
+        with _app.test_request_context(
+            "/log?stream=1&limit=2", method="GET", data={}
+        ):
+            res = Main.get(mock_self)
+            assert res.is_streamed
+
+            body = res.get_data()
+
+        import json
+        assert [row["_seq"] for row in json.loads(body)] == [0, 1]
+
+    def test_json_search(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(3):
+            row = make_sample_row()
+            row["patient"] = f"some patient {i}"
+            test_db.append(row)
+
+        with _app.test_request_context(
+            "/log", method="GET", json={"patient": "some patient 1"}
+        ):
+            res = Main.get(mock_self).get_json()
+
+        assert [row["_seq"] for row in res] == [1]
+
+        body = [{"patient": "some patient 2"}, {"patient": "some patient 0"}]
+        with _app.test_request_context(
+            "/log", method="GET", json=body
+        ):
+            res = Main.get(mock_self).get_json()
+
+        assert [row["_seq"] for row in res] == [0, 2]
 
-        assert not Flask_app._db is None
-        assert not Flask_app._ah is None
+    def test_time_range(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(3):
+            row = make_sample_row()
+            row["date_time"] = f"2022-05-0{i + 1}T12:00:00"
+            row["patient"] = f"some patient {i % 2}"
+            test_db.append(row)
+
+        _since = test_db.page()[1]["_timestamp"].isoformat()
+        from urllib.parse import quote
+        with _app.test_request_context(
+            f"/log?since={quote(_since)}", method="GET", data={}
+        ):
+            res = Main.get(mock_self).get_json()
+
+        assert [row["_seq"] for row in res] == [1, 2]
+
+        with _app.test_request_context(
+            "/log?time_field=date_time&since=2022-05-02&until=2022-05-03T12:00:00",
+            method="GET", json={"patient": "some patient 1"}
+        ):
+            res = Main.get(mock_self).get_json()
+
+        assert [row["_seq"] for row in res] == [1]
+
+    def test_bad_time_range(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        from werkzeug.exceptions import BadRequest
+        for query in ["since=yesterday", "until=", "time_field=notes"]:
+            with _app.test_request_context(
+                f"/log?{query}", method="GET", data={}
+            ):
+                with pytest.raises(BadRequest) as excinfo:
+                    Main.get(mock_self)
+
+    def test_text_search(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i, note in enumerate(["tried the tango", "tried the waltz"]):
+            row = make_sample_row()
+            row["notes"] = note
+            row["patient"] = f"some patient {i}"
+            test_db.append(row)
+
+        with _app.test_request_context(
+            "/log?text=tried", method="GET", data={}
+        ):
+            res = Main.get(mock_self).get_json()
+
+        assert [row["_seq"] for row in res] == [0, 1]
+
+        with _app.test_request_context(
+            "/log?text=tried", method="GET", json={"patient": "some patient 1"}
+        ):
+            res = Main.get(mock_self).get_json()
+
+        assert [row["_seq"] for row in res] == [1]
+
+        with _app.test_request_context(
+            "/log?text=OR", method="GET", data={}
+        ):
+            from werkzeug.exceptions import BadRequest
+            with pytest.raises(BadRequest) as excinfo:
+                Main.get(mock_self)
+
+    def test_etag(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
 
-        Flask_app._app.run.assert_called()
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        test_db.append( make_sample_row() )
+
+        etags = dict()
+        for query in ["/log", "/log?limit=1", "/log?stream=1"]:
+            with _app.test_request_context(query, method="GET", data={}):
+                etags[query] = Main.get(mock_self).get_etag()[0]
+        with _app.test_request_context(
+            "/log", method="GET", data={"patient": "some value"}
+        ):
+            etags["search"] = Main.get(mock_self).get_etag()[0]
+
+        #each query is tagged apart
+        assert len( set(etags.values()) ) == 4
+
+        #matching requests aren't read from the database at all
+        import src.Database
+        def fail(*args, **kwargs):
+            raise AssertionError("the database should not be read")
+        for k in ["__repr__", "search", "page"]:
+            monkeypatch.setattr(src.Database.Database, k, fail)
+        monkeypatch.setattr(src.Database, "to_JSON_safe", fail)
+
+        with _app.test_request_context(
+            "/log", method="GET", data={}, headers={"If-None-Match": f'"{etags["/log"]}"'}
+        ):
+            res = Main.get(mock_self)
+
+        assert res.status_code == 304
+        assert res.get_etag()[0] == etags["/log"]
+
+        with _app.test_request_context(
+            "/log", method="GET", data={"patient": "some value"},
+            headers={"If-None-Match": f'"{etags["/log"]}", "{etags["search"]}"'}
+        ):
+            assert Main.get(mock_self).status_code == 304
+
+        #appending a row changes the version of the database, and so the tag
+        monkeypatch.undo()
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+        test_db.append( make_sample_row() )
+
+        with _app.test_request_context(
+            "/log", method="GET", data={}, headers={"If-None-Match": f'"{etags["/log"]}"'}
+        ):
+            res = Main.get(mock_self)
+
+        assert res.status_code == 200
+        assert len( res.get_json() ) == 2
+        assert res.get_etag()[0] != etags["/log"]
+
+class Test_after:
+    def test1(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(4):
+            row = make_sample_row()
+            row["patient"] = f"some patient {i % 2}"
+            test_db.append(row)
+
+        with _app.test_request_context("/log?after=-1", method="GET", data={}):
+            res = Main.get(mock_self)
+
+        assert [row["_seq"] for row in res.get_json()] == [0, 1, 2, 3]
+        assert res.headers["X-Next-After"] == "3"
+        assert not "X-Next-Cursor" in res.headers
+
+        #paged by following X-Next-After
+        after = "0"
+        pages = list()
+        while True:
+            with _app.test_request_context(
+                    f"/log?after={after}&limit=2", method="GET", data={}):
+                res = Main.get(mock_self)
+
+            if len( res.get_json() ) == 0:
+                break
+
+            pages.append( [row["_seq"] for row in res.get_json()] )
+            after = res.headers["X-Next-After"]
+
+        assert pages == [[1, 2], [3]]
+        assert after == "3"
+
+        with _app.test_request_context(
+                "/log?after=0", method="GET", data={"patient": "some patient 0"}):
+            res = Main.get(mock_self)
+
+        assert [row["_seq"] for row in res.get_json()] == [2]
+
+        with _app.test_request_context("/log?after=1&stream=1", method="GET", data={}):
+            res = Main.get(mock_self)
+
+            assert [row["_seq"] for row in res.get_json()] == [2, 3]
+
+        from werkzeug.exceptions import BadRequest
+        for query in ["after=last", "after=-2", "after=0&cursor=abc"]:
+            with _app.test_request_context(f"/log?{query}", method="GET", data={}):
+                with pytest.raises(BadRequest) as excinfo:
+                    Main.get(mock_self)
+
+class Test_changes:
+    def test1(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(3):
+            row = make_sample_row()
+            row["patient"] = f"some patient {i % 2}"
+            test_db.append(row)
+
+        from src.Flask_app import Changes
+        with _app.test_request_context("/log/changes?after=-1", method="GET"):
+            res = Changes.get(mock_self)
+
+        assert [row["_seq"] for row in res.get_json()] == [0, 1, 2]
+        assert res.headers["X-Next-After"] == "2"
+
+        #filtered by field, and limited
+        with _app.test_request_context(
+                "/log/changes?after=-1&limit=1&patient=some patient 0", method="GET"):
+            res = Changes.get(mock_self)
+
+        assert [row["_seq"] for row in res.get_json()] == [0]
+        assert res.headers["X-Next-After"] == "0"
+
+        with _app.test_request_context(
+                "/log/changes?after=0&patient=some patient 0", method="GET"):
+            res = Changes.get(mock_self)
+
+        assert [row["_seq"] for row in res.get_json()] == [2]
+
+        from werkzeug.exceptions import BadRequest
+        for query in ["after=first", "timeout=0", "limit=0"]:
+            with _app.test_request_context(f"/log/changes?{query}", method="GET"):
+                with pytest.raises(BadRequest) as excinfo:
+                    Changes.get(mock_self)
+
+    def test2(self, monkeypatch, setup_flask_app):
+        import threading
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        test_db.append( make_sample_row() )
+
+        #without rows to respond with, the poll times out empty
+        from src.Flask_app import Changes
+        with _app.test_request_context("/log/changes?timeout=1", method="GET"):
+            res = Changes.get(mock_self)
+
+        assert res.get_json() == []
+        assert res.headers["X-Next-After"] == "0"
+
+        #a poll is held until rows are appended
+        timer = threading.Timer(0.2, lambda: test_db.append( make_sample_row() ))
+        timer.start()
+
+        with _app.test_request_context("/log/changes?after=0&timeout=10", method="GET"):
+            res = Changes.get(mock_self)
+
+        assert [row["_seq"] for row in res.get_json()] == [1]
+        assert res.headers["X-Next-After"] == "1"
+
+        timer.join()
+
+    def test3(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(3):
+            row = make_sample_row()
+            row["patient"] = f"some patient {i % 2}"
+            test_db.append(row)
+
+        import json
+        from src.Flask_app import Changes
+        headers = {"Accept": "text/event-stream", "Last-Event-ID": "0"}
+        with _app.test_request_context(
+                "/log/changes?patient=some patient 0", method="GET", headers=headers):
+            res = Changes.get(mock_self)
+
+            assert res.mimetype == "text/event-stream"
+            events = iter(res.response)
+            event = next(events)
+
+            #events follow as rows are appended
+            row = make_sample_row()
+            row["patient"] = "some patient 0"
+            test_db.append(row)
+            next_event = next(events)
+
+            events.close()
+
+        assert event.startswith(b"id: 2\nevent: row\ndata: ")
+        assert json.loads( event.split(b"data: ")[1] )["_seq"] == 2
+        assert next_event.startswith(b"id: 3\n")
+
+class Test_timeline:
+    def test1(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(5):
+            row = make_sample_row()
+            row["patient"] = f"some patient {i % 2}"
+            test_db.append(row)
+
+        from src.Flask_app import Timeline
+        with _app.test_request_context(
+            "/patients/some patient 0/timeline?limit=2", method="GET"
+        ):
+            res1 = Timeline.get(mock_self, "some patient 0")
+
+        assert [row["_seq"] for row in res1.get_json()] == [0, 2]
+
+        _cursor = res1.headers["X-Next-Cursor"]
+        with _app.test_request_context(
+            f"/patients/some patient 0/timeline?cursor={_cursor}", method="GET"
+        ):
+            res2 = Timeline.get(mock_self, "some patient 0")
+
+        assert [row["_seq"] for row in res2.get_json()] == [4]
+
+    def test2(self, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        from src.Flask_app import Timeline
+        with _app.test_request_context(
+            "/patients/some patient/timeline", method="GET"
+        ):
+            from werkzeug.exceptions import Unauthorized
+            with pytest.raises(Unauthorized) as excinfo:
+                Timeline.get(mock_self, "some patient")
+
+class Test_transmission:
+    def test1(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for source, patient in [("a", "b"), ("b", "c"), ("x", "y")]:
+            row = make_sample_row()
+            row["patient"] = patient
+            row["infected_by"] = source
+            test_db.append(row)
+
+        from src.Flask_app import Chain, Cluster, Clusters
+        with _app.test_request_context("/patients/c/chain", method="GET"):
+            assert Chain.get(mock_self, "c") == ["a", "b", "c"]
+
+        with _app.test_request_context("/patients/a/cluster?depth=1", method="GET"):
+            res = Cluster.get(mock_self, "a")
+
+        assert res["size"] == 2
+        assert res["infected"][1] == {"patient": "b", "infected_by": "a", "depth": 1}
+
+        with _app.test_request_context("/clusters?limit=1", method="GET"):
+            assert Clusters.get(mock_self) == [{"index_case": "a", "size": 3}]
+
+        with _app.test_request_context("/patients/a/cluster?depth=0", method="GET"):
+            from werkzeug.exceptions import BadRequest
+            with pytest.raises(BadRequest) as excinfo:
+                Cluster.get(mock_self, "a")
+
+class Test_stats:
+    def test1(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(3):
+            row = make_sample_row()
+            row["event_type"] = f"some event {i % 2}"
+            test_db.append(row)
+
+        from src.Flask_app import Stats
+        with _app.test_request_context("/stats", method="GET"):
+            res = Stats.get(mock_self)
+
+        assert res["total"] == 3
+        assert res["event_type"] == {"some event 0": 2, "some event 1": 1}
+        assert sum( res["daily"].values() ) == 3
+
+        with _app.test_request_context("/stats?by=location", method="GET"):
+            res = Stats.get(mock_self)
+
+        assert res == {"some value": 3}
+
+        with _app.test_request_context("/stats?by=_user", method="GET"):
+            from werkzeug.exceptions import BadRequest
+            with pytest.raises(BadRequest) as excinfo:
+                Stats.get(mock_self)
+
+class Test_epicurve:
+    def test1(self, monkeypatch, setup_flask_app):
+        pytest.importorskip("numpy")
+
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        for i in range(3):
+            row = make_sample_row()
+            row["event_type"] = "patient_infected"
+            row["location"] = f"location {i % 2}"
+            test_db.append(row)
+
+        from src.Flask_app import Epicurve
+        with _app.test_request_context("/analytics/epicurve?window=1", method="GET"):
+            res = Epicurve.get(mock_self)
+
+        assert len(res["days"]) == 1
+        assert res["locations"]["location 0"]["incidence"] == [2]
+        assert res["locations"]["location 1"] == {
+            "incidence": [1], "growth_rate": [None], "doubling_time": [None]
+            }
+
+        with _app.test_request_context(
+                "/analytics/epicurve?location=location 1&since=2000-01-01T00:00:00&until=2000-01-03T00:00:00",
+                method="GET"):
+            res = Epicurve.get(mock_self)
+
+        assert res["days"] == ["2000-01-01", "2000-01-02"]
+        assert res["locations"] == {
+            "location 1": {
+                "incidence": [0, 0],
+                "growth_rate": [None, None],
+                "doubling_time": [None, None],
+            }}
+
+        with _app.test_request_context(
+                "/analytics/epicurve?event_type=unknown&until=2026-10-18T00:00:00",
+                method="GET"):
+            res = Epicurve.get(mock_self)
+
+        assert res["days"] == []
+
+        from werkzeug.exceptions import BadRequest
+        for query in ["window=0", "since=yesterday", "time_field=date_time",
+                "since=0001-01-01T00:00:00"]:
+            with _app.test_request_context(f"/analytics/epicurve?{query}", method="GET"):
+                with pytest.raises(BadRequest) as excinfo:
+                    Epicurve.get(mock_self)
+
+    def test2(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        def mock_epicurve(**kwargs):
+            raise ImportError("No module named 'numpy'")
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+        monkeypatch.setattr(test_db, "epicurve", mock_epicurve)
+
+        from src.Flask_app import Epicurve
+        with _app.test_request_context("/analytics/epicurve", method="GET"):
+            from werkzeug.exceptions import NotImplemented
+            with pytest.raises(NotImplemented) as excinfo:
+                Epicurve.get(mock_self)
+
+class Test_token:
+    def test1(self, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        import base64
+        test_db.add_user("test", "test")
+        basic = "Basic " + base64.b64encode(b"test:test").decode("ascii")
+
+        from src.Flask_app import Token
+        with _app.test_request_context(
+                "/token", method="POST", headers={"Authorization": basic}):
+            res = Token.post(mock_self)
+
+        assert res["token_type"] == "Bearer"
+        assert res["expires_in"] > 0
+        bearer = {"Authorization": f"Bearer {res['token']}"}
+
+        #the token is accepted in place of credentials
+        with _app.test_request_context(
+                "/log", method="POST", data=make_sample_row(), headers=bearer):
+            Main.post(mock_self)
+
+        with _app.test_request_context("/log", method="GET", headers=bearer):
+            res = Main.get(mock_self)
+
+        assert len(res.get_json()) == 1
+        assert res.get_json()[0]["_user"] == "test"
+
+        #tokens are not exchanged for fresh tokens
+        from werkzeug.exceptions import Unauthorized
+        with _app.test_request_context("/token", method="POST", headers=bearer):
+            with pytest.raises(Unauthorized) as excinfo:
+                Token.post(mock_self)
+
+        with _app.test_request_context("/token", method="DELETE", headers=bearer):
+            res = Token.delete(mock_self)
+
+        assert res == ("", 204)
+
+        with _app.test_request_context("/log", method="GET", headers=bearer):
+            with pytest.raises(Unauthorized) as excinfo:
+                Main.get(mock_self)
+
+        assert "Revoked" in str(excinfo.value)
+
+    def test2(self, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        import base64
+        test_db.add_user("test", "test")
+        basic = "Basic " + base64.b64encode(b"test:bad").decode("ascii")
+
+        from src.Flask_app import Token
+        from werkzeug.exceptions import Unauthorized
+        for method, headers in [
+                ("POST", {"Authorization": basic}),
+                ("POST", {}),
+                ("DELETE", {}),
+                ("DELETE", {"Authorization": "Bearer forged.token"}),
+                ]:
+            with _app.test_request_context("/token", method=method, headers=headers):
+                with pytest.raises(Unauthorized) as excinfo:
+                    getattr(Token, method.lower())(mock_self)
+
+class Test_compress_response:
+    def test1(self, setup_flask_app, monkeypatch):
+        import gzip
+        from flask import Response
+        from src.Flask_app import _compress_response
+
+        body = b'[' + b','.join([b'{"location": "some value"}'] * 100) + b']'
+
+        #sent as is, unless the client accepts a compressed response
+        with _app.test_request_context("/log", method="GET"):
+            res = _compress_response( Response(body) )
+
+        assert res.get_data() == body
+        assert not "Content-Encoding" in res.headers
+        assert "Accept-Encoding" in res.vary
+
+        headers = {"Accept-Encoding": "gzip"}
+        with _app.test_request_context("/log", method="GET", headers=headers):
+            res = _compress_response( Response(body) )
+
+            #small responses are sent as is
+            small = _compress_response( Response(b"[]") )
+
+        assert res.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress( res.get_data() ) == body
+        assert not "Content-Encoding" in small.headers
+
+    def test2(self, setup_flask_app, monkeypatch):
+        import gzip
+        from flask import Response
+        import src.Compression
+        from src.Flask_app import _compress_response
+
+        body = b'[' + b','.join([b'{"location": "some value"}'] * 100) + b']'
+
+        def make_response():
+            response = Response(body)
+            response.set_etag("1-abc")
+            return response
+
+        headers = {"Accept-Encoding": "gzip"}
+        with _app.test_request_context("/log", method="GET", headers=headers):
+            first = _compress_response( make_response() )
+
+            #responses with the same tag are only compressed once
+            def fail(data, encoding):
+                raise AssertionError("the response should not be compressed again")
+            monkeypatch.setattr(src.Compression, "compress", fail)
+
+            second = _compress_response( make_response() )
+
+        assert first.get_data() == second.get_data()
+        assert gzip.decompress( second.get_data() ) == body
+        assert second.get_etag() == ("1-abc", True)
+
+    def test3(self, setup_flask_app):
+        import gzip
+        from flask import Response
+        from src.Flask_app import _compress_response
+
+        def generate():
+            yield b"["
+            for i in range(1000):
+                yield b'{"_seq": %d},' % i
+            yield b"{}]"
+
+        headers = {"Accept-Encoding": "gzip"}
+        with _app.test_request_context("/log", method="GET", headers=headers):
+            res = _compress_response( Response(generate()) )
+
+            assert res.is_streamed
+            assert res.headers["Content-Encoding"] == "gzip"
+            data = gzip.decompress( res.get_data() )
+
+        assert data.startswith(b'[{"_seq": 0},') and data.endswith(b"{}]")
+
+class Test_create_app:
+    def test_1(self, setup_database):
+        from src.Flask_app import create_app
+
+        res = create_app(test_db)
+
+        assert res.extensions["database"] is test_db
+        assert not res.extensions["authorization_handler"] is None
+
+        teardown_database()
+
+    def test_2(self, tmp_path):
+        from src.Database import Database
+        from src.Flask_app import create_app
+
+        #each application is bound to its own Database
+        (tmp_path / "1").mkdir()
+        (tmp_path / "2").mkdir()
+        db1 = Database(tmp_path / "1")
+        db2 = Database(tmp_path / "2")
+        app1 = create_app(db1)
+        app2 = create_app(db2)
+
+        assert not app1 is app2
+        assert app1.extensions["database"] is db1
+        assert app2.extensions["database"] is db2
+        assert not app1.extensions["authorization_handler"] is \
+            app2.extensions["authorization_handler"]
+
+        db1.add_user("user", "pass")
+        import base64
+        auth = base64.b64encode(b"user:pass").decode()
+        res = app1.test_client().post(
+            "/log", json=make_sample_row(),
+            headers={"Authorization": "Basic " + auth}
+            )
+
+        assert res.status_code == 200
+        assert len(db1.search({})) == 1
+        assert len(db2.search({})) == 0
+
+class Test_run:
+    def test_1(self, setup_database):
+        from src.Flask_app import run
+        with patch("flask.Flask.run") as mock_run:
+            run(test_db)
+
+        mock_run.assert_called_once_with(debug=False)
+
+        teardown_database()
+
+from src.Flask_app import Bulk
+
+class Test_bulk_post:
+    def test_no_password(self, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        with _app.test_request_context(
+            "/log/bulk", method="POST", data="", content_type="text/csv"
+        ):
+            from werkzeug.exceptions import Unauthorized
+            with pytest.raises(Unauthorized) as excinfo:
+                Bulk.post(mock_self)
+
+    def test_bad_content_type(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        with _app.test_request_context(
+            "/log/bulk", method="POST", data="", content_type="text/plain"
+        ):
+            from werkzeug.exceptions import UnsupportedMediaType
+            with pytest.raises(UnsupportedMediaType) as excinfo:
+                Bulk.post(mock_self)
+
+    def test_ndjson(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        import json
+        nested = make_sample_row()
+        nested["notes"] = {"x": 1}
+        body = "\n".join([
+            json.dumps( make_sample_row() ),
+            "some bad json",
+            "",
+            json.dumps({"data": "some stored data"}),
+            json.dumps( make_sample_row() ),
+            json.dumps(nested),
+        ])
+
+        with _app.test_request_context(
+            "/log/bulk", method="POST", data=body,
+            content_type="application/x-ndjson"
+        ):
+            from flask import request
+            request.authorization = {'username' : "test", 'password' : "test"}
+
+            res = Bulk.post(mock_self)
+
+        assert res["appended"] == 2
+        assert [e["row"] for e in res["errors"]] == [1, 2, 4]
+
+        stored = test_db.__repr__()
+        assert len(stored) == 2
+        assert all( row["_user"] == "test" for row in stored )
+
+    def test_csv(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
+
+        body = "\n".join([
+            "doctor,patient,event_type,location,notes",
+            "some doctor,some patient,new_patient,some location,",
+            "some doctor,,new_patient,some location,some notes",
+            "some doctor,some patient,treatment,some location,some notes",
+        ])
+
+        with _app.test_request_context(
+            "/log/bulk", method="POST", data=body, content_type="text/csv"
+        ):
+            from flask import request
+            request.authorization = {'username' : "test", 'password' : "test"}
+
+            res = Bulk.post(mock_self)
+
+        assert res["appended"] == 2
+        assert [e["row"] for e in res["errors"]] == [1]
+
+        stored = test_db.__repr__()
+        assert stored[0]["notes"] is None
+        assert stored[1]["notes"] == "some notes"
+
+    def test_malformed_body(self, monkeypatch, setup_flask_app):
+        from unittest.mock import MagicMock
+        mock_self = MagicMock()
+
+        def mock_is_authorized(self, request_authorization):
+            return True
+
+        from src.Authorization_Handler import Authorization_Handler
+        monkeypatch.setattr(
+            Authorization_Handler, "is_authorized", mock_is_authorized
+            )
 
-        teardown_database()
\ No newline at end of file
+        import csv
+        oversized = "notes\n" + "x" * (csv.field_size_limit() + 1) + "\n"
+
+        from werkzeug.exceptions import BadRequest
+        for body, content_type in [
+                (b"\xff\xfe", "text/csv"),
+                (b"\xff\xfe", "application/x-ndjson"),
+                (oversized.encode(), "text/csv"),
+                ]:
+            with _app.test_request_context(
+                "/log/bulk", method="POST", data=body, content_type=content_type
+            ):
+                with pytest.raises(BadRequest) as excinfo:
+                    Bulk.post(mock_self)
+
+        assert len( test_db.__repr__() ) == 0
@@ -0,0 +1,374 @@
+import pytest
+
+from src.Segmented_Log import Segmented_Log
+
+test_log = None
+
+@pytest.fixture
+def setup_log(tmp_path):
+    global test_log
+    test_log = Segmented_Log(tmp_path / "log")
+
+    yield
+
+    test_log.close()
+    test_log = None
+
+def make_sample_row(i=0):
+    from datetime import datetime
+    return {"data": f"some value {i}", "_timestamp": datetime.now(tz=None)}
+
+class Test__init__:
+    def test1(self, setup_log, tmp_path):
+        assert not (tmp_path / "log").exists()
+        assert len(test_log.segments()) == 0
+
+class Test_append:
+    def test1(self, setup_log, tmp_path):
+        seq = test_log.append( make_sample_row() )
+
+        assert seq == 0
+        assert len(test_log) == 1
+        assert len(test_log.segments()) == 1
+
+    def test2(self, setup_log):
+        seqs = [test_log.append( make_sample_row(i) ) for i in range(3)]
+
+        assert seqs == [0, 1, 2]
+
+    def test3(self, tmp_path):
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+
+        for i in range(5):
+            log.append( make_sample_row(i) )
+
+        segments = log.segments()
+        log.close()
+
+        assert len(segments) > 1
+        assert segments[-1].name != segments[0].name
+
+class Test_replay:
+    def test1(self, setup_log):
+        assert list(test_log.replay()) == []
+
+    def test2(self, setup_log, tmp_path):
+        rows = [make_sample_row(i) for i in range(3)]
+        for row in rows:
+            test_log.append(row)
+        test_log.close()
+
+        res = list( Segmented_Log(tmp_path / "log").replay() )
+
+        assert res == rows
+
+    def test3(self, tmp_path):
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        rows = [make_sample_row(i) for i in range(5)]
+        for row in rows:
+            log.append(row)
+        log.close()
+
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+
+        assert list(log.replay()) == rows
+        assert len(log) == 5
+
+    def test4(self, setup_log, tmp_path):
+        #a torn record at the end of the log is discarded
+        test_log.append( make_sample_row(0) )
+        test_log.append( make_sample_row(1) )
+        test_log.close()
+
+        segment = test_log.segments()[-1]
+        with open(segment, "r+b") as f:
+            f.truncate(segment.stat().st_size - 3)
+
+        log = Segmented_Log(tmp_path / "log")
+        res = list(log.replay())
+
+        assert len(res) == 1
+
+        #new records follow on from the last good record
+        log.append( make_sample_row(2) )
+        log.close()
+
+        assert len( list(Segmented_Log(tmp_path / "log").replay()) ) == 2
+
+    def test5(self, tmp_path):
+        #a corrupt record before the newest segment raises
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        for i in range(5):
+            log.append( make_sample_row(i) )
+        log.close()
+
+        segment = log.segments()[0]
+        data = bytearray(segment.read_bytes())
+        data[-1] ^= 0xFF
+        segment.write_bytes(bytes(data))
+
+        from src.Segmented_Log import Corrupt_Segment
+        with pytest.raises(Corrupt_Segment) as excinfo:
+            list( Segmented_Log(tmp_path / "log").replay() )
+
+class Test_failed_write:
+    def fail_next_write(self, log):
+        #write half of the next record, then fail as if the disk were full
+        import errno
+
+        class Failing_File:
+            def __init__(self, f):
+                self._f = f
+
+            def __getattr__(self, name):
+                return getattr(self._f, name)
+
+            def write(self, data):
+                self._f.write( data[:len(data) // 2] )
+                self._f.flush()
+                raise OSError(errno.ENOSPC, "No space left on device")
+
+        log._open_active()
+        log._active = Failing_File(log._active)
+
+    def test1(self, setup_log, tmp_path):
+        rows = [make_sample_row(i) for i in range(4)]
+        test_log.append( rows[0] )
+
+        self.fail_next_write(test_log)
+        with pytest.raises(OSError) as excinfo:
+            test_log.append( make_sample_row(-1) )
+
+        for row in rows[1:]:
+            test_log.append(row)
+        test_log.close()
+
+        #the torn record is gone, and the records after it are kept
+        log = Segmented_Log(tmp_path / "log")
+
+        assert list(log.replay()) == rows
+        assert len(log) == 4
+        log.close()
+
+    def test2(self, tmp_path):
+        #records after the failed write run into later segments
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        rows = [make_sample_row(i) for i in range(5)]
+
+        self.fail_next_write(log)
+        with pytest.raises(OSError) as excinfo:
+            log.append( make_sample_row(-1) )
+
+        for row in rows:
+            log.append(row)
+        log.close()
+
+        assert len(log.segments()) > 1
+
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+
+        assert list(log.replay()) == rows
+        log.close()
+
+class Test_encode_row:
+    def test1(self):
+        from src.Segmented_Log import encode_row, decode_row
+        row = make_sample_row()
+        row["date_time"] = "last Friday"
+        row["notes"] = None
+
+        assert decode_row( encode_row(row) ) == row
+
+class Test_extend:
+    def test1(self, setup_log, tmp_path):
+        test_log.append( make_sample_row(0) )
+        rows = [make_sample_row(i) for i in range(1, 4)]
+
+        seqs = test_log.extend(rows)
+        test_log.close()
+
+        assert seqs == [1, 2, 3]
+        assert list( Segmented_Log(tmp_path / "log").replay() )[1:] == rows
+
+    def test2(self, setup_log):
+        assert test_log.extend([]) == []
+        assert len(test_log.segments()) == 0
+
+class Test_read_new:
+    def test1(self, setup_log, tmp_path):
+        assert test_log.read_new() == []
+
+        #another process appending to the same log
+        other_log = Segmented_Log(tmp_path / "log")
+        rows = [make_sample_row(i) for i in range(2)]
+        other_log.extend(rows)
+
+        assert test_log.has_new()
+        assert test_log.read_new() == rows
+        assert not test_log.has_new()
+        assert len(test_log) == 2
+
+        other_log.close()
+
+    def test2(self, setup_log, tmp_path):
+        #rows appended having read all prior rows are not read again
+        test_log.append( make_sample_row(0) )
+
+        assert test_log.read_new() == []
+
+    def test3(self, tmp_path):
+        log1 = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        log2 = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+
+        rows = [make_sample_row(i) for i in range(4)]
+        for i, row in enumerate(rows):
+            log = [log1, log2][i % 2]
+            with log.lock():
+                log.read_new()
+                log.append(row)
+
+        #both logs see every row, across segments
+        assert len(log1.segments()) > 1
+        assert list( Segmented_Log(tmp_path / "log").replay() ) == rows
+        assert log1.read_new() == [rows[3]]
+        assert len(log1) == len(log2) == 4
+
+        log1.close()
+        log2.close()
+
+    def test4(self, setup_log, tmp_path):
+        #a record still being written is left to be read later
+        other_log = Segmented_Log(tmp_path / "log")
+        other_log.append( make_sample_row(0) )
+        other_log.close()
+
+        segment = other_log.segments()[-1]
+        data = segment.read_bytes()
+        with open(segment, "ab") as f:
+            f.write(data[:5])
+
+        assert len( test_log.read_new() ) == 1
+
+        with open(segment, "ab") as f:
+            f.write(data[5:])
+
+        assert len( test_log.read_new() ) == 1
+
+    def test5(self, setup_log, tmp_path):
+        #a torn record read holding the lock was left by a dead process, so
+        #is truncated away
+        other_log = Segmented_Log(tmp_path / "log")
+        other_log.append( make_sample_row(0) )
+        other_log.close()
+
+        segment = other_log.segments()[-1]
+        data = segment.read_bytes()
+        with open(segment, "ab") as f:
+            f.write(data[:5])
+
+        with test_log.lock():
+            assert len( test_log.read_new() ) == 1
+            test_log.append( make_sample_row(1) )
+        test_log.close()
+
+        assert len( list(Segmented_Log(tmp_path / "log").replay()) ) == 2
+
+class Test_roll_over:
+    def test1(self, setup_log):
+        test_log.roll_over()
+
+        assert len(test_log.segments()) == 0
+
+    def test2(self, setup_log):
+        test_log.append( make_sample_row(0) )
+        test_log.roll_over()
+        test_log.roll_over() #the new segment is empty
+        test_log.append( make_sample_row(1) )
+
+        assert [s.name for s in test_log.segments()] == [
+            "00000000000000000000.seg", "00000000000000000001.seg"
+            ]
+
+    def test3(self, setup_log, tmp_path, monkeypatch):
+        #the entries of new segments are forced to disk
+        import src.Snapshot
+        synced = list()
+        monkeypatch.setattr(src.Snapshot, "_sync_directory", synced.append)
+
+        test_log.append( make_sample_row(0) )
+
+        assert synced == [tmp_path / "log", tmp_path]
+
+        test_log.append( make_sample_row(1) )
+        test_log.roll_over()
+
+        assert synced == [tmp_path / "log", tmp_path, tmp_path / "log"]
+
+class Test_truncate:
+    def test1(self, tmp_path):
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        rows = [make_sample_row(i) for i in range(5)]
+        for row in rows:
+            log.append(row)
+        log.close()
+
+        #segments are removed only if they hold no rows from `before_seq` on
+        removed = log.truncate(3)
+        segments = log.segments()
+
+        assert removed == 3
+        assert segments[0].name == "00000000000000000003.seg"
+
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        assert list( log.replay(3) ) == rows[3:]
+        assert len(log) == 5
+
+    def test2(self, tmp_path):
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        for i in range(5):
+            log.append( make_sample_row(i) )
+        log.truncate(5)
+
+        #the newest segment is never removed
+        assert len(log.segments()) == 1
+        log.close()
+
+class Test_replay_from:
+    def test1(self, setup_log, tmp_path):
+        rows = [make_sample_row(i) for i in range(4)]
+        test_log.extend(rows)
+        test_log.close()
+
+        #rows before `from_seq` within a segment are skipped
+        log = Segmented_Log(tmp_path / "log")
+
+        assert list( log.replay(2) ) == rows[2:]
+        assert len(log) == 4
+
+    def test2(self, tmp_path):
+        log = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        for i in range(5):
+            log.append( make_sample_row(i) )
+        log.truncate(3)
+        log.close()
+
+        from src.Segmented_Log import Missing_Records
+        with pytest.raises(Missing_Records) as excinfo:
+            list( Segmented_Log(tmp_path / "log").replay() )
+
+    def test3(self, tmp_path):
+        log1 = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        log2 = Segmented_Log(tmp_path / "log", max_segment_bytes=100)
+        log2.append( make_sample_row(0) )
+
+        #rows removed before another log has read them
+        for i in range(1, 5):
+            log1.append( make_sample_row(i) )
+        log1.truncate(4)
+
+        from src.Segmented_Log import Missing_Records
+        with pytest.raises(Missing_Records) as excinfo:
+            log2.read_new()
+
+        log1.close()
+        log2.close()
@@ -0,0 +1,66 @@
+import pytest
+
+from src.Snapshot import write_snapshot, read_snapshot, latest_snapshot
+from src.Snapshot import remove_snapshots, Corrupt_Snapshot
+
+class Test_write_snapshot:
+    def test1(self, tmp_path):
+        state = {"_rows": [{"data": "some value"}], "_indexes": {"k": [0]}}
+
+        path = write_snapshot(tmp_path, 1, state)
+
+        assert path.name == "00000000000000000001.snap"
+        assert read_snapshot(path) == state
+        assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+class Test_read_snapshot:
+    def test1(self, tmp_path):
+        path = write_snapshot(tmp_path, 1, {"_rows": ["some value"]})
+
+        data = bytearray( path.read_bytes() )
+        data[-1] ^= 0xFF
+        path.write_bytes( bytes(data) )
+
+        with pytest.raises(Corrupt_Snapshot) as excinfo:
+            read_snapshot(path)
+
+    def test2(self, tmp_path):
+        path = tmp_path / "00000000000000000001.snap"
+        path.write_bytes(b"some bad data")
+
+        with pytest.raises(Corrupt_Snapshot) as excinfo:
+            read_snapshot(path)
+
+class Test_latest_snapshot:
+    def test1(self, tmp_path):
+        assert latest_snapshot(tmp_path) is None
+        assert latest_snapshot(tmp_path / "some missing directory") is None
+
+    def test2(self, tmp_path):
+        for seq in [3, 12, 7]:
+            write_snapshot(tmp_path, seq, seq)
+
+        seq, path = latest_snapshot(tmp_path)
+
+        assert seq == 12
+        assert read_snapshot(path) == 12
+
+        remove_snapshots(tmp_path, 12)
+
+        assert len( list(tmp_path.iterdir()) ) == 1
+
+class Test_Compactor:
+    def test1(self):
+        import threading
+        from src.Snapshot import Compactor
+
+        called = threading.Event()
+        def compact():
+            called.set()
+            raise OSError("some error") #printed, not raised
+
+        compactor = Compactor(compact, 0.01)
+        compactor.start()
+
+        assert called.wait(5)
+        compactor.stop()
@@ -0,0 +1,48 @@
+import pytest
+
+from src.Stats import Stats
+
+def make_sample_row(event_type, location, hour):
+    from datetime import datetime
+    return {
+        "event_type": event_type,
+        "location": location,
+        "_timestamp": datetime(2022, 5, 1 + (hour // 24), hour % 24, 30),
+    }
+
+class Test_add:
+    def test1(self):
+        stats = Stats()
+
+        assert len(stats) == 0
+        assert stats.counts("event_type") == {}
+
+    def test2(self):
+        stats = Stats()
+        stats.add( make_sample_row("new_patient", "Springfield", 0) )
+        stats.add( make_sample_row("new_patient", "Shelbyville", 0) )
+        stats.add( make_sample_row("treatment", "Springfield", 25) )
+
+        from datetime import datetime
+        assert len(stats) == 3
+        assert stats.counts("event_type") == {"new_patient": 2, "treatment": 1}
+        assert stats.counts("location") == {"Springfield": 2, "Shelbyville": 1}
+        assert stats.counts("daily") == {
+            datetime(2022, 5, 1): 2, datetime(2022, 5, 2): 1
+            }
+        assert stats.counts("hourly")[datetime(2022, 5, 2, 1)] == 1
+
+class Test_to_JSON_safe:
+    def test1(self):
+        stats = Stats()
+        stats.add( make_sample_row("treatment", "Springfield", 25) )
+        stats.add( make_sample_row("new_patient", "Springfield", 0) )
+
+        res = stats.to_JSON_safe()
+
+        assert res["total"] == 2
+        assert list(res["daily"]) == ["2022-05-01T00:00:00", "2022-05-02T00:00:00"]
+        assert res["hourly"]["2022-05-02T01:00:00"] == 1
+
+        import json
+        json.dumps(res)
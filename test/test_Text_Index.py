@@ -0,0 +1,80 @@
+import pytest
+
+from src.Text_Index import Text_Index, Text_Query, Bad_Text_Query
+
+def make_index(notes):
+    index = Text_Index(exclude=["patient"])
+    rows = list()
+    for i, note in enumerate(notes):
+        row = {"patient": "some patient", "notes": note, "_seq": i}
+        index.add(row)
+        rows.append(row)
+    return index, rows
+
+class Test_tokenize:
+    def test1(self):
+        from src.Text_Index import tokenize
+        from markupsafe import escape
+
+        assert tokenize("Tried the Tango, patient responded!") == \
+            ["tried", "the", "tango", "patient", "responded"]
+        assert tokenize( escape("don't <stop>") ) == ["don", "t", "stop"]
+
+class Test_add:
+    def test1(self):
+        index, _ = make_index(["tango tango", None, "waltz and tango"])
+
+        assert list( index.postings("notes", "tango") ) == [0, 2]
+        assert list( index.postings("notes", "foxtrot") ) == []
+        assert index.fields() == ["notes"]
+
+class Test_Text_Query:
+    def test1(self):
+        for text in ["", "AND OR", '""']:
+            with pytest.raises(Bad_Text_Query) as excinfo:
+                Text_Query(text)
+
+    def test2(self):
+        query = Text_Query('tango AND Waltz OR "moon walk" fever')
+
+        assert query.clauses == [[("tango",), ("waltz",)], [("moon", "walk"), ("fever",)]]
+        assert query.has_phrases
+
+class Test_candidates:
+    notes = [
+        "tried the tango, no response",
+        "tried the waltz",
+        "tango then waltz, recovered",
+        "moon walk, walk on the moon",
+        "walk the moon",
+    ]
+
+    def search(self, text):
+        index, rows = make_index(self.notes)
+        query = Text_Query(text)
+
+        candidates = query.candidates(index, "notes")
+        return [seq for seq in candidates if query.matches(rows[seq], "notes")]
+
+    def test1(self):
+        assert self.search("tango") == [0, 2]
+        assert self.search("tango waltz") == [2]
+        assert self.search("tango AND waltz") == [2]
+        assert self.search("tango OR waltz") == [0, 1, 2]
+        assert self.search("foxtrot") == []
+        assert self.search("foxtrot OR recovered") == [2]
+
+    def test2(self):
+        index, _ = make_index(self.notes)
+
+        #words of a phrase out of order are candidates, but don't match
+        assert Text_Query('"moon walk"').candidates(index, "notes") == [3, 4]
+        assert self.search('"moon walk"') == [3]
+        assert self.search('"walk the moon" OR "the tango"') == [0, 4]
+
+class Test_intersect:
+    def test1(self):
+        from src.Text_Index import _intersect
+
+        assert _intersect([[1, 3, 5, 7], [3, 4, 5], [0, 5, 9]]) == [5]
+        assert _intersect([[1, 2], []]) == []
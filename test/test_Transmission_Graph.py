@@ -0,0 +1,52 @@
+import pytest
+
+from src.Transmission_Graph import Transmission_Graph
+
+def make_graph(infections):
+    graph = Transmission_Graph()
+    for source, patient in infections:
+        graph.add({"patient": patient, "infected_by": source})
+    return graph
+
+class Test_add:
+    def test1(self):
+        graph = Transmission_Graph()
+        graph.add({"patient": "a"})
+
+        assert not "a" in graph
+        assert graph.largest_clusters(10) == []
+
+    def test2(self):
+        graph = make_graph([("a", "b"), ("a", "b")])
+
+        assert graph.cluster("a") == [("a", None, 0), ("b", "a", 1)]
+
+class Test_chain:
+    def test1(self):
+        graph = make_graph([("a", "b"), ("b", "c"), ("c", "d"), ("x", "y")])
+
+        assert graph.chain("d") == ["a", "b", "c", "d"]
+        assert graph.chain("a") == ["a"]
+
+    def test2(self):
+        #a cycle of recorded infections
+        graph = make_graph([("a", "b"), ("b", "a")])
+
+        assert graph.chain("a") == ["b", "a"]
+
+class Test_cluster:
+    def test1(self):
+        graph = make_graph([("a", "b"), ("a", "c"), ("b", "d"), ("d", "e"), ("e", "a")])
+
+        assert graph.cluster("a") == [
+            ("a", None, 0), ("b", "a", 1), ("c", "a", 1), ("d", "b", 2), ("e", "d", 3)
+            ]
+        assert [p for p, _, _ in graph.cluster("a", depth=1)] == ["a", "b", "c"]
+        assert graph.cluster("c") == [("c", None, 0)]
+
+class Test_largest_clusters:
+    def test1(self):
+        graph = make_graph([("x", "y"), ("a", "b"), ("c", "d"), ("b", "c"), ("d", "e")])
+
+        assert graph.largest_clusters(10) == [("a", 5), ("x", 2)]
+        assert graph.largest_clusters(1) == [("a", 5)]
@@ -178,4 +178,57 @@ class Test_standardize2:
         res = test_v.standardize(sample_row)
 
         assert "date_time" in list( res.keys() )
-        assert "notes" in list( res.keys() )
\ No newline at end of file
+        assert "notes" in list( res.keys() )
+
+class Test_compile_schema:
+    def test1(self, init):
+        from src.Validation_and_Standardization_Handler import compile_schema
+        compiled = compile_schema(test_v)
+
+        from src.Validation_and_Standardization_Handler import Malformed_Input
+        with pytest.raises(Malformed_Input) as excinfo:
+            compiled( {"data": ""} )
+
+        assert test_v._error_msgs["_zero_length_check"] in str(excinfo.value)
+
+        with pytest.raises(Malformed_Input) as excinfo:
+            compiled( {"some bad key": "some bad value"} )
+
+        assert test_v._error_msgs["_required_keys_check"] in str(excinfo.value)
+
+    def test2(self, init):
+        from src.Validation_and_Standardization_Handler import compile_schema
+        compiled = compile_schema(test_v)
+
+        sample_row = {str(k):"some value" for k in test_v._required_keys}
+        res = compiled(sample_row)
+
+        #the row is standardized in place
+        assert res is sample_row
+        assert res.keys() == test_v.standardize( dict(sample_row) ).keys()
+        assert res["notes"] is None
+
+    def test3(self, init):
+        from src.Validation_and_Standardization_Handler import compile_schema
+        compiled = compile_schema(test_v)
+
+        sample_row = {str(k):"some value" for k in test_v._required_keys}
+        sample_row["date_time"] = "last Friday"
+        sample_row["notes"] = "some notes"
+        res = compiled(sample_row)
+
+        assert res["date_time"] == "last Friday"
+        assert res["notes"] == "some notes"
+
+class Test_standardize3:
+    def test1(self, init):
+        from src.Validation_and_Standardization_Handler import standardize
+
+        sample_row = {str(k):"some value" for k in test_v._required_keys}
+
+        res = standardize(sample_row)
+
+        #the module-level entrypoint leaves its input unchanged
+        assert not res is sample_row
+        assert not "_timestamp" in sample_row
+        assert "_timestamp" in res
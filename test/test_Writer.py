@@ -0,0 +1,98 @@
+import pytest
+
+from src.Writer import Writer
+
+class Mock_Storage:
+    def __init__(self):
+        self.commits = list()
+        self.syncs = 0
+
+    def commit(self, rows):
+        self.commits.append( list(rows) )
+        return [dict(row, stored=True) for row in rows]
+
+    def sync(self):
+        self.syncs += 1
+
+class Test__init__:
+    def test1(self):
+        storage = Mock_Storage()
+
+        with pytest.raises(ValueError) as excinfo:
+            Writer(storage.commit, storage.sync, durability="some bad mode")
+
+class Test_submit:
+    def test1(self):
+        storage = Mock_Storage()
+        writer = Writer(storage.commit, storage.sync)
+        writer.start()
+
+        res = writer.submit([{"data": 1}, {"data": 2}])
+        writer.stop()
+
+        assert res == [{"data": 1, "stored": True}, {"data": 2, "stored": True}]
+        assert storage.syncs == 1
+
+    def test2(self):
+        storage = Mock_Storage()
+
+        def failing_commit(rows):
+            raise OSError(28)
+
+        writer = Writer(failing_commit, storage.sync)
+        writer.start()
+
+        with pytest.raises(OSError) as excinfo:
+            writer.submit([{"data": 1}])
+
+        writer.stop()
+
+    def test3(self):
+        #rows submitted together from many threads are committed in groups
+        storage = Mock_Storage()
+        writer = Writer(storage.commit, storage.sync)
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(writer.submit, [{"data": i}]) for i in range(50)]
+
+            #the writer starts once requests are waiting
+            writer.start()
+            res = [future.result() for future in futures]
+
+        writer.stop()
+
+        assert [row[0]["data"] for row in res] == list(range(50))
+        assert len(storage.commits) < 50
+        assert storage.syncs == len(storage.commits)
+
+    def test4(self):
+        storage = Mock_Storage()
+        writer = Writer(storage.commit, storage.sync, durability="request")
+
+        from src.Writer import _Job
+        for i in range(3):
+            writer._queue.put( _Job([{"data": i}]) )
+
+        writer.start()
+        writer.stop()
+
+        #each request is committed on its own
+        assert len(storage.commits) == 3
+        assert storage.syncs == 3
+
+    def test5(self):
+        storage = Mock_Storage()
+        writer = Writer(
+            storage.commit, storage.sync, durability="interval", sync_interval=60
+            )
+        writer.start()
+
+        writer.submit([{"data": 1}])
+
+        #not synced until the timer elapses, or the writer stops
+        assert storage.syncs == 0
+
+        writer.stop()
+
+        assert storage.syncs == 1
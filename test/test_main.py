@@ -46,4 +46,30 @@ class Test_get_db_path:
 
         res = main._get_db_path(mock_args)
 
-        assert res == tmp_path
\ No newline at end of file
+        assert res == tmp_path
+
+class Test_parse_input_serve:
+    from unittest.mock import patch
+    import sys
+    @patch.object(sys, 'argv', ["main.py", "serve", "--workers", "3", "some path"])
+    def test_1(self):
+        res = main._parse_input()
+
+        assert res["serve"]
+        assert res["workers"] == 3
+        assert res["port"] == 5000
+        assert res["database_path"] == "some path"
+
+    @patch.object(sys, 'argv', ["main.py", "some path"])
+    def test_2(self):
+        res = main._parse_input()
+
+        assert not res["serve"]
+        assert res["database_path"] == "some path"
+
+    @patch.object(sys, 'argv', ["main.py", "--compact-interval", "60", "some path"])
+    def test_3(self):
+        res = main._parse_input()
+
+        assert res["compact_interval"] == 60
+        assert res["durability"] == "batch"